@@ -0,0 +1,95 @@
+import hmac
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Request
+from fastapi.responses import FileResponse, PlainTextResponse
+
+from ..config import settings
+
+
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    """Admin routes exist only when ADMIN_TOKEN is set, and need it in X-Admin-Token"""
+    if not settings.ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not x_admin_token or not hmac.compare_digest(x_admin_token, settings.ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Forbidden")
+
+
+router = APIRouter(prefix="/admin", tags=["admin"], dependencies=[Depends(require_admin)])
+
+
+def _capture(request: Request, capture_id: str):
+    capture = request.app.state.profiler.get(capture_id)
+    if capture is None:
+        raise HTTPException(status_code=404, detail="Capture not found")
+    return capture
+
+
+@router.post("/profile")
+async def start_profile(
+    request: Request,
+    mode: str = "sampling",
+    seconds: Optional[float] = None,
+    session_id: Optional[str] = None,
+    turns: int = 1,
+    interval_ms: Optional[float] = None,
+    include_idle: bool = False,
+    wait: bool = False
+):
+    """Profile for `seconds`, or for the next `turns` turns of `session_id`.
+
+    With `wait` the report is returned when the capture ends; otherwise poll
+    /admin/profile/{id}.
+    """
+    profiler = request.app.state.profiler
+    try:
+        capture = await profiler.start(
+            mode=mode,
+            seconds=seconds,
+            session_id=session_id,
+            turns=turns,
+            interval=interval_ms / 1000 if interval_ms else None,
+            include_idle=include_idle
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+    if wait:
+        await capture.done.wait()
+        return capture.report()
+    return {
+        "id": capture.id,
+        "status": capture.status,
+        "report": f"/admin/profile/{capture.id}",
+        "folded": f"/admin/profile/{capture.id}/folded"
+    }
+
+
+@router.delete("/profile")
+async def stop_profile(request: Request):
+    """End the running capture early"""
+    request.app.state.profiler.stop()
+    capture = request.app.state.profiler.current
+    return capture.report() if capture else {"status": "idle"}
+
+
+@router.get("/profile/{capture_id}")
+async def get_profile(request: Request, capture_id: str, top: int = 25):
+    return _capture(request, capture_id).report(top)
+
+
+@router.get("/profile/{capture_id}/folded", response_class=PlainTextResponse)
+async def get_profile_folded(request: Request, capture_id: str):
+    """Collapsed stacks; feed to flamegraph.pl or open in speedscope"""
+    return PlainTextResponse(_capture(request, capture_id).folded())
+
+
+@router.get("/profile/{capture_id}/pstats")
+async def get_profile_pstats(request: Request, capture_id: str):
+    """cProfile dump of a finished deterministic capture (snakeviz, pstats)"""
+    capture = _capture(request, capture_id)
+    if not capture.pstats_path:
+        raise HTTPException(status_code=404, detail="No deterministic profile for this capture")
+    return FileResponse(capture.pstats_path, media_type="application/octet-stream", filename=f"{capture.id}.prof")
@@ -1,38 +1,105 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Request, Response
+from fastapi.responses import FileResponse
+from pydantic import BaseModel, Field
+from typing import List, Optional
 import os
 import uuid
 from ..config import settings
+from ..services.batch_service import callback_url_error
+from ..utils.metrics import metrics
 
 router = APIRouter(prefix="/api", tags=["api"])
 
 @router.get("/avatars")
-async def get_avatars():
-    """List all available avatars"""
-    avatars = []
-    for category in settings.AVATAR_MODELS:
-        category_path = os.path.join(settings.AVATAR_DIR, category)
-        if os.path.exists(category_path):
-            for avatar_name in os.listdir(category_path):
-                avatar_dir = os.path.join(category_path, avatar_name)
-                if os.path.isdir(avatar_dir):
-                    avatars.append({
-                        "id": f"{category}/{avatar_name}",
-                        "name": avatar_name.replace("_", " ").title(),
-                        "category": category,
-                        "thumbnail": f"/avatars/{category}/{avatar_name}/thumbnail.jpg"
-                    })
-    return {"avatars": avatars}
+async def get_avatars(request: Request):
+    """List all available avatars (served from the in-memory catalog)"""
+    catalog = request.app.state.avatar_catalog
+    headers = catalog.headers()
+    if catalog.not_modified(request.headers.get("if-none-match"), request.headers.get("if-modified-since")):
+        return Response(status_code=304, headers=headers)
+    return Response(content=catalog.body, media_type="application/json", headers=headers)
+
+@router.get("/avatars/{category}/{model}/thumbnail/{size}")
+async def get_avatar_thumbnail(request: Request, category: str, model: str, size: int):
+    """Size-bucketed thumbnail; URLs carry a content hash, so they never go stale"""
+    path = request.app.state.avatar_catalog.thumbnail_path(f"{category}/{model}", size)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Thumbnail not found")
+    return FileResponse(
+        path,
+        media_type="image/jpeg",
+        headers={"Cache-Control": f"public, max-age={settings.THUMBNAIL_MAX_AGE}, immutable"}
+    )
 
 @router.post("/sessions/create")
-async def create_session(avatar_id: str):
+async def create_session(request: Request, avatar_id: str):
     """Create a new avatar session"""
     session_id = str(uuid.uuid4())
+    request.app.state.session_store.session_started(session_id, avatar_id=avatar_id)
     return {
         "session_id": session_id,
         "avatar_id": avatar_id,
         "websocket_url": f"ws://{settings.HOST}:{settings.PORT}/ws/{session_id}"
     }
 
-@router.get("/health")
-async def health_check():
-    return {"status": "healthy", "version": settings.APP_VERSION}
\ No newline at end of file
+class BatchItemRequest(BaseModel):
+    text: str = Field(min_length=1)
+    avatar_id: str = settings.DEFAULT_AVATAR
+    voice: Optional[str] = None
+    width: Optional[int] = Field(None, ge=16, le=3840)
+    height: Optional[int] = Field(None, ge=16, le=3840)
+
+class BatchJobRequest(BaseModel):
+    items: List[BatchItemRequest] = Field(min_length=1)
+    callback_url: Optional[str] = None
+
+def _batch(request: Request):
+    batch = getattr(request.app.state, "batch", None)
+    if batch is None or not batch.enabled:
+        raise HTTPException(status_code=503, detail="Batch rendering unavailable")
+    return batch
+
+@router.post("/batch/jobs", status_code=202)
+async def submit_batch_job(request: Request, job: BatchJobRequest):
+    """Queue scripted videos for offline rendering; poll the job or wait for its callback"""
+    batch = _batch(request)
+    if len(job.items) > settings.BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"At most {settings.BATCH_MAX_ITEMS} items per job")
+    if job.callback_url:
+        error = await callback_url_error(job.callback_url)
+        if error:
+            raise HTTPException(status_code=422, detail=error)
+    catalog = request.app.state.avatar_catalog
+    items = []
+    for item in job.items:
+        if item.avatar_id not in catalog:
+            raise HTTPException(status_code=422, detail=f"Unknown avatar '{item.avatar_id}'")
+        if (item.width is None) != (item.height is None):
+            raise HTTPException(status_code=422, detail="Give both width and height, or neither")
+        fields = item.model_dump()
+        if item.width:
+            # H.264 needs even dimensions
+            fields.update(width=item.width - item.width % 2, height=item.height - item.height % 2)
+        items.append(fields)
+    job_id = await batch.submit(items, callback_url=job.callback_url)
+    return {"job_id": job_id, "total": len(items), "status_url": f"/api/batch/jobs/{job_id}"}
+
+@router.get("/batch/jobs/{job_id}")
+async def get_batch_job(request: Request, job_id: str, items: bool = False):
+    """Progress of a batch job; with `items`, each item's status and download URL"""
+    status = await _batch(request).job_status(job_id, include_items=items)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return status
+
+@router.get("/batch/jobs/{job_id}/items/{index}/video")
+async def get_batch_video(request: Request, job_id: str, index: int):
+    path = await _batch(request).video_path(job_id, index)
+    if path is None or not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="Video not ready")
+    return FileResponse(path, media_type="video/mp4", filename=f"{job_id}-{index:05d}.mp4")
+
+@router.get("/metrics")
+async def get_metrics():
+    """Same data as /metrics, summarized as JSON for the dashboard"""
+    return metrics.snapshot()
\ No newline at end of file
@@ -1,10 +1,15 @@
 import asyncio
 import json
+import time
 import uuid
 from fastapi import WebSocket, WebSocketDisconnect
 from loguru import logger
 from typing import Dict, Set
 import base64
+
+from backend.config import settings
+from backend.utils.metrics import ACTIVE_SESSIONS, BYTES_OUT, CACHE_REQUESTS, ERRORS, MESSAGES_OUT, STAGE_SECONDS
+
 class WebSocketManager:
     def __init__(self):
         self.active_connections: Dict[str, WebSocket] = {}
@@ -26,30 +31,58 @@ class WebSocketManager:
     def disconnect(self, client_id: str):
         if client_id in self.active_connections:
             del self.active_connections[client_id]
+        self.sessions.pop(client_id, None)
         logger.info(f"Client {client_id} disconnected")
         
     async def send_message(self, client_id: str, message: dict):
         if client_id in self.active_connections:
-            await self.active_connections[client_id].send_json(message)
+            text = self._encode(message)
+            await self.active_connections[client_id].send_text(text)
             
     async def broadcast(self, message: dict):
+        text = self._encode(message, len(self.active_connections))
         for connection in self.active_connections.values():
-            await connection.send_json(message)
+            await connection.send_text(text)
+
+    @staticmethod
+    def _encode(message: dict, recipients: int = 1) -> str:
+        # Same encoding as send_json; done here so bytes out can be counted
+        text = json.dumps(message, separators=(",", ":"), ensure_ascii=False)
+        MESSAGES_OUT.labels(message.get("type", "unknown")).inc(recipients)
+        size = len(text) if text.isascii() else len(text.encode())
+        BYTES_OUT.labels("websocket").inc(size * recipients)
+        return text
 
 class AvatarWebSocket:
-    def __init__(self, stt_service, tts_service, viseme_service, lipsync_service, render_service):
+    def __init__(self, stt_service, tts_service, viseme_service, lipsync_service, render_service, session_store=None, profiler=None):
         self.manager = WebSocketManager()
+        self.store = session_store
+        self.profiler = profiler
         self.stt = stt_service
         self.tts = tts_service
         self.viseme = viseme_service
         self.lipsync = lipsync_service
         self.render = render_service
+        # Live WebRTC delivery and broadcasts; aiortc is imported on first use
+        self.webrtc = None
+        self.live = None
+        self.broadcasts = None
+        # Fire-and-forget work (TTS warm-ups), referenced until it finishes
+        self._background: Set[asyncio.Task] = set()
+        ACTIVE_SESSIONS.set_function(lambda: len(self.manager.active_connections))
         
+    def _background_done(self, task: asyncio.Task):
+        self._background.discard(task)
+        if not task.cancelled() and task.exception():
+            logger.warning(f"Background task failed: {task.exception()}")
+
     async def handle_connection(self, websocket: WebSocket, client_id: str = None):
         if not client_id:
             client_id = str(uuid.uuid4())
             
         await self.manager.connect(websocket, client_id)
+        if self.store:
+            self.store.session_started(client_id)
         
         try:
           
@@ -70,34 +103,113 @@ class AvatarWebSocket:
                 elif message["type"] == "text":
                     await self.handle_text(client_id, message)
                 elif message["type"] == "llm_response":
-                    await self.handle_llm_response(client_id, message)
+                    # Session-scoped profiling records only while this turn runs
+                    profiled = self.profiler is not None and self.profiler.turn_started(client_id)
+                    try:
+                        await self.handle_llm_response(client_id, message)
+                    finally:
+                        if profiled:
+                            self.profiler.turn_finished(client_id)
+                elif message["type"] == "rtc_offer":
+                    await self.handle_rtc_offer(client_id, message)
+                elif message["type"] == "rtc_ice":
+                    await self.handle_rtc_ice(client_id, message)
+                elif message["type"] == "rtc_close":
+                    await self.close_live(client_id)
+                elif message["type"] == "rtc_stats":
+                    await self.handle_rtc_stats(client_id)
+                elif message["type"].startswith("broadcast_"):
+                    await self.handle_broadcast(client_id, message)
                 elif message["type"] == "select_avatar":
                     await self.handle_avatar_select(client_id, message)
                 elif message["type"] == "ping":
                     await self.manager.send_message(client_id, {"type": "pong"})
                     
         except WebSocketDisconnect:
-            self.manager.disconnect(client_id)
+            self._close_session(client_id)
         except Exception as e:
             logger.error(f"WebSocket error: {e}")
-            self.manager.disconnect(client_id)
+            self._close_session(client_id)
             
     async def handle_audio(self, client_id: str, message: dict):
         """Handle incoming audio"""
         try:
             audio_data = base64.b64decode(message["audio"])
-            text = await self.stt._convert_chunk(audio_data)
-            
-            if text:
-                await self.manager.send_message(client_id, {
-                    "type": "text_recognized",
-                    "text": text,
-                    "session_id": message.get("session_id")
-                })
+            ingest = self._get_ingest(client_id, message)
+            stream = self._get_recognition_stream(client_id, message.get("session_id"))
+
+            # Streaming clients send "stream": true chunks and "final": true on
+            # the last one; anything else is a complete utterance
+            if not message.get("stream"):
+                pcm = ingest.feed_pcm16(audio_data) + ingest.flush_pcm16()
+                if pcm:
+                    await stream.recognize_once(pcm)
+                return
+
+            pcm = ingest.feed_pcm16(audio_data)
+            if message.get("final"):
+                pcm += ingest.flush_pcm16()
+            await stream.push(pcm)
+            if message.get("final"):
+                await stream.finish()
                 
         except Exception as e:
             logger.error(f"Audio handling error: {e}")
             
+    def _get_recognition_stream(self, client_id: str, session_id: str = None):
+        """Per-client recognition stream forwarding STT events to the client"""
+        session = self.manager.sessions.setdefault(client_id, {})
+        if "recognition" not in session:
+            async def emit(event: dict):
+                if event["type"] == "text_recognized":
+                    speculated = session.pop("speculated", {}).get(event["segment_id"])
+                    if speculated is not None:
+                        event["speculation_valid"] = speculated == event["text"]
+                await self.manager.send_message(client_id, {**event, "session_id": session_id})
+
+            async def on_stable_partial(segment_id: str, text: str):
+                # Let the client start the LLM request before the final arrives,
+                # and make sure the TTS connections are up for the reply
+                session.setdefault("speculated", {})[segment_id] = text
+                task = asyncio.create_task(self.tts.warm())
+                self._background.add(task)
+                task.add_done_callback(self._background_done)
+                await self.manager.send_message(client_id, {
+                    "type": "llm_request",
+                    "text": text,
+                    "segment_id": segment_id,
+                    "speculative": True,
+                    "session_id": session_id
+                })
+
+            session["recognition"] = self.stt.open_stream(emit, on_stable_partial)
+        return session["recognition"]
+
+    def _close_session(self, client_id: str):
+        session = self.manager.sessions.get(client_id, {})
+        if "recognition" in session:
+            session["recognition"].close()
+        if self.live is not None and self.live.get_stream(client_id):
+            asyncio.create_task(self.close_live(client_id))
+        if self.broadcasts is not None:
+            asyncio.create_task(self._close_broadcasts(client_id))
+        if self.store:
+            self.store.session_ended(client_id)
+        self.manager.disconnect(client_id)
+
+    def _get_ingest(self, client_id: str, message: dict):
+        """Per-client uplink decoder, rebuilt when the client changes format"""
+        session = self.manager.sessions.setdefault(client_id, {})
+        key = (
+            message.get("format", "pcm16"),
+            message.get("sample_rate"),
+            message.get("channels", 1)
+        )
+        if session.get("ingest_key") != key:
+            session["ingest"] = self.stt.create_ingest(*key)
+            session["ingest_key"] = key
+        return session["ingest"]
+
     async def handle_text(self, client_id: str, message: dict):
         """Handle text message (to be sent to LLM)"""
         try:
@@ -118,35 +230,211 @@ class AvatarWebSocket:
         except Exception as e:
             logger.error(f"Text handling error: {e}")
             
+    async def handle_rtc_offer(self, client_id: str, message: dict):
+        """Answer a browser offer with the session's live avatar audio and video tracks"""
+        try:
+            self._start_rtc()
+            source = self.live.start_stream(client_id)
+            answer = await self.webrtc.handle_offer(
+                client_id,
+                message["sdp"],
+                tracks=(source.audio, source.video),
+                on_closed=lambda: self.live.stop_stream(client_id)
+            )
+            await self.manager.send_message(client_id, {
+                "type": "rtc_answer",
+                "sdp": answer.sdp,
+                "sdp_type": answer.type
+            })
+
+        except Exception as e:
+            logger.error(f"WebRTC offer error: {e}")
+            await self.close_live(client_id)
+            await self.manager.send_message(client_id, {"type": "error", "message": str(e)})
+
+    def _start_rtc(self):
+        if self.webrtc is None:
+            from backend.services.webrtc_service import WebRTCService
+            from backend.services.streaming_service import StreamingService
+            from backend.services.broadcast_service import BroadcastService
+            self.webrtc = WebRTCService()
+            self.live = StreamingService(self.tts, self.viseme, self.lipsync)
+            self.broadcasts = BroadcastService(self.live, self.webrtc)
+
+    async def handle_rtc_ice(self, client_id: str, message: dict):
+        """Trickled browser candidates; the answer already carries all of ours"""
+        if self.webrtc is not None:
+            peer_id = client_id
+            if message.get("broadcast_id"):
+                peer_id = self.broadcasts.peer_id(message["broadcast_id"], client_id)
+            try:
+                await self.webrtc.add_ice_candidate(peer_id, message.get("candidate") or {})
+            except Exception as e:
+                logger.warning(f"Ignoring ICE candidate from {client_id}: {e}")
+
+    async def handle_rtc_stats(self, client_id: str):
+        """Pacing stats (sent, dropped, repeated frames and jitter) of the session's live stream"""
+        source = self.live.get_stream(client_id) if self.live is not None else None
+        await self.manager.send_message(client_id, {
+            "type": "rtc_stats",
+            "stats": source.stats() if source is not None else None
+        })
+
+    async def close_live(self, client_id: str):
+        if self.webrtc is None:
+            return
+        self.live.stop_stream(client_id)
+        await self.webrtc.close_connection(client_id)
+
+    async def handle_broadcast(self, client_id: str, message: dict):
+        """One-to-many sessions: the host creates, speaks into and ends; viewers join and leave"""
+        kind = message["type"]
+        broadcast_id = message.get("broadcast_id")
+        try:
+            self._start_rtc()
+            if kind == "broadcast_create":
+                broadcast = self.broadcasts.create(client_id)
+                await self.manager.send_message(client_id, {
+                    "type": "broadcast_created",
+                    "broadcast_id": broadcast.id,
+                    "hls_url": broadcast.hls_url
+                })
+                return
+
+            broadcast = self.broadcasts.get(broadcast_id)
+            if broadcast is None:
+                raise KeyError(f"Unknown broadcast {broadcast_id}")
+
+            if kind == "broadcast_join":
+                # Viewers with an offer get WebRTC; others get the HLS playlist
+                answer = await self.broadcasts.join(broadcast_id, client_id, message["sdp"]) if message.get("sdp") else None
+                await self.manager.send_message(client_id, {
+                    "type": "broadcast_joined",
+                    "broadcast_id": broadcast_id,
+                    "sdp": answer.sdp if answer else None,
+                    "sdp_type": answer.type if answer else None,
+                    "hls_url": broadcast.hls_url
+                })
+            elif kind == "broadcast_leave":
+                await self.broadcasts.leave(broadcast_id, client_id)
+            elif kind == "broadcast_stats":
+                await self.manager.send_message(client_id, {"type": "broadcast_stats", "stats": broadcast.stats()})
+            elif broadcast.host_id != client_id:
+                raise PermissionError("Only the host can speak in or end a broadcast")
+            elif kind == "broadcast_end":
+                await self.broadcasts.end(broadcast_id)
+                await self.manager.send_message(client_id, {"type": "broadcast_ended", "broadcast_id": broadcast_id})
+
+        except Exception as e:
+            logger.error(f"Broadcast error ({kind}): {e}")
+            await self.manager.send_message(client_id, {"type": "error", "message": str(e)})
+
+    async def _close_broadcasts(self, client_id: str):
+        for broadcast in self.broadcasts.hosted_by(client_id):
+            await self.broadcasts.end(broadcast.id)
+        await self.broadcasts.leave_all(client_id)
+
+    async def handle_live_response(self, client_id: str, message: dict):
+        """Speak an LLM response over the session's WebRTC tracks; no video file is made.
+
+        With a "broadcast_id" the reply goes to the host's broadcast instead.
+        """
+        started = time.perf_counter()
+        text = message["text"]
+        turn = {"text_length": len(text), "avatar_id": message.get("avatar_id", settings.DEFAULT_AVATAR)}
+        broadcast_id = message.get("broadcast_id")
+
+        async def on_first_frame(elapsed: float):
+            await self.manager.send_message(client_id, {
+                "type": "live_started",
+                "first_frame_ms": round(elapsed * 1000, 1),
+                "session_id": message.get("session_id")
+            })
+
+        try:
+            if broadcast_id:
+                broadcast = self.broadcasts.get(broadcast_id) if self.broadcasts is not None else None
+                if broadcast is None or broadcast.host_id != client_id:
+                    raise PermissionError(f"Not the host of broadcast {broadcast_id}")
+                stats = await self.broadcasts.speak(broadcast_id, text, on_first_frame)
+            else:
+                stats = await self.live.speak(client_id, text, on_first_frame)
+            STAGE_SECONDS.labels("turn").observe(time.perf_counter() - started)
+            if self.store:
+                self.store.record_turn(client_id, total_ms=(time.perf_counter() - started) * 1000, **turn)
+            await self.manager.send_message(client_id, {
+                "type": "live_finished",
+                "duration": round(stats["audio_seconds"], 3),
+                "frames": stats["frames"],
+                "stream": stats["stream"],
+                "session_id": message.get("session_id")
+            })
+
+        except Exception as e:
+            ERRORS.labels("turn").inc()
+            logger.error(f"Live response error: {e}")
+            if self.store:
+                self.store.record_turn(client_id, total_ms=(time.perf_counter() - started) * 1000, status="error", **turn)
+            await self.manager.send_message(client_id, {
+                "type": "error",
+                "message": str(e)
+            })
+
     async def handle_llm_response(self, client_id: str, message: dict):
         """Handle LLM response and generate avatar video"""
+        # Broadcast replies and sessions with a WebRTC connection get the live
+        # path, unless the client asks for a file ("delivery": "file")
+        if message.get("broadcast_id") or (
+            self.live is not None and self.live.get_stream(client_id) and message.get("delivery") != "file"
+        ):
+            return await self.handle_live_response(client_id, message)
+
+        turn = {"text_length": 0, "avatar_id": None, "prerendered": False}
+        started = time.perf_counter()
         try:
             text = message["text"]
-            avatar_id = message.get("avatar_id", "default")
-            
-            # Generate TTS
-            audio_data, timings = await self.tts.synthesize(text)
-            
-            if not audio_data:
-                raise Exception("TTS failed")
+            avatar_id = message.get("avatar_id", settings.DEFAULT_AVATAR)
+            turn.update(text_length=len(text), avatar_id=avatar_id)
+
+            # Pre-rendered replies (see WarmupService) skip the whole pipeline
+            video_key = self.render.video_cache_key(self.tts.cache_key(text), avatar_id, settings.LIPSYNC_MODE)
+            video_path = self.render.cached_video(video_key)
+            turn["prerendered"] = video_path is not None
+            CACHE_REQUESTS.labels("video", "hit" if turn["prerendered"] else "miss").inc()
+
+            if video_path is None:
+                # Generate TTS
+                stage = time.perf_counter()
+                audio, timings = await self.tts.synthesize(text)
+                turn["tts_ms"] = (time.perf_counter() - stage) * 1000
                 
-            # Generate visemes
-            viseme_sequence = self.viseme.generate_visemes(timings)
-            
-            # Load avatar
-            avatar_id = "professional/male"
-            avatar_path = "avatars/professional/male/model.png"
-            
-            # Generate lip sync frames
-            frames = self.lipsync.generate_frames(
-                viseme_sequence,
-                duration=len(audio_data) / 16000  
-            )
-            
-            # Render video
-            video_path = await self.render.render_video(frames, audio_data)
+                if audio is None or not len(audio):
+                    raise Exception("TTS failed")
+                    
+                # Generate visemes
+                stage = time.perf_counter()
+                timeline = self.viseme.generate_visemes(timings, self.tts.language)
+                turn["viseme_ms"] = (time.perf_counter() - stage) * 1000
+                
+                # Generate lip sync frames
+                stage = time.perf_counter()
+                frames = self.lipsync.animate(audio, timeline)
+                turn["lipsync_ms"] = (time.perf_counter() - stage) * 1000
+                
+                # Render video
+                stage = time.perf_counter()
+                video_path = await self.render.render_video(frames, audio)
+                turn["render_ms"] = (time.perf_counter() - stage) * 1000
+
+            turn["video_path"] = video_path
+            if self.store:
+                self.store.record_turn(client_id, total_ms=(time.perf_counter() - started) * 1000, **turn)
+                if video_path:
+                    self.store.session_updated(client_id, video_path=video_path)
             
+            STAGE_SECONDS.labels("turn").observe(time.perf_counter() - started)
             if video_path:
+                stage = time.perf_counter()
                 # Send video path back
                 await self.manager.send_message(client_id, {
                     "type": "video_ready",
@@ -162,9 +450,13 @@ class AvatarWebSocket:
                     "video": base64.b64encode(video_data).decode(),
                     "format": "mp4"
                 })
+                STAGE_SECONDS.labels("delivery").observe(time.perf_counter() - stage)
                 
         except Exception as e:
+            ERRORS.labels("turn").inc()
             logger.error(f"LLM response handling error: {e}")
+            if self.store and "video_path" not in turn:
+                self.store.record_turn(client_id, total_ms=(time.perf_counter() - started) * 1000, status="error", **turn)
             await self.manager.send_message(client_id, {
                 "type": "error",
                 "message": str(e)
@@ -177,6 +469,8 @@ class AvatarWebSocket:
             
             # Update session
             session_id = message.get("session_id", str(uuid.uuid4()))
+            if self.store:
+                self.store.session_updated(client_id, avatar_id=avatar_id)
             
             await self.manager.send_message(client_id, {
                 "type": "avatar_selected",
@@ -13,17 +13,28 @@ class Settings(BaseSettings):
     APP_VERSION: str = "1.0.0"
     DEBUG: bool = False
     ENVIRONMENT: str = "production"
+    LOG_FILE: str = "app.log"
     
     HOST: str = "0.0.0.0"
     PORT: int = 8000
     WS_PORT: int = 8765
 
     DATABASE_URL: str = "sqlite:///./avatars.db"
+    DB_POOL_SIZE: int = 5
+    PERSIST_ENABLED: bool = True
+    PERSIST_BATCH_SIZE: int = 200
+    PERSIST_FLUSH_INTERVAL: float = 1.0
+    PERSIST_QUEUE_SIZE: int = 10000
     REDIS_URL: str = "redis://localhost:6379"
     
     SECRET_KEY: str = os.getenv("SECRET_KEY", "your-secret-key-here")
     ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
+    ADMIN_TOKEN: Optional[str] = None  # admin endpoints are disabled while unset
+    PROFILE_MAX_SECONDS: float = 300.0
+    PROFILE_SAMPLE_INTERVAL: float = 0.005
+    PROFILE_BLOCK_THRESHOLD: float = 0.05
+    PROFILE_HISTORY: int = 5
     
 
     BASE_DIR: str = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -34,29 +45,78 @@ class Settings(BaseSettings):
 
     AVATAR_MODELS: list = ["professional", "casual", "friendly", "corporate"]
     DEFAULT_AVATAR: str = "professional/model_v1"
+    AVATAR_CATALOG_REFRESH: float = 60.0
+    THUMBNAIL_CACHE_DIR: str = "cache/thumbnails"
+    THUMBNAIL_SIZES: list = [96, 192, 384]
+    THUMBNAIL_MAX_AGE: int = 31536000
     
     VIDEO_FPS: int = 30
     VIDEO_WIDTH: int = 1920
     VIDEO_HEIGHT: int = 1080
     VIDEO_CODEC: str = "h264"
     VIDEO_BITRATE: str = "5000k"
+    RENDERER: str = "moviepy"
     AUDIO_SAMPLE_RATE: int = 16000
     AUDIO_CHANNELS: int = 1
     AUDIO_CODEC: str = "aac"
     STT_ENGINE: str = "google"  
+    STT_MAX_WORKERS: int = 4
+    STT_TIMEOUT: float = 10.0
+    STT_LOCAL_TRANSCRIPT: Optional[str] = None
+    STT_LOCAL_LATENCY: float = 0.0
+    STT_LOCAL_ENERGY_THRESHOLD: float = 200.0
+    STT_PARTIAL_INTERVAL: float = 0.5
+    STT_VAD_THRESHOLD: float = 500.0
+    STT_ENDPOINT_SILENCE: float = 0.6
+    STT_MAX_UTTERANCE: float = 15.0
     TTS_ENGINE: str = "azure"  
+    TTS_POOL_SIZE: int = 4
+    TTS_HTTP_KEEPALIVE: float = 60.0
+    TTS_REQUEST_TIMEOUT: float = 30.0
+    TTS_FAKE_WORD_SECONDS: float = 0.3
+    TTS_FAKE_LATENCY: float = 0.0
     AZURE_SPEECH_KEY: Optional[str] = None
     AZURE_SPEECH_REGION: Optional[str] = None
     ELEVENLABS_API_KEY: Optional[str] = None
     OPENAI_API_KEY: Optional[str] = None
     LLM_ENDPOINT: str = "http://localhost:8080/generate"
     LLM_API_KEY: Optional[str] = None
+    LIPSYNC_MODE: str = "hybrid"  # audio, hybrid or phoneme
+    LIPSYNC_AUDIO_WEIGHT: float = 0.7
+    LIPSYNC_PATCH_CACHE: int = 256  # mouth patches kept per avatar, about 0.1 MB each
+    G2P_CACHE_SIZE: int = 50000
+    WARMUP_ON_STARTUP: bool = True
     CACHE_TTL: int = 3600
     ENABLE_CACHE: bool = True
+    TTS_CACHE_DIR: str = "cache/tts"
+    TTS_CACHE_MEMORY_MB: int = 64
+    TTS_CACHE_DISK_MB: int = 1024
+    TTS_CACHE_SHARED: bool = False
     RTC_ICE_SERVERS: list = [
         {"urls": ["stun:stun.l.google.com:19302"]},
         {"urls": ["stun:stun1.l.google.com:19302"]}
     ]
+    RTC_AUDIO_SAMPLE_RATE: int = 48000
+    RTC_PLAYOUT_DELAY: float = 0.1  # head start a live reply's first frames get over playout
+    IDLE_LOOP_SECONDS: float = 6.0
+    IDLE_LOOP_FPS: int = 12
+    IDLE_BLINK: bool = True  # eyes are placed from the mouth region; turn off if they land wrong
+    IDLE_CACHE_DIR: str = "cache/idle"
+    BROADCAST_KEYFRAME_INTERVAL: float = 2.0  # seconds; the longest a joining viewer waits
+    BROADCAST_VIDEO_BITRATE: int = 2_000_000
+    BROADCAST_AUDIO_BITRATE: int = 64_000
+    BROADCAST_VIEWER_QUEUE: int = 120  # packets a viewer may lag before it resyncs at a keyframe
+    BROADCAST_HLS: bool = True
+    BROADCAST_HLS_SEGMENT: float = 2.0
+    BATCH_WORKERS: Optional[int] = None  # render processes; default one per core but one, 0 accepts jobs without rendering them
+    BATCH_NICE: int = 10  # workers yield the CPU to interactive sessions
+    BATCH_CHUNK_SIZE: int = 8  # items per worker task; their TTS requests run together
+    BATCH_TTS_CONCURRENCY: int = 4
+    BATCH_MAX_ATTEMPTS: int = 3  # an item that kills its worker this many times while running alone fails
+    BATCH_MAX_ITEMS: int = 10000
+    BATCH_POLL_INTERVAL: float = 5.0
+    BATCH_CALLBACK_RETRIES: int = 5
+    BATCH_CALLBACK_HOSTS: list = []  # if set, the only hosts job callbacks may go to
     
     class Config:
         env_file = ".env"
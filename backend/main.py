@@ -1,18 +1,30 @@
 from fastapi import FastAPI, WebSocket
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi.responses import FileResponse, PlainTextResponse
 import uvicorn
 from loguru import logger
-import os
 
 from backend.config import settings
 from backend.api.websocket import AvatarWebSocket  
+from backend.api.routes import router as api_router
+from backend.api.admin import router as admin_router
 from backend.services.stt_service import SpeechToTextService
 from backend.services.tts_service import TextToSpeechService
 from backend.services.viseme_service import VisemeService
 from backend.services.lipsync_service import LipSyncService
-from backend.services.avatar_service import AvatarRenderService
+from backend.services.warmup_service import WarmupService
+from backend.services.avatar_catalog import AvatarCatalog
+from backend.services.session_store import SessionStore
+from backend.services.batch_service import BatchService
+from backend.services.profiler import Profiler
+from backend.utils.metrics import metrics
+from backend.utils.registry import LazyRegistry, startup_report
+
+# Video renderers, keyed by settings.RENDERER and imported on startup only if selected
+RENDERERS = LazyRegistry("renderer", {
+    "moviepy": "backend.services.avatar_service:AvatarRenderService",
+})
 
 app = FastAPI(
     title=settings.APP_NAME,
@@ -20,7 +32,7 @@ app = FastAPI(
     description="AI Avatar Communication System"
 )
 
-logger.add("app.log", rotation="500 MB")
+logger.add(settings.LOG_FILE, rotation="500 MB")
 
 app.add_middleware(
     CORSMiddleware,
@@ -30,35 +42,96 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+app.include_router(api_router)
+app.include_router(admin_router)
+
 app.mount("/static", StaticFiles(directory=settings.STATIC_DIR), name="static")
 app.mount("/avatars", StaticFiles(directory=settings.AVATAR_DIR), name="avatars")
 app.mount("/outputs", StaticFiles(directory=settings.OUTPUT_DIR), name="outputs")
+# Scripts and styles the pages load by relative path
+app.mount("/js", StaticFiles(directory="frontend/js"), name="js")
+app.mount("/css", StaticFiles(directory="frontend/css"), name="css")
 stt_service: SpeechToTextService = None
 tts_service: TextToSpeechService = None
 viseme_service: VisemeService = None
 lipsync_service: LipSyncService = None
-render_service: AvatarRenderService = None
+render_service = None
 ws_handler: AvatarWebSocket = None
+warmup_service: WarmupService = None
 @app.on_event("startup")
 async def startup_event():
-    global stt_service, tts_service, viseme_service, lipsync_service, render_service, ws_handler
+    global stt_service, tts_service, viseme_service, lipsync_service, render_service, ws_handler, warmup_service
 
-    stt_service = SpeechToTextService(engine=settings.STT_ENGINE)
-    tts_service = TextToSpeechService(engine=settings.TTS_ENGINE)
-    viseme_service = VisemeService()
-    lipsync_service = LipSyncService(avatar_path=settings.DEFAULT_AVATAR)
-    render_service = AvatarRenderService(output_dir=settings.OUTPUT_DIR)
+    app.state.profiler = Profiler()
+    with startup_report.stage("avatar_catalog"):
+        app.state.avatar_catalog = AvatarCatalog()
+        await app.state.avatar_catalog.start()
+    with startup_report.stage("session_store"):
+        app.state.session_store = SessionStore()
+        if settings.PERSIST_ENABLED:
+            try:
+                await app.state.session_store.start()
+            except Exception as e:
+                # Persistence is best-effort; serving continues without it
+                logger.warning(f"Session store disabled: {e}")
+    with startup_report.stage("stt"):
+        stt_service = SpeechToTextService(engine=settings.STT_ENGINE)
+    with startup_report.stage("tts"):
+        tts_service = TextToSpeechService(engine=settings.TTS_ENGINE)
+        await tts_service.start()
+    with startup_report.stage("viseme"):
+        viseme_service = VisemeService()
+    with startup_report.stage("lipsync"):
+        lipsync_service = LipSyncService.for_avatar(settings.DEFAULT_AVATAR)
+    with startup_report.stage("renderer"):
+        render_service = RENDERERS.create(settings.RENDERER, output_dir=settings.OUTPUT_DIR)
+    with startup_report.stage("batch"):
+        app.state.batch = BatchService(RENDERERS.load(settings.RENDERER))
+        try:
+            await app.state.batch.start()
+        except Exception as e:
+            logger.warning(f"Batch rendering disabled: {e}")
 
     ws_handler = AvatarWebSocket(
         stt_service=stt_service,
         tts_service=tts_service,
         viseme_service=viseme_service,
         lipsync_service=lipsync_service,
-        render_service=render_service
+        render_service=render_service,
+        session_store=app.state.session_store,
+        profiler=app.state.profiler
     )
 
+    # Pre-render scripted phrases in the background; /health reports readiness
+    warmup_service = WarmupService(tts_service, viseme_service, lipsync_service, render_service)
+    if settings.WARMUP_ON_STARTUP:
+        warmup_service.start()
+    else:
+        # Nothing is pre-rendered, so there is nothing to wait for
+        warmup_service.ready = True
+
+    startup_report.finish()
+    startup_report.log()
     logger.info("All services initialized!")
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    if getattr(app.state, "profiler", None):
+        app.state.profiler.close()
+    if getattr(app.state, "avatar_catalog", None):
+        await app.state.avatar_catalog.stop()
+    if getattr(app.state, "session_store", None):
+        await app.state.session_store.stop()
+    if getattr(app.state, "batch", None):
+        await app.state.batch.stop()
+    if warmup_service:
+        await warmup_service.stop()
+    if stt_service:
+        stt_service.close()
+    if tts_service:
+        await tts_service.close()
+    logger.info("All services stopped")
+
 @app.get("/")
 async def root():
     return FileResponse("frontend/index.html")
@@ -67,31 +140,10 @@ async def root():
 async def dashboard():
     return FileResponse("frontend/dashboard.html")
 
-@app.get("/api/avatars")
-async def get_avatars():
-    avatars = []
-    for category in settings.AVATAR_MODELS:
-        category_path = os.path.join(settings.AVATAR_DIR, category)
-        if os.path.exists(category_path):
-            for avatar in os.listdir(category_path):
-                if os.path.isdir(os.path.join(category_path, avatar)):
-                    avatars.append({
-                        "id": f"{category}/{avatar}",
-                        "name": avatar.replace("_", " ").title(),
-                        "category": category,
-                        "thumbnail": f"/avatars/{category}/{avatar}/thumbnail.jpg"
-                    })
-    return JSONResponse({"avatars": avatars})
-
-@app.post("/api/sessions/create")
-async def create_session(avatar_id: str):
-    import uuid
-    session_id = str(uuid.uuid4())
-    return JSONResponse({
-        "session_id": session_id,
-        "avatar_id": avatar_id,
-        "websocket_url": f"ws://{settings.HOST}:{settings.PORT}/ws/{session_id}"
-    })
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    """Prometheus scrape endpoint"""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
 
 @app.websocket("/ws/{client_id}")
 async def websocket_endpoint(websocket: WebSocket, client_id: str):
@@ -99,7 +151,17 @@ async def websocket_endpoint(websocket: WebSocket, client_id: str):
 
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy", "version": settings.APP_VERSION}
+    tts_ok = await tts_service.health() if tts_service else False
+    return {
+        "status": "healthy" if tts_ok else "degraded",
+        "version": settings.APP_VERSION,
+        "ready": warmup_service.ready if warmup_service else False,
+        "tts": {"healthy": tts_ok, "cache": tts_service.cache.stats() if tts_service else None},
+        "warmup": warmup_service.status() if warmup_service else None,
+        "persistence": app.state.session_store.stats() if getattr(app.state, "session_store", None) else None,
+        "batch": app.state.batch.stats() if getattr(app.state, "batch", None) else None,
+        "startup": startup_report.as_dict()
+    }
 if __name__ == "__main__":
     uvicorn.run(
         "backend.main:app",
@@ -38,12 +38,13 @@ class AvatarSession(Base):
     
     id = Column(Integer, primary_key=True, index=True)
     session_id = Column(String, unique=True, index=True)
-    avatar_id = Column(Integer)
+    avatar_id = Column(String)  # "<category>/<model>"
     user_id = Column(String, nullable=True)
     start_time = Column(DateTime, default=datetime.utcnow)
     end_time = Column(DateTime, nullable=True)
     status = Column(String, default="active")  # active, ended, error
-    metadata = Column(JSON, default={})
+    # "metadata" is reserved on declarative models, so map it under another name
+    session_metadata = Column("metadata", JSON, default={})
     video_path = Column(String, nullable=True)
     
     def to_dict(self):
@@ -55,40 +56,62 @@ class AvatarSession(Base):
             "video_path": self.video_path
         }
 
-class VisemeMapping(Base):
-    __tablename__ = "viseme_mappings"
+class SessionTurn(Base):
+    __tablename__ = "session_turns"
     
     id = Column(Integer, primary_key=True, index=True)
-    phoneme = Column(String, unique=True, index=True)
-    viseme_shape = Column(String)  # viseme_aa, viseme_ii, etc.
-    mouth_width = Column(Float)
-    mouth_height = Column(Float)
-    jaw_open = Column(Float)
-    lip_round = Column(Float)
-    duration_ms = Column(Integer, default=100)
+    session_id = Column(String, index=True)
+    avatar_id = Column(String)
+    text_length = Column(Integer)
+    prerendered = Column(Boolean, default=False)
+    tts_ms = Column(Float, nullable=True)
+    viseme_ms = Column(Float, nullable=True)
+    lipsync_ms = Column(Float, nullable=True)
+    render_ms = Column(Float, nullable=True)
+    total_ms = Column(Float)
+    video_path = Column(String, nullable=True)
+    status = Column(String, default="ok")  # ok, error
+    created_at = Column(DateTime, default=datetime.utcnow)
     
-    @classmethod
-    def get_default_mappings(cls):
+    def to_dict(self):
         return {
-            # Vowels
-            "aa": {"viseme": "viseme_aa", "width": 0.8, "height": 0.7, "jaw": 0.8, "round": 0.2},
-            "ii": {"viseme": "viseme_ii", "width": 0.5, "height": 0.9, "jaw": 0.3, "round": 0.1},
-            "uu": {"viseme": "viseme_uu", "width": 0.6, "height": 0.4, "jaw": 0.4, "round": 0.9},
-            "ee": {"viseme": "viseme_e", "width": 0.7, "height": 0.5, "jaw": 0.5, "round": 0.3},
-            "oo": {"viseme": "viseme_o", "width": 0.6, "height": 0.5, "jaw": 0.5, "round": 0.7},
-            
-            # Consonants
-            "k": {"viseme": "viseme_k", "width": 0.5, "height": 0.3, "jaw": 0.3, "round": 0.2},
-            "g": {"viseme": "viseme_g", "width": 0.5, "height": 0.3, "jaw": 0.3, "round": 0.2},
-            "t": {"viseme": "viseme_t", "width": 0.4, "height": 0.2, "jaw": 0.2, "round": 0.1},
-            "d": {"viseme": "viseme_d", "width": 0.4, "height": 0.2, "jaw": 0.2, "round": 0.1},
-            "n": {"viseme": "viseme_n", "width": 0.4, "height": 0.2, "jaw": 0.2, "round": 0.1},
-            "m": {"viseme": "viseme_m", "width": 0.4, "height": 0.2, "jaw": 0.2, "round": 0.1},
-            "p": {"viseme": "viseme_p", "width": 0.3, "height": 0.1, "jaw": 0.1, "round": 0.1},
-            "b": {"viseme": "viseme_b", "width": 0.3, "height": 0.1, "jaw": 0.1, "round": 0.1},
-            "s": {"viseme": "viseme_s", "width": 0.4, "height": 0.1, "jaw": 0.1, "round": 0.1},
-            "h": {"viseme": "viseme_h", "width": 0.5, "height": 0.3, "jaw": 0.3, "round": 0.2},
-            
-            # Silence
-            "sil": {"viseme": "viseme_silence", "width": 0.2, "height": 0.1, "jaw": 0.0, "round": 0.0}
-        }
\ No newline at end of file
+            "session_id": self.session_id,
+            "avatar_id": self.avatar_id,
+            "prerendered": self.prerendered,
+            "total_ms": self.total_ms,
+            "video_path": self.video_path,
+            "status": self.status,
+            "created_at": self.created_at.isoformat()
+        }
+
+class BatchJob(Base):
+    __tablename__ = "batch_jobs"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    job_id = Column(String, unique=True, index=True)
+    status = Column(String, default="queued")  # queued, running, done
+    total = Column(Integer)
+    callback_url = Column(String, nullable=True)
+    callback_sent = Column(Boolean, default=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    finished_at = Column(DateTime, nullable=True)
+
+class BatchItem(Base):
+    __tablename__ = "batch_items"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    job_id = Column(String, index=True)
+    index = Column(Integer)
+    text = Column(String)
+    avatar_id = Column(String)
+    voice = Column(String, nullable=True)
+    width = Column(Integer, nullable=True)
+    height = Column(Integer, nullable=True)
+    status = Column(String, default="queued", index=True)  # queued, running, done, error
+    attempts = Column(Integer, default=0)
+    isolated = Column(Boolean, default=False)  # suspected of killing a worker; runs alone
+    crashes = Column(Integer, default=0)  # worker deaths while running alone
+    video_path = Column(String, nullable=True)
+    duration = Column(Float, nullable=True)
+    error = Column(String, nullable=True)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -0,0 +1,317 @@
+from math import gcd
+import numpy as np
+from loguru import logger
+from typing import List, Optional, Tuple
+
+from backend.utils.helpers import bytes_to_ndarray, ndarray_to_float32, float32_to_pcm16
+
+# Formats accepted on the uplink. "opus" expects one raw Opus packet per
+# chunk (WebCodecs AudioEncoder), "webm" expects MediaRecorder WebM/Opus
+# fragments in order.
+PCM_FORMATS = {"pcm16": (2, False), "s16le": (2, False), "f32le": (4, True), "float32": (4, True)}
+COMPRESSED_FORMATS = ("opus", "webm")
+SUPPORTED_FORMATS = tuple(PCM_FORMATS) + COMPRESSED_FORMATS
+
+
+class PolyphaseResampler:
+    """Streaming rational resampler using a windowed-sinc polyphase FIR.
+
+    The filter is split into `up` phases of `taps` coefficients each, so every
+    output sample is a `taps`-long dot product gathered in one vectorized
+    numpy call per chunk. Filter history is carried between calls, so chunks
+    can be fed incrementally with the same result as one long buffer.
+    """
+
+    def __init__(self, in_rate: int, out_rate: int, zero_crossings: int = 16, rolloff: float = 0.94, beta: float = 8.0):
+        g = gcd(in_rate, out_rate)
+        self.in_rate = in_rate
+        self.out_rate = out_rate
+        self.up = out_rate // g
+        self.down = in_rate // g
+
+        factor = max(self.up, self.down)
+        cutoff = 0.5 / factor * rolloff
+        half = zero_crossings * factor
+        n = np.arange(-half, half + 1)
+        h = 2 * cutoff * np.sinc(2 * cutoff * n) * np.kaiser(2 * half + 1, beta) * self.up
+        self.taps = -(-len(h) // self.up)
+        h = np.pad(h, (0, self.taps * self.up - len(h)))
+        # phases[p, k] = h[p + k * up]
+        self.phases = h.reshape(self.taps, self.up).T.astype(np.float32)
+
+        self._delay = int(round(half / self.down))
+        self.reset()
+
+    @property
+    def passthrough(self) -> bool:
+        return self.up == self.down
+
+    def reset(self):
+        self._history = np.zeros(self.taps - 1, dtype=np.float32)
+        self._consumed = 0
+        self._real_consumed = 0
+        self._next_out = 0
+        self._emitted = 0
+
+    def process(self, x: np.ndarray) -> np.ndarray:
+        """Resample a mono float32 chunk"""
+        x = np.asarray(x, dtype=np.float32)
+        if self.passthrough:
+            return x
+        self._real_consumed += len(x)
+        y = self._trim(self._filter(x))
+        self._emitted += len(y)
+        return y
+
+    def flush(self) -> np.ndarray:
+        """Drain the filter tail at end of stream"""
+        if self.passthrough:
+            return np.zeros(0, dtype=np.float32)
+        y = self._trim(self._filter(np.zeros(self.taps, dtype=np.float32)))
+        expected = -(-self._real_consumed * self.up // self.down)
+        y = y[:max(0, expected - self._emitted)]
+        self._emitted += len(y)
+        self.reset()
+        return y
+
+    def _filter(self, x: np.ndarray) -> np.ndarray:
+        up, down = self.up, self.down
+        buf = np.concatenate([self._history, x])
+        buf_start = self._consumed - (self.taps - 1)
+        self._consumed += len(x)
+
+        # Outputs whose newest input sample is already available
+        n_end = (self._consumed * up - 1) // down + 1
+        n = np.arange(self._next_out, n_end, dtype=np.int64)
+        self._next_out = max(self._next_out, n_end)
+        self._history = buf[len(buf) - (self.taps - 1):]
+        if n.size == 0:
+            return np.zeros(0, dtype=np.float32)
+
+        pos = n * down
+        base = pos // up - buf_start
+        idx = base[:, None] - np.arange(self.taps)[None, :]
+        return np.einsum("nk,nk->n", buf[idx], self.phases[pos % up]).astype(np.float32)
+
+    def _trim(self, y: np.ndarray) -> np.ndarray:
+        # Drop the filter's group delay so output is aligned with input
+        if self._delay:
+            skip = min(self._delay, len(y))
+            y = y[skip:]
+            self._delay -= skip
+        return y
+
+
+class WebMOpusDemuxer:
+    """Incremental WebM (Matroska) demuxer extracting Opus packets.
+
+    Only the elements needed for MediaRecorder audio are interpreted; every
+    other element is skipped by size, so bytes are parsed exactly once no
+    matter how the stream is chunked.
+    """
+    SEGMENT = 0x18538067
+    CLUSTER = 0x1F43B675
+    TRACKS = 0x1654AE6B
+    TRACK_ENTRY = 0xAE
+    CODEC_PRIVATE = 0x63A2
+    BLOCK_GROUP = 0xA0
+    BLOCK = 0xA1
+    SIMPLE_BLOCK = 0xA3
+
+    MASTER_IDS = {SEGMENT, CLUSTER, TRACKS, TRACK_ENTRY, BLOCK_GROUP}
+    PAYLOAD_IDS = {BLOCK, SIMPLE_BLOCK, CODEC_PRIVATE}
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self._skip = 0
+        self.codec_private: Optional[bytes] = None
+
+    def feed(self, data: bytes) -> List[bytes]:
+        """Consume a chunk and return the Opus packets it completed"""
+        self._buffer.extend(data)
+        packets = []
+        pos = 0
+        buf = self._buffer
+
+        while True:
+            if self._skip:
+                step = min(self._skip, len(buf) - pos)
+                pos += step
+                self._skip -= step
+                if self._skip:
+                    break
+
+            header = self._read_header(buf, pos)
+            if header is None:
+                break
+            element_id, size, header_len = header
+
+            if element_id in self.MASTER_IDS:
+                # Descend into containers (their size may be unknown)
+                pos += header_len
+            elif element_id in self.PAYLOAD_IDS:
+                if size is None or len(buf) - pos < header_len + size:
+                    break
+                payload = bytes(buf[pos + header_len:pos + header_len + size])
+                pos += header_len + size
+                if element_id == self.CODEC_PRIVATE:
+                    self.codec_private = payload
+                else:
+                    packet = self._block_payload(payload)
+                    if packet:
+                        packets.append(packet)
+            else:
+                if size is None:
+                    logger.warning(f"Unknown-size WebM element {element_id:#x}, resetting demuxer")
+                    pos = len(buf)
+                    break
+                pos += header_len
+                self._skip = size
+
+        del self._buffer[:pos]
+        return packets
+
+    @staticmethod
+    def _read_vint(buf: bytearray, pos: int, keep_marker: bool) -> Optional[Tuple[int, int, bool]]:
+        if pos >= len(buf):
+            return None
+        first = buf[pos]
+        length = 1
+        mask = 0x80
+        while length <= 8 and not first & mask:
+            mask >>= 1
+            length += 1
+        if length > 8 or pos + length > len(buf):
+            return None
+        value = first if keep_marker else first & (mask - 1)
+        all_ones = (first & (mask - 1)) == mask - 1
+        for b in buf[pos + 1:pos + length]:
+            value = (value << 8) | b
+            all_ones = all_ones and b == 0xFF
+        return value, length, all_ones
+
+    def _read_header(self, buf: bytearray, pos: int) -> Optional[Tuple[int, Optional[int], int]]:
+        element_id = self._read_vint(buf, pos, keep_marker=True)
+        if element_id is None:
+            return None
+        size = self._read_vint(buf, pos + element_id[1], keep_marker=False)
+        if size is None:
+            return None
+        value, size_len, unknown = size
+        return element_id[0], (None if unknown else value), element_id[1] + size_len
+
+    def _block_payload(self, block: bytes) -> Optional[bytes]:
+        track = self._read_vint(bytearray(block), 0, keep_marker=False)
+        if track is None:
+            return None
+        offset = track[1] + 3  # track number, int16 timecode, flags
+        flags = block[offset - 1]
+        if flags & 0x06:
+            logger.warning("Laced WebM blocks are not supported, dropping block")
+            return None
+        return block[offset:]
+
+
+class OpusDecoder:
+    """Stateful Opus packet decoder (PyAV/FFmpeg)"""
+
+    def __init__(self, extradata: Optional[bytes] = None):
+        import av
+        self._av = av
+        self.codec = av.CodecContext.create("opus", "r")
+        self.codec.sample_rate = 48000
+        if extradata:
+            self.codec.extradata = extradata
+        self.sample_rate = 48000
+
+    def decode(self, packet: bytes) -> np.ndarray:
+        """Decode one packet into a (frames, channels) float32 array"""
+        chunks = []
+        for frame in self.codec.decode(self._av.Packet(packet)):
+            self.sample_rate = frame.sample_rate
+            channels = len(frame.layout.channels)
+            samples = frame.to_ndarray()
+            if frame.format.is_planar:
+                samples = samples.T
+            else:
+                samples = samples.reshape(-1, channels)
+            chunks.append(ndarray_to_float32(samples))
+        if not chunks:
+            return np.zeros((0, 1), dtype=np.float32)
+        return np.concatenate(chunks)
+
+
+class AudioIngest:
+    """Per-stream uplink decoder: decode, downmix to mono, resample.
+
+    Each `feed` call only touches the new bytes; partial PCM frames, WebM
+    element fragments, decoder state and resampler history are carried over
+    to the next chunk.
+    """
+
+    def __init__(self, fmt: str = "pcm16", sample_rate: int = 16000, channels: int = 1, target_rate: int = 16000):
+        if fmt not in SUPPORTED_FORMATS:
+            raise ValueError(f"Unsupported audio format: {fmt}")
+        self.format = fmt
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.target_rate = target_rate
+
+        self._remainder = b""
+        self._demuxer = WebMOpusDemuxer() if fmt == "webm" else None
+        self._decoder: Optional[OpusDecoder] = None
+        self._resampler: Optional[PolyphaseResampler] = None
+
+    def feed(self, chunk: bytes) -> np.ndarray:
+        """Decode a chunk into mono float32 samples at `target_rate`"""
+        samples, rate = self._decode(chunk)
+        if samples.size == 0:
+            return np.zeros(0, dtype=np.float32)
+        mono = samples.mean(axis=1) if samples.shape[1] > 1 else samples[:, 0]
+        return self._get_resampler(rate).process(mono)
+
+    def feed_pcm16(self, chunk: bytes) -> bytes:
+        return float32_to_pcm16(self.feed(chunk))
+
+    def flush(self) -> np.ndarray:
+        """Drain buffered resampler output at end of stream"""
+        self._remainder = b""
+        if self._resampler is None:
+            return np.zeros(0, dtype=np.float32)
+        return self._resampler.flush()
+
+    def flush_pcm16(self) -> bytes:
+        return float32_to_pcm16(self.flush())
+
+    def _decode(self, chunk: bytes) -> Tuple[np.ndarray, int]:
+        if self.format in PCM_FORMATS:
+            sample_width, is_float = PCM_FORMATS[self.format]
+            data = self._remainder + chunk
+            frame_size = sample_width * self.channels
+            split = len(data) - len(data) % frame_size
+            self._remainder = data[split:]
+            samples = bytes_to_ndarray(
+                data[:split], sample_width=sample_width, channels=self.channels, is_float=is_float
+            )
+            return ndarray_to_float32(samples), self.sample_rate
+
+        if self.format == "webm":
+            packets = self._demuxer.feed(chunk)
+            extradata = self._demuxer.codec_private
+        else:
+            packets = [chunk]
+            extradata = None
+        if not packets:
+            return np.zeros((0, 1), dtype=np.float32), self.sample_rate
+
+        if self._decoder is None:
+            self._decoder = OpusDecoder(extradata)
+        decoded = [self._decoder.decode(packet) for packet in packets]
+        channels = max(d.shape[1] for d in decoded)
+        decoded = [d if d.shape[1] == channels else np.repeat(d, channels, axis=1) for d in decoded]
+        return np.concatenate(decoded), self._decoder.sample_rate
+
+    def _get_resampler(self, rate: int) -> PolyphaseResampler:
+        if self._resampler is None or self._resampler.in_rate != rate:
+            self._resampler = PolyphaseResampler(rate, self.target_rate)
+        return self._resampler
@@ -0,0 +1,268 @@
+import argparse
+import io
+import json
+import os
+import struct
+import sys
+import zlib
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+from loguru import logger
+
+from backend.config import settings
+from backend.utils.constants import MOUTH_SHAPES
+
+BUNDLE_NAME = "avatar.bundle"
+BUNDLE_MAGIC = b"AVBNDL01"
+BUNDLE_VERSION = 2
+ALIGNMENT = 64
+SOURCE_NAMES = ("model.png", "model.jpg", "avatar.png", "avatar.jpg")
+
+# Bundles opened by this process, shared by every LipSyncService using them
+_open_bundles: Dict[str, "AvatarBundle"] = {}
+
+
+def avatar_dir(avatar_id: str) -> Path:
+    return Path(settings.AVATAR_DIR) / avatar_id
+
+
+def bundle_path(avatar_id: str) -> Path:
+    return avatar_dir(avatar_id) / BUNDLE_NAME
+
+
+def source_image(avatar_id: str) -> str:
+    """The avatar's base image; a missing one makes LipSyncService draw a placeholder"""
+    for name in SOURCE_NAMES:
+        path = avatar_dir(avatar_id) / name
+        if path.exists():
+            return str(path)
+    return str(avatar_dir(avatar_id) / SOURCE_NAMES[0])
+
+
+def list_avatars() -> List[str]:
+    avatars = []
+    for category in settings.AVATAR_MODELS:
+        category_path = Path(settings.AVATAR_DIR) / category
+        if category_path.is_dir():
+            avatars.extend(f"{category}/{p.name}" for p in sorted(category_path.iterdir()) if p.is_dir())
+    return avatars
+
+
+def _source_stamp(path: str) -> Optional[dict]:
+    if not os.path.exists(path):
+        return None
+    stat = os.stat(path)
+    return {"name": os.path.basename(path), "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+class AvatarBundle:
+    """Read-only view of a compiled avatar bundle.
+
+    Layout: 8-byte magic, little-endian u64 header length, JSON header, then
+    each array at a 64-byte aligned offset. Arrays are views into one
+    read-only memory map, so processes mapping the same bundle share the
+    page cache instead of each holding a decoded copy.
+    """
+
+    def __init__(self, path: str):
+        self.path = str(path)
+        with open(self.path, 'rb') as f:
+            magic = f.read(len(BUNDLE_MAGIC))
+            if magic != BUNDLE_MAGIC:
+                raise ValueError(f"{self.path} is not an avatar bundle")
+            (header_len,) = struct.unpack("<Q", f.read(8))
+            self.header = json.loads(f.read(header_len))
+        self._map = np.memmap(self.path, dtype=np.uint8, mode='r')
+        self.arrays = {name: self._view(spec) for name, spec in self.header["arrays"].items()}
+
+    def _view(self, spec: dict) -> np.ndarray:
+        dtype = np.dtype(spec["dtype"])
+        count = int(np.prod(spec["shape"]))
+        return np.frombuffer(self._map, dtype=dtype, count=count, offset=spec["offset"]).reshape(spec["shape"])
+
+    @property
+    def base(self) -> np.ndarray:
+        return self.arrays["base"]
+
+    @property
+    def sprites(self) -> np.ndarray:
+        return self.arrays["sprites"]
+
+    @property
+    def mouth_region(self) -> tuple:
+        return tuple(self.header["mouth_region"])
+
+    def thumbnail(self, size: int) -> Optional[bytes]:
+        """JPEG bytes of the smallest thumbnail bucket at least `size` px"""
+        sizes = sorted(self.header.get("thumbnail_sizes", []))
+        if not sizes:
+            return None
+        bucket = next((s for s in sizes if s >= size), sizes[-1])
+        return self.arrays[f"thumbnail_{bucket}"].tobytes()
+
+    def is_current(self, avatar_id: str) -> bool:
+        return (
+            self.header.get("version") == BUNDLE_VERSION
+            and self.header.get("source") == _source_stamp(source_image(avatar_id))
+        )
+
+    def validate(self) -> List[str]:
+        """Problems found in the bundle; empty when it is usable"""
+        problems = []
+        if self.header.get("version") != BUNDLE_VERSION:
+            problems.append(f"version {self.header.get('version')} != {BUNDLE_VERSION}")
+        for name, spec in self.header["arrays"].items():
+            end = spec["offset"] + spec["nbytes"]
+            if spec["offset"] % ALIGNMENT or end > len(self._map):
+                problems.append(f"{name}: bad extent {spec['offset']}..{end}")
+            elif zlib.crc32(self._map[spec["offset"]:end]) != spec["crc32"]:
+                problems.append(f"{name}: checksum mismatch")
+        for required in ("base", "sprites"):
+            if required not in self.arrays:
+                problems.append(f"missing {required}")
+        if problems:
+            return problems
+
+        height, width = self.base.shape[:2]
+        x1, y1, x2, y2 = self.mouth_region
+        if not (0 <= x1 < x2 <= width and 0 <= y1 < y2 <= height):
+            problems.append(f"mouth region {self.mouth_region} outside {width}x{height} frame")
+        bx1, by1, bx2, by2 = self.header["mouth_box"]
+        expected = (len(MOUTH_SHAPES), by2 - by1, bx2 - bx1, self.base.shape[2])
+        if self.sprites.shape != expected:
+            problems.append(f"sprites shape {self.sprites.shape} != {expected}")
+        return problems
+
+
+def open_bundle(avatar_id: str) -> Optional[AvatarBundle]:
+    """Map the avatar's bundle once per process; None if missing, stale or invalid"""
+    if avatar_id in _open_bundles:
+        return _open_bundles[avatar_id]
+    path = bundle_path(avatar_id)
+    if not path.exists():
+        return None
+    try:
+        bundle = AvatarBundle(path)
+    except (OSError, ValueError) as e:
+        logger.warning(f"Ignoring avatar bundle {path}: {e}")
+        return None
+    if not bundle.is_current(avatar_id):
+        logger.warning(f"Avatar bundle {path} is stale; rebuild it with `python -m backend.services.avatar_bundle build`")
+        return None
+    _open_bundles[avatar_id] = bundle
+    return bundle
+
+
+def compile_bundle(avatar_id: str, force: bool = False) -> Path:
+    """Render the avatar's base frame, mouth sprites and thumbnails into its bundle"""
+    from PIL import Image
+    from backend.services.lipsync_service import LipSyncService
+
+    path = bundle_path(avatar_id)
+    if not force and path.exists():
+        try:
+            if AvatarBundle(path).is_current(avatar_id):
+                return path
+        except (OSError, ValueError):
+            pass
+
+    source = source_image(avatar_id)
+    lipsync = LipSyncService(avatar_path=source)
+    arrays = {
+        "base": np.ascontiguousarray(lipsync.avatar, dtype=np.uint8),
+        "sprites": lipsync.render_sprites().astype(np.uint8),
+    }
+
+    thumbnail_sizes = []
+    thumbnail_source = avatar_dir(avatar_id) / "thumbnail.jpg"
+    if thumbnail_source.exists():
+        with Image.open(thumbnail_source) as image:
+            image = image.convert("RGB")
+            for size in settings.THUMBNAIL_SIZES:
+                thumb = image.copy()
+                thumb.thumbnail((size, size), Image.LANCZOS)
+                buffer = io.BytesIO()
+                thumb.save(buffer, "JPEG", quality=85, optimize=True, progressive=True)
+                arrays[f"thumbnail_{size}"] = np.frombuffer(buffer.getvalue(), dtype=np.uint8)
+                thumbnail_sizes.append(size)
+
+    header = {
+        "version": BUNDLE_VERSION,
+        "avatar_id": avatar_id,
+        "source": _source_stamp(source),
+        "mouth_region": [int(v) for v in lipsync.mouth_region],
+        "mouth_box": [int(v) for v in lipsync.mouth_box],
+        "thumbnail_sizes": thumbnail_sizes,
+        "arrays": {},
+    }
+    # Offsets depend on the header length, so lay out against a padded header
+    offset = 0
+    for name, array in arrays.items():
+        header["arrays"][name] = {
+            "dtype": array.dtype.str,
+            "shape": list(array.shape),
+            "offset": offset,
+            "nbytes": array.nbytes,
+            "crc32": zlib.crc32(array.tobytes()),
+        }
+        offset += -(-array.nbytes // ALIGNMENT) * ALIGNMENT
+    header_len = len(json.dumps(header)) + 32 * len(arrays)
+    data_start = -(-(len(BUNDLE_MAGIC) + 8 + header_len) // ALIGNMENT) * ALIGNMENT
+    for spec in header["arrays"].values():
+        spec["offset"] += data_start
+    header_bytes = json.dumps(header).encode()
+    if len(header_bytes) > header_len:
+        raise RuntimeError("bundle header outgrew its reserved space")
+    header_bytes = header_bytes.ljust(header_len)
+
+    tmp_path = path.with_suffix(".tmp")
+    with open(tmp_path, 'wb') as f:
+        f.write(BUNDLE_MAGIC + struct.pack("<Q", header_len) + header_bytes)
+        for name, array in arrays.items():
+            f.seek(header["arrays"][name]["offset"])
+            f.write(array.tobytes())
+    os.replace(tmp_path, path)
+    _open_bundles.pop(avatar_id, None)
+    logger.info(f"Compiled {path} ({os.path.getsize(path) / 1e6:.1f} MB)")
+    return path
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Build or validate avatar bundles")
+    parser.add_argument("command", choices=["build", "validate"])
+    parser.add_argument("avatars", nargs="*", help="avatar ids like professional/model_v1 (default: all)")
+    parser.add_argument("--force", action="store_true", help="rebuild even if the bundle is current")
+    args = parser.parse_args(argv)
+
+    failed = 0
+    for avatar_id in args.avatars or list_avatars():
+        if args.command == "build":
+            try:
+                compile_bundle(avatar_id, force=args.force)
+            except Exception as e:
+                failed += 1
+                logger.error(f"{avatar_id}: build failed: {e}")
+            continue
+
+        path = bundle_path(avatar_id)
+        if not path.exists():
+            failed += 1
+            print(f"{avatar_id}: missing bundle")
+            continue
+        try:
+            bundle = AvatarBundle(path)
+            problems = bundle.validate()
+            if not bundle.is_current(avatar_id):
+                problems.append("stale (source image changed)")
+        except (OSError, ValueError) as e:
+            problems = [str(e)]
+        if problems:
+            failed += 1
+        print(f"{avatar_id}: {'; '.join(problems) if problems else 'ok'}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,194 @@
+import asyncio
+import hashlib
+import json
+import os
+from email.utils import formatdate, parsedate_to_datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from loguru import logger
+
+from backend.config import settings
+
+THUMBNAIL_NAME = "thumbnail.jpg"
+
+
+class AvatarCatalog:
+    """In-memory avatar index with pre-rendered thumbnail buckets.
+
+    The catalog is built once at startup and rebuilt only when the avatar
+    tree changes, detected by watchfiles when it is installed and by a cheap
+    mtime signature check every AVATAR_CATALOG_REFRESH seconds. The JSON
+    body, its ETag and Last-Modified are computed per rebuild, so serving
+    the list is a dictionary lookup. Thumbnails are resized into
+    THUMBNAIL_SIZES buckets under THUMBNAIL_CACHE_DIR and addressed by a
+    content-hashed URL, so clients may cache them indefinitely.
+    """
+
+    def __init__(self, avatar_dir: str = None, cache_dir: str = None, sizes: List[int] = None):
+        self.avatar_dir = Path(avatar_dir or settings.AVATAR_DIR)
+        self.cache_dir = Path(cache_dir or settings.THUMBNAIL_CACHE_DIR)
+        self.sizes = sorted(sizes or settings.THUMBNAIL_SIZES)
+
+        self.avatars: List[dict] = []
+        self.ids: set = set()
+        self.body = b'{"avatars": []}'
+        self.etag = '"empty"'
+        self.last_modified = 0.0
+        self.thumbnails: Dict[Tuple[str, int], Path] = {}
+        self._signature = None
+        self._lock = asyncio.Lock()
+        self._tasks: List[asyncio.Task] = []
+        self._stop = asyncio.Event()
+
+    async def start(self):
+        await self.refresh(force=True)
+        self._tasks.append(asyncio.create_task(self._poll()))
+        try:
+            import watchfiles  # noqa: F401
+            self._tasks.append(asyncio.create_task(self._watch()))
+        except ImportError:
+            pass
+
+    async def stop(self):
+        self._stop.set()
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+
+    async def refresh(self, force: bool = False) -> bool:
+        """Rebuild if the avatar tree changed; returns whether it did"""
+        async with self._lock:
+            signature = await asyncio.to_thread(self._scan_signature)
+            if not force and signature == self._signature:
+                return False
+            await asyncio.to_thread(self._build, signature)
+            return True
+
+    async def _poll(self):
+        while not self._stop.is_set():
+            await asyncio.sleep(settings.AVATAR_CATALOG_REFRESH)
+            try:
+                await self.refresh()
+            except Exception as e:
+                logger.warning(f"Avatar catalog refresh failed: {e}")
+
+    async def _watch(self):
+        from watchfiles import awatch
+        try:
+            async for _ in awatch(self.avatar_dir, stop_event=self._stop):
+                await self.refresh()
+        except Exception as e:
+            logger.warning(f"Avatar catalog watcher stopped, relying on polling: {e}")
+
+    def _avatar_dirs(self) -> List[Tuple[str, str, Path]]:
+        found = []
+        for category in settings.AVATAR_MODELS:
+            category_path = self.avatar_dir / category
+            if not category_path.is_dir():
+                continue
+            for entry in sorted(os.scandir(category_path), key=lambda e: e.name):
+                if entry.is_dir():
+                    found.append((category, entry.name, Path(entry.path)))
+        return found
+
+    def _scan_signature(self) -> tuple:
+        # Directory mtimes catch added/removed avatars, thumbnail mtimes catch edits
+        stamps = []
+        for category in settings.AVATAR_MODELS:
+            path = self.avatar_dir / category
+            if path.is_dir():
+                stamps.append((str(path), path.stat().st_mtime_ns))
+        for _, _, path in self._avatar_dirs():
+            thumbnail = path / THUMBNAIL_NAME
+            stamps.append((str(path), path.stat().st_mtime_ns))
+            if thumbnail.exists():
+                stamps.append((str(thumbnail), thumbnail.stat().st_mtime_ns))
+        return tuple(stamps)
+
+    def _build(self, signature: tuple):
+        avatars = []
+        thumbnails = {}
+        last_modified = 0.0
+        for category, name, path in self._avatar_dirs():
+            avatar_id = f"{category}/{name}"
+            last_modified = max(last_modified, path.stat().st_mtime)
+            avatar = {
+                "id": avatar_id,
+                "name": name.replace("_", " ").title(),
+                "category": category,
+                "thumbnail": f"/avatars/{avatar_id}/{THUMBNAIL_NAME}",
+                "thumbnails": {},
+            }
+            source = path / THUMBNAIL_NAME
+            if source.exists():
+                last_modified = max(last_modified, source.stat().st_mtime)
+                for size, (thumb_path, digest) in self._render_thumbnails(avatar_id, source).items():
+                    thumbnails[(avatar_id, size)] = thumb_path
+                    avatar["thumbnails"][str(size)] = f"/api/avatars/{avatar_id}/thumbnail/{size}?v={digest}"
+                if avatar["thumbnails"]:
+                    # Smallest bucket is enough for the selector grid
+                    avatar["thumbnail"] = avatar["thumbnails"][str(self.sizes[0])]
+            avatars.append(avatar)
+
+        body = json.dumps({"avatars": avatars}, separators=(",", ":")).encode()
+        self.avatars = avatars
+        self.ids = {avatar["id"] for avatar in avatars}
+        self.thumbnails = thumbnails
+        self.body = body
+        self.etag = f'"{hashlib.sha1(body).hexdigest()}"'
+        self.last_modified = int(last_modified)
+        self._signature = signature
+        logger.info(f"Avatar catalog built: {len(avatars)} avatars, {len(thumbnails)} thumbnails")
+
+    def _render_thumbnails(self, avatar_id: str, source: Path) -> Dict[int, Tuple[Path, str]]:
+        from PIL import Image
+
+        digest = hashlib.sha1(source.read_bytes()).hexdigest()[:12]
+        out_dir = self.cache_dir / avatar_id
+        rendered = {}
+        image = None
+        try:
+            for size in self.sizes:
+                target = out_dir / f"{size}-{digest}.jpg"
+                if not target.exists():
+                    if image is None:
+                        image = Image.open(source).convert("RGB")
+                    out_dir.mkdir(parents=True, exist_ok=True)
+                    thumb = image.copy()
+                    thumb.thumbnail((size, size), Image.LANCZOS)
+                    thumb.save(target, "JPEG", quality=85, optimize=True, progressive=True)
+                rendered[size] = (target, digest)
+        except OSError as e:
+            logger.warning(f"Thumbnail generation failed for {avatar_id}: {e}")
+        finally:
+            if image is not None:
+                image.close()
+        return rendered
+
+    def __contains__(self, avatar_id: str) -> bool:
+        return avatar_id in self.ids
+
+    def thumbnail_path(self, avatar_id: str, size: int) -> Optional[Path]:
+        """Smallest bucket at least `size` px (or the largest available)"""
+        bucket = next((s for s in self.sizes if s >= size), self.sizes[-1])
+        return self.thumbnails.get((avatar_id, bucket))
+
+    def not_modified(self, if_none_match: Optional[str], if_modified_since: Optional[str]) -> bool:
+        if if_none_match:
+            tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+            return "*" in tags or self.etag in tags
+        if if_modified_since:
+            try:
+                return parsedate_to_datetime(if_modified_since).timestamp() >= self.last_modified
+            except (TypeError, ValueError):
+                return False
+        return False
+
+    def headers(self) -> Dict[str, str]:
+        return {
+            "ETag": self.etag,
+            "Last-Modified": formatdate(self.last_modified, usegmt=True),
+            # Clients may reuse the list but must revalidate (cheap 304)
+            "Cache-Control": "no-cache",
+        }
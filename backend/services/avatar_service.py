@@ -1,47 +1,81 @@
-import cv2
 import numpy as np
-from moviepy.editor import ImageSequenceClip, AudioFileClip, VideoFileClip
 import asyncio
+import hashlib
+import os
+import time
 import uuid
 from pathlib import Path
 from loguru import logger
 from typing import List, Optional
-import aiofiles
+
+from backend.utils.audio import PCMAudio
+from backend.utils.metrics import ERRORS, FRAMES, FRAMES_PER_SECOND, STAGE_SECONDS
+from backend.utils.singleflight import SingleFlight
 
 class AvatarRenderService:
     def __init__(self, output_dir: str = "outputs"):
         self.output_dir = Path(output_dir)
         self.output_dir.mkdir(parents=True, exist_ok=True)
+
+        # Pre-rendered replies, addressed by video cache key
+        self.prerendered_dir = self.output_dir / "prerendered"
+        self.prerendered_dir.mkdir(parents=True, exist_ok=True)
+        self.prerendered = set()
+        for entry in os.scandir(self.prerendered_dir):
+            if entry.name.startswith("."):
+                # Left behind by a render that never finished
+                os.remove(entry.path)
+            elif entry.name.endswith(".mp4"):
+                self.prerendered.add(entry.name[:-len(".mp4")])
+        self.inflight = SingleFlight()
+
+    def video_cache_key(self, tts_key: str, avatar_id: str, mode: str) -> str:
+        return hashlib.sha256(f"{tts_key}|{avatar_id}|{mode}".encode()).hexdigest()
+
+    def cached_video(self, cache_key: str) -> Optional[str]:
+        if cache_key in self.prerendered:
+            return str(self.prerendered_dir / f"{cache_key}.mp4")
+        return None
         
     async def render_video(
         self, 
         frames: List[np.ndarray], 
-        audio_data: bytes,
+        audio: PCMAudio,
         fps: int = 30,
-        quality: str = "high"
+        quality: str = "high",
+        cache_key: Optional[str] = None
     ) -> Optional[str]:
-        """Render video from frames and audio"""
+        """Render video from frames and audio; with `cache_key` it is kept as a pre-rendered reply"""
+        # OpenCV and moviepy are only needed once something is rendered
+        import cv2
         try:
-            video_id = str(uuid.uuid4())
-            video_path = self.output_dir / f"{video_id}.mp4"
-            temp_audio = self.output_dir / f"{video_id}_audio.mp3"
-            
-            # Save audio temporarily
-            async with aiofiles.open(temp_audio, 'wb') as f:
-                await f.write(audio_data)
-                
-            # Convert frames to RGB
-            rgb_frames = []
-            for frame in frames:
+            from moviepy import AudioArrayClip, VideoClip
+        except ImportError:  # moviepy 1.x only exports these from moviepy.editor
+            from moviepy.editor import VideoClip
+            from moviepy.audio.AudioClip import AudioArrayClip
+        started = time.perf_counter()
+        if cache_key:
+            video_path = self.prerendered_dir / f"{cache_key}.mp4"
+        else:
+            video_path = self.output_dir / f"{uuid.uuid4()}.mp4"
+        # Encode under a hidden name next to the target and move it into place
+        # only once complete, so a failed render never leaves a truncated file
+        partial_path = video_path.with_name(f".{video_path.stem}-{uuid.uuid4().hex[:8]}.mp4")
+        partial_audio = partial_path.with_suffix(".m4a")
+        try:
+            # Convert each frame to RGB as the encoder asks for it
+            # instead of holding a converted copy of the whole reply
+            def frame_at(t: float) -> np.ndarray:
+                frame = frames[min(int(round(t * fps)), len(frames) - 1)]
                 if len(frame.shape) == 3:
                     if frame.shape[2] == 4:  # RGBA
                         frame = cv2.cvtColor(frame, cv2.COLOR_RGBA2RGB)
                     elif frame.shape[2] == 3:
                         frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                rgb_frames.append(frame)
-                
+                return frame
+
             # Create video clip
-            clip = ImageSequenceClip(rgb_frames, fps=fps)
+            clip = VideoClip(frame_at, duration=len(frames) / fps)
             
             # Set quality parameters
             if quality == "high":
@@ -51,35 +85,49 @@ class AvatarRenderService:
                 bitrate = "2000k"
                 codec = "libx264"
                 
-            # Add audio
-            audio_clip = AudioFileClip(str(temp_audio))
-            final_clip = clip.set_audio(audio_clip)
+            # Add audio straight from the decoded buffer; it is encoded only here
+            # (as stereo: moviepy 2.x stretches a mono array to twice its length)
+            audio_clip = AudioArrayClip(np.repeat(audio.samples[:, None], 2, axis=1), fps=audio.sample_rate)
+            if hasattr(clip, "with_audio"):  # moviepy 2.x
+                final_clip = clip.with_audio(audio_clip)
+            else:
+                final_clip = clip.set_audio(audio_clip)
             
-            # Write video
-            final_clip.write_videofile(
-                str(video_path),
+            # Write video (encoding is CPU-bound, keep it off the event loop)
+            await asyncio.to_thread(
+                final_clip.write_videofile,
+                str(partial_path),
                 codec=codec,
                 audio_codec='aac',
                 bitrate=bitrate,
                 preset='medium',
                 fps=fps,
+                temp_audiofile=str(partial_audio),
                 logger=None
             )
-            
-            # Cleanup
-            temp_audio.unlink()
+            os.replace(partial_path, video_path)
+            if cache_key:
+                self.prerendered.add(cache_key)
+
+            elapsed = time.perf_counter() - started
+            STAGE_SECONDS.labels("render").observe(elapsed)
+            FRAMES.labels("render").inc(len(frames))
+            FRAMES_PER_SECOND.labels("render").set(len(frames) / elapsed)
             
             logger.info(f"Video rendered: {video_path}")
             return str(video_path)
             
         except Exception as e:
+            ERRORS.labels("render").inc()
             logger.error(f"Video rendering error: {e}")
-            if temp_audio.exists():
-                temp_audio.unlink()
+            for path in (partial_path, partial_audio):
+                if path.exists():
+                    path.unlink()
             return None
             
     async def render_stream(self, frames: List[np.ndarray], fps: int = 30):
         """Render video stream (for WebRTC)"""
+        import cv2
         for frame in frames:
             # Encode frame
             ret, buffer = cv2.imencode('.jpg', frame)
@@ -88,6 +136,7 @@ class AvatarRenderService:
     async def add_watermark(self, video_path: str, watermark_text: str = "AI Avatar") -> str:
         """Add watermark to video"""
         try:
+            from moviepy.editor import VideoFileClip
             video = VideoFileClip(video_path)
             
             # Create watermark
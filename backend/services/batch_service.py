@@ -0,0 +1,496 @@
+import asyncio
+import ipaddress
+import multiprocessing
+import os
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+from pathlib import Path
+from loguru import logger
+from typing import Iterable, List, Optional
+from urllib.parse import urlsplit
+
+from backend.config import settings
+from backend.services.session_store import async_database_url
+from backend.utils.metrics import BATCH_ITEMS, ERRORS, QUEUE_DEPTH, STAGE_SECONDS
+
+ITEM_STATES = ("queued", "running", "done", "error")
+
+# Per-process services of a render worker, set up once by _init_worker
+_worker: Optional["_RenderWorker"] = None
+
+
+class _RenderWorker:
+    """Services one worker process keeps for its lifetime, keyed by voice and avatar"""
+
+    def __init__(self, renderer_class):
+        from backend.services.viseme_service import VisemeService
+
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.viseme = VisemeService()
+        self.render = renderer_class(output_dir=settings.OUTPUT_DIR)
+        self.tts = {}
+        self.lipsync = {}
+        self.tts_slots = asyncio.Semaphore(settings.BATCH_TTS_CONCURRENCY)
+
+    async def open_voice(self, voice: Optional[str]):
+        from backend.services.tts_service import TextToSpeechService
+
+        if voice not in self.tts:
+            # Voices are named "<language>-<region>-<name>"
+            options = {"voice": voice, "language": "-".join(voice.split("-")[:2])} if voice else {}
+            tts = TextToSpeechService(engine=settings.TTS_ENGINE, **options)
+            await tts.start()
+            self.tts[voice] = tts
+        return self.tts[voice]
+
+    def lipsync_for(self, avatar_id: str):
+        from backend.services.lipsync_service import LipSyncService
+
+        if avatar_id not in self.lipsync:
+            self.lipsync[avatar_id] = LipSyncService.for_avatar(avatar_id)
+        return self.lipsync[avatar_id]
+
+    async def render_chunk(self, items: List[dict]) -> List[dict]:
+        # The whole chunk is synthesized together: requests overlap on the
+        # pooled clients and repeated lines share one synthesis
+        for voice in {item["voice"] for item in items}:
+            await self.open_voice(voice)
+        speech = await asyncio.gather(*(self._synthesize(item) for item in items), return_exceptions=True)
+        results = []
+        for item, spoken in zip(items, speech):
+            started = time.perf_counter()
+            try:
+                if isinstance(spoken, BaseException):
+                    raise spoken
+                video_path, duration = await self._render_item(item, *spoken)
+                results.append({"id": item["id"], "status": "done", "video_path": video_path, "duration": duration,
+                                "seconds": time.perf_counter() - started})
+            except Exception as e:
+                logger.warning(f"Batch item {item['job_id']}/{item['index']} failed: {e}")
+                results.append({"id": item["id"], "status": "error", "error": str(e)[:500] or type(e).__name__})
+        return results
+
+    async def _synthesize(self, item: dict):
+        tts = self.tts[item["voice"]]
+        async with self.tts_slots:
+            audio, timings = await tts.synthesize(item["text"])
+        if audio is None or not len(audio):
+            raise RuntimeError("TTS failed")
+        return audio, timings
+
+    async def _render_item(self, item: dict, audio, timings):
+        import cv2
+
+        timeline = self.viseme.generate_visemes(timings, self.tts[item["voice"]].language)
+        frames = self.lipsync_for(item["avatar_id"]).animate(audio, timeline)
+        if item["width"] and item["height"]:
+            size = (item["width"], item["height"])
+            frames = [cv2.resize(frame, size, interpolation=cv2.INTER_AREA) for frame in frames]
+        video_path = await self.render.render_video(frames, audio)
+        if not video_path:
+            raise RuntimeError("render failed")
+        target = Path(settings.OUTPUT_DIR) / "batch" / item["job_id"] / f"{item['index']:05d}.mp4"
+        target.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(video_path, target)
+        return str(target), audio.duration
+
+
+async def callback_url_error(url: str) -> Optional[str]:
+    """Why job callbacks may not go to `url`, or None if they may.
+
+    With BATCH_CALLBACK_HOSTS set, only those hosts are allowed. Otherwise
+    any public http(s) host is, but not one that resolves to a loopback,
+    private, link-local or otherwise internal address.
+    """
+    parts = urlsplit(url)
+    if parts.scheme not in ("http", "https") or not parts.hostname:
+        return "callback_url must be an http(s) URL"
+    if settings.BATCH_CALLBACK_HOSTS:
+        return None if parts.hostname in settings.BATCH_CALLBACK_HOSTS else "callback host is not allowed"
+    try:
+        addresses = await asyncio.get_running_loop().getaddrinfo(parts.hostname, parts.port or 443)
+    except OSError:
+        return "callback host does not resolve"
+    for *_, sockaddr in addresses:
+        address = ipaddress.ip_address(sockaddr[0].split("%")[0])
+        if not address.is_global or address.is_multicast:
+            return "callback host is not a public address"
+    return None
+
+
+def _init_worker(renderer_class, nice: int):
+    global _worker
+    if nice and hasattr(os, "nice"):
+        os.nice(nice)
+    _worker = _RenderWorker(renderer_class)
+
+
+def _render_chunk(items: List[dict]) -> List[dict]:
+    return _worker.loop.run_until_complete(_worker.render_chunk(items))
+
+
+class BatchService:
+    """Offline rendering of scripted videos, submitted in bulk.
+
+    Jobs and their items live in the database, so a submitted job survives
+    a restart: items a stopped server was rendering are queued again.
+    A dispatcher hands chunks of BATCH_CHUNK_SIZE items to a pool of
+    BATCH_WORKERS processes, one chunk per process at a time; workers run
+    at BATCH_NICE and the default pool leaves a core free, so interactive
+    sessions keep priority. When a worker dies, every item the pool was
+    running becomes a suspect and is re-run alone, with nothing else in
+    flight; only a death then counts against the item, and one that kills
+    its worker BATCH_MAX_ATTEMPTS times is failed. Only one server per
+    database should render (BATCH_WORKERS=0 on the others), since starting
+    up re-queues every running item.
+    """
+
+    def __init__(self, renderer_class, database_url: str = None, workers: int = None):
+        self.database_url = async_database_url(database_url or settings.DATABASE_URL)
+        self.renderer_class = renderer_class
+        if workers is None:
+            workers = settings.BATCH_WORKERS
+        self.workers = workers if workers is not None else max(1, (os.cpu_count() or 1) - 1)
+        self.engine = None
+        self.enabled = False
+        self.pool: Optional[ProcessPoolExecutor] = None
+        self._task: Optional[asyncio.Task] = None
+        self._chunks = set()
+        self._solo: Optional[asyncio.Task] = None
+        self._callbacks = set()
+        self._wakeup = asyncio.Event()
+        self.queued = 0
+        self.pool_restarts = 0
+        QUEUE_DEPTH.labels("batch").set_function(lambda: self.queued)
+
+    async def start(self):
+        from sqlalchemy import select, update
+        from sqlalchemy.ext.asyncio import create_async_engine
+        from backend.models.avatar_model import Base, BatchItem, BatchJob
+
+        engine_options = {"pool_pre_ping": True}
+        if not self.database_url.startswith("sqlite"):
+            engine_options["pool_size"] = settings.DB_POOL_SIZE
+        self.engine = create_async_engine(self.database_url, **engine_options)
+        async with self.engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        self.enabled = True
+        if not self.workers:
+            logger.info("Batch rendering accepts jobs only (BATCH_WORKERS=0)")
+            return
+
+        # Whatever was rendering when the last process stopped starts over
+        items, jobs = BatchItem.__table__, BatchJob.__table__
+        async with self.engine.connect() as conn:
+            interrupted = (await conn.execute(select(items.c.id).where(items.c.status == "running"))).scalars().all()
+            undelivered = (await conn.execute(select(jobs.c.job_id).where(
+                jobs.c.status == "done", jobs.c.callback_url.is_not(None), jobs.c.callback_sent.is_(False)
+            ))).scalars().all()
+        if interrupted:
+            logger.info(f"Re-queueing {len(interrupted)} interrupted batch items")
+            async with self.engine.begin() as conn:
+                await conn.execute(update(items).where(items.c.id.in_(interrupted)).values(status="queued"))
+        for job_id in undelivered:
+            self._notify(job_id)
+
+        self.pool = self._new_pool()
+        self._task = asyncio.create_task(self._run())
+        logger.info(f"Batch rendering on {self.workers} worker processes (nice {settings.BATCH_NICE})")
+
+    async def stop(self):
+        """Stop dispatching; items still rendering are re-queued on the next start"""
+        self.enabled = False
+        for task in [self._task, *self._chunks, *self._callbacks]:
+            if task:
+                task.cancel()
+        if self.pool:
+            self.pool.shutdown(wait=False, cancel_futures=True)
+            self.pool = None
+        if self.engine:
+            await self.engine.dispose()
+
+    def _new_pool(self) -> ProcessPoolExecutor:
+        # Spawned rather than forked, so workers inherit no event loop, engine or peer connections
+        return ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(self.renderer_class, settings.BATCH_NICE),
+        )
+
+    async def submit(self, items: List[dict], callback_url: Optional[str] = None) -> str:
+        """Queue items ({text, avatar_id, voice, width, height}) as one job; returns its id"""
+        from sqlalchemy import insert
+        from backend.models.avatar_model import BatchItem, BatchJob
+
+        job_id = str(uuid.uuid4())
+        now = datetime.utcnow()
+        async with self.engine.begin() as conn:
+            await conn.execute(insert(BatchJob.__table__), {
+                "job_id": job_id, "status": "queued", "total": len(items), "callback_url": callback_url,
+                "callback_sent": False, "created_at": now,
+            })
+            await conn.execute(insert(BatchItem.__table__), [
+                {
+                    "job_id": job_id, "index": index, "text": item["text"], "avatar_id": item["avatar_id"],
+                    "voice": item.get("voice"), "width": item.get("width"), "height": item.get("height"),
+                    "status": "queued", "attempts": 0, "isolated": False, "crashes": 0,
+                    "updated_at": now,
+                }
+                for index, item in enumerate(items)
+            ])
+        logger.info(f"Batch job {job_id}: {len(items)} items queued")
+        self._wakeup.set()
+        return job_id
+
+    async def job_status(self, job_id: str, include_items: bool = False) -> Optional[dict]:
+        from sqlalchemy import func, select
+        from backend.models.avatar_model import BatchItem, BatchJob
+
+        items, jobs = BatchItem.__table__, BatchJob.__table__
+        async with self.engine.connect() as conn:
+            job = (await conn.execute(select(jobs).where(jobs.c.job_id == job_id))).mappings().first()
+            if job is None:
+                return None
+            counts = dict((await conn.execute(
+                select(items.c.status, func.count()).where(items.c.job_id == job_id).group_by(items.c.status)
+            )).all())
+            rows = []
+            if include_items:
+                rows = (await conn.execute(
+                    select(items.c.index, items.c.status, items.c.attempts, items.c.duration, items.c.error)
+                    .where(items.c.job_id == job_id).order_by(items.c.index)
+                )).mappings().all()
+
+        finished = counts.get("done", 0) + counts.get("error", 0)
+        status = {
+            "job_id": job_id,
+            "status": job["status"],
+            "total": job["total"],
+            "counts": {state: counts.get(state, 0) for state in ITEM_STATES},
+            "progress": finished / job["total"] if job["total"] else 1.0,
+            "created_at": job["created_at"].isoformat(),
+            "finished_at": job["finished_at"].isoformat() if job["finished_at"] else None,
+        }
+        if include_items:
+            status["items"] = [
+                {**row, "video_url": self.video_url(job_id, row["index"]) if row["status"] == "done" else None}
+                for row in rows
+            ]
+        return status
+
+    @staticmethod
+    def video_url(job_id: str, index: int) -> str:
+        return f"/api/batch/jobs/{job_id}/items/{index}/video"
+
+    async def video_path(self, job_id: str, index: int) -> Optional[str]:
+        from sqlalchemy import select
+        from backend.models.avatar_model import BatchItem
+
+        items = BatchItem.__table__
+        async with self.engine.connect() as conn:
+            return (await conn.execute(select(items.c.video_path).where(
+                items.c.job_id == job_id, items.c.index == index, items.c.status == "done"
+            ))).scalar()
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            while len(self._chunks) < self.workers and self._solo is None:
+                chunk = await self._claim(settings.BATCH_CHUNK_SIZE, alone=not self._chunks)
+                if not chunk:
+                    break
+                task = asyncio.create_task(self._process(chunk))
+                self._chunks.add(task)
+                task.add_done_callback(self._chunk_done)
+                if chunk[0]["isolated"]:
+                    self._solo = task
+            await self._count_queued()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), settings.BATCH_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+
+    def _chunk_done(self, task: asyncio.Task):
+        self._chunks.discard(task)
+        if task is self._solo:
+            self._solo = None
+        if not task.cancelled() and task.exception():
+            logger.error(f"Batch chunk failed: {task.exception()}")
+        self._wakeup.set()
+
+    async def _claim(self, count: int, alone: bool) -> List[dict]:
+        """Claim up to `count` queued items; a suspect is claimed by itself, and only when `alone`"""
+        from sqlalchemy import select, update
+        from backend.models.avatar_model import BatchItem, BatchJob
+
+        items, jobs = BatchItem.__table__, BatchJob.__table__
+        async with self.engine.begin() as conn:
+            ids = (await conn.execute(
+                select(items.c.id).where(items.c.status == "queued", items.c.isolated.is_(True))
+                .order_by(items.c.id).limit(1)
+            )).scalars().all()
+            if ids and not alone:
+                # Wait for the pool to drain so a death can be pinned on the suspect
+                return []
+            if not ids:
+                ids = (await conn.execute(
+                    select(items.c.id).where(items.c.status == "queued").order_by(items.c.id).limit(count)
+                )).scalars().all()
+            if not ids:
+                return []
+            await conn.execute(update(items).where(items.c.id.in_(ids)).values(
+                status="running", attempts=items.c.attempts + 1, updated_at=datetime.utcnow()
+            ))
+            rows = (await conn.execute(
+                select(items.c.id, items.c.job_id, items.c.index, items.c.text, items.c.avatar_id,
+                       items.c.voice, items.c.width, items.c.height, items.c.isolated).where(items.c.id.in_(ids))
+            )).mappings().all()
+            await conn.execute(update(jobs).where(
+                jobs.c.job_id.in_({row["job_id"] for row in rows}), jobs.c.status == "queued"
+            ).values(status="running"))
+        return [dict(row) for row in rows]
+
+    async def _process(self, chunk: List[dict]):
+        pool = self.pool
+        started = time.perf_counter()
+        try:
+            results = await asyncio.get_running_loop().run_in_executor(pool, _render_chunk, chunk)
+        except BrokenProcessPool:
+            # A worker died (crash, OOM kill). Every chunk on the pool fails
+            # with it, so only an item that was running alone is to blame
+            ERRORS.labels("batch").inc()
+            if self.pool is pool and self.enabled:
+                logger.warning("Batch worker died, restarting the pool")
+                pool.shutdown(wait=False)
+                self.pool = self._new_pool()
+                self.pool_restarts += 1
+            await self._requeue([item["id"] for item in chunk], crashed=chunk[0]["isolated"])
+            return
+        except Exception as e:
+            ERRORS.labels("batch").inc()
+            results = [{"id": item["id"], "status": "error", "error": str(e)[:500]} for item in chunk]
+
+        STAGE_SECONDS.labels("batch_chunk").observe(time.perf_counter() - started)
+        for result in results:
+            BATCH_ITEMS.labels(result["status"]).inc()
+            if "seconds" in result:
+                STAGE_SECONDS.labels("batch_item").observe(result["seconds"])
+        await self._record(results, {item["job_id"] for item in chunk})
+
+    async def _record(self, results: List[dict], job_ids: Iterable[str]):
+        from sqlalchemy import update
+        from backend.models.avatar_model import BatchItem
+
+        items = BatchItem.__table__
+        async with self.engine.begin() as conn:
+            for result in results:
+                fields = {key: result[key] for key in ("status", "video_path", "duration", "error") if key in result}
+                await conn.execute(update(items).where(items.c.id == result["id"]).values(
+                    **fields, updated_at=datetime.utcnow()
+                ))
+            finished = await self._finish_jobs(conn, job_ids)
+        for job_id in finished:
+            self._notify(job_id)
+
+    async def _requeue(self, ids: List[int], crashed: bool):
+        """Queue items from a broken pool again as suspects; `crashed` ones killed their worker alone"""
+        from sqlalchemy import select, update
+        from backend.models.avatar_model import BatchItem
+
+        items = BatchItem.__table__
+        async with self.engine.begin() as conn:
+            if crashed:
+                await conn.execute(update(items).where(items.c.id.in_(ids)).values(crashes=items.c.crashes + 1))
+            await conn.execute(update(items).where(
+                items.c.id.in_(ids), items.c.crashes < settings.BATCH_MAX_ATTEMPTS
+            ).values(status="queued", isolated=True, updated_at=datetime.utcnow()))
+            await conn.execute(update(items).where(
+                items.c.id.in_(ids), items.c.status == "running"
+            ).values(status="error", error=f"killed its worker {settings.BATCH_MAX_ATTEMPTS} times",
+                     updated_at=datetime.utcnow()))
+            job_ids = (await conn.execute(select(items.c.job_id).where(items.c.id.in_(ids)).distinct())).scalars().all()
+            finished = await self._finish_jobs(conn, job_ids)
+        for job_id in finished:
+            self._notify(job_id)
+        self._wakeup.set()
+
+    async def _finish_jobs(self, conn, job_ids: Iterable[str]) -> List[str]:
+        """Mark jobs with nothing left to render as done; returns those needing a callback"""
+        from sqlalchemy import select, update
+        from backend.models.avatar_model import BatchItem, BatchJob
+
+        items, jobs = BatchItem.__table__, BatchJob.__table__
+        finished = []
+        for job_id in job_ids:
+            pending = (await conn.execute(select(items.c.id).where(
+                items.c.job_id == job_id, items.c.status.in_(("queued", "running"))
+            ).limit(1))).first()
+            if pending:
+                continue
+            result = await conn.execute(update(jobs).where(jobs.c.job_id == job_id, jobs.c.status != "done").values(
+                status="done", finished_at=datetime.utcnow()
+            ))
+            if result.rowcount:
+                logger.info(f"Batch job {job_id} finished")
+                callback = (await conn.execute(select(jobs.c.callback_url).where(jobs.c.job_id == job_id))).scalar()
+                if callback:
+                    finished.append(job_id)
+        return finished
+
+    async def _count_queued(self):
+        from sqlalchemy import func, select
+        from backend.models.avatar_model import BatchItem
+
+        items = BatchItem.__table__
+        async with self.engine.connect() as conn:
+            self.queued = (await conn.execute(
+                select(func.count()).select_from(items).where(items.c.status == "queued")
+            )).scalar()
+
+    def _notify(self, job_id: str):
+        task = asyncio.create_task(self._send_callback(job_id))
+        self._callbacks.add(task)
+        task.add_done_callback(self._callbacks.discard)
+
+    async def _send_callback(self, job_id: str):
+        """POST the finished job's status to its callback URL, retrying with backoff"""
+        import httpx
+        from sqlalchemy import select, update
+        from backend.models.avatar_model import BatchJob
+
+        jobs = BatchJob.__table__
+        async with self.engine.connect() as conn:
+            url = (await conn.execute(select(jobs.c.callback_url).where(jobs.c.job_id == job_id))).scalar()
+        # Checked again at send time, in case the host now resolves elsewhere
+        error = await callback_url_error(url)
+        if error:
+            logger.warning(f"Callback for batch job {job_id} to {url} skipped: {error}")
+            return
+        status = await self.job_status(job_id, include_items=True)
+        for attempt in range(settings.BATCH_CALLBACK_RETRIES):
+            try:
+                async with httpx.AsyncClient(timeout=10) as client:
+                    response = await client.post(url, json=status)
+                if response.status_code < 400:
+                    async with self.engine.begin() as conn:
+                        await conn.execute(update(jobs).where(jobs.c.job_id == job_id).values(callback_sent=True))
+                    return
+                error = f"HTTP {response.status_code}"
+            except Exception as e:
+                error = e
+            await asyncio.sleep(2 ** attempt)
+        logger.warning(f"Callback for batch job {job_id} to {url} failed: {error}")
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "workers": self.workers,
+            "queued": self.queued,
+            "rendering": len(self._chunks),
+            "pool_restarts": self.pool_restarts,
+        }
@@ -0,0 +1,407 @@
+import asyncio
+import fractions
+import os
+import shutil
+import threading
+import time
+import uuid
+from typing import Dict, List, Optional, Tuple
+
+import av
+from aiortc import MediaStreamTrack
+from aiortc.mediastreams import MediaStreamError
+from loguru import logger
+
+from backend.config import settings
+from backend.services.streaming_service import VIDEO_TIME_BASE, LiveAvatarSource
+from backend.utils.metrics import BYTES_OUT, ERRORS, FRAMES, QUEUE_DEPTH, STAGE_SECONDS, metrics
+
+AUDIO_SAMPLE_RATE = 48000
+AUDIO_TIME_BASE = fractions.Fraction(1, AUDIO_SAMPLE_RATE)
+OPUS_FRAME_SIZE = 960
+# Least time between keyframes forced for joining viewers
+MIN_FORCED_KEYFRAME_GAP = 1.0
+
+BROADCAST_VIEWERS = metrics.gauge("broadcast_viewers", "Viewers subscribed to broadcasts", ("transport",))
+
+
+class EncodedPacket:
+    """One encoded audio or video packet, shared read-only by every subscriber"""
+    __slots__ = ("kind", "data", "pts", "time_base", "keyframe")
+
+    def __init__(self, kind: str, data: bytes, pts: int, time_base: fractions.Fraction, keyframe: bool):
+        self.kind = kind
+        self.data = data
+        self.pts = pts
+        self.time_base = time_base
+        self.keyframe = keyframe
+
+    def to_av(self) -> av.Packet:
+        packet = av.Packet(self.data)
+        packet.pts = packet.dts = self.pts
+        packet.time_base = self.time_base
+        return packet
+
+
+class RelayTrack(MediaStreamTrack):
+    """A viewer's copy of a broadcast track: packed for its peer, never re-encoded.
+
+    Video starts at a keyframe. A viewer that falls BROADCAST_VIEWER_QUEUE
+    packets behind has its backlog dropped and video waits for the next
+    keyframe again, so one slow link never holds back the encoder.
+    """
+
+    def __init__(self, kind: str):
+        super().__init__()
+        self.kind = kind
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=settings.BROADCAST_VIEWER_QUEUE)
+        self.waiting_keyframe = kind == "video"
+        self.dropped = 0
+
+    def offer(self, packet: EncodedPacket):
+        if self.waiting_keyframe:
+            if not packet.keyframe:
+                return
+            self.waiting_keyframe = False
+        try:
+            self.queue.put_nowait(packet)
+        except asyncio.QueueFull:
+            self.dropped += self.queue.qsize() + 1
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.waiting_keyframe = self.kind == "video"
+
+    async def recv(self) -> av.Packet:
+        if self.readyState != "live":
+            raise MediaStreamError
+        packet = await self.queue.get()
+        BYTES_OUT.labels("webrtc_broadcast").inc(len(packet.data))
+        return packet.to_av()
+
+
+class HlsWriter:
+    """HLS rendition of a broadcast: the shared H.264 packets are muxed as-is.
+
+    Audio is encoded once more as AAC, which HLS players expect. Muxing runs
+    in a worker thread; segments land under OUTPUT_DIR and are served by
+    the /outputs mount until the broadcast ends. A muxing error turns the
+    rendition off rather than letting packets pile up behind it.
+    """
+
+    def __init__(self, directory: str, width: int, height: int, fps: int):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.playlist = os.path.join(directory, "index.m3u8")
+        self.container = av.open(self.playlist, "w", format="hls", options={
+            "hls_time": str(settings.BROADCAST_HLS_SEGMENT),
+            "hls_list_size": "6",
+            "hls_flags": "delete_segments+independent_segments",
+        })
+        self.video = self.container.add_stream("h264", rate=fps)
+        self.video.width, self.video.height = width, height
+        self.video.pix_fmt = "yuv420p"
+        self.video.time_base = VIDEO_TIME_BASE
+        self.audio = self.container.add_stream("aac", rate=AUDIO_SAMPLE_RATE)
+        self.audio.layout = "mono"
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self._started = False
+        self.failed = False
+        # close() can run while a cancelled batch is still being muxed in its thread
+        self._lock = threading.Lock()
+        self._task = asyncio.create_task(self._run())
+
+    def offer_video(self, packet: EncodedPacket):
+        if self.failed:
+            return
+        # Segments must open on a keyframe
+        if self._started or packet.keyframe:
+            self._started = True
+            self.queue.put_nowait(packet)
+
+    def offer_audio(self, frame: av.AudioFrame):
+        if self._started and not self.failed:
+            self.queue.put_nowait(frame)
+
+    async def _run(self):
+        while True:
+            batch = [await self.queue.get()]
+            while not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+            QUEUE_DEPTH.labels("hls").set(len(batch))
+            try:
+                await asyncio.to_thread(self._write, batch)
+            except Exception as e:
+                # The container cannot be trusted after a failed mux
+                ERRORS.labels("broadcast").inc()
+                logger.error(f"HLS muxing failed, disabling {self.playlist}: {e}")
+                self.failed = True
+                while not self.queue.empty():
+                    self.queue.get_nowait()
+                return
+
+    def _write(self, batch: list):
+        with self._lock:
+            self._mux(batch)
+
+    def _mux(self, batch: list):
+        for item in batch:
+            if isinstance(item, EncodedPacket):
+                packet = item.to_av()
+                packet.is_keyframe = item.keyframe
+                packet.stream = self.video
+                self.container.mux(packet)
+            else:
+                for packet in self.audio.encode(item):
+                    self.container.mux(packet)
+
+    async def close(self):
+        self._task.cancel()
+        batch = []
+        while not self.queue.empty():
+            batch.append(self.queue.get_nowait())
+        await asyncio.to_thread(self._close, batch)
+
+    def _close(self, batch: list):
+        with self._lock:
+            try:
+                self._mux(batch)
+                for packet in self.audio.encode(None):
+                    self.container.mux(packet)
+            finally:
+                self.container.close()
+
+
+class Broadcast:
+    """One speaker's live avatar, encoded once and fanned out to every viewer.
+
+    Two pump tasks pull the paced audio and video from the speaker's
+    LiveAvatarSource, encode them once (H.264 Constrained Baseline and
+    Opus, which every browser decodes) and hand the packets to each
+    viewer's RelayTracks and to the HLS writer. Encode cost depends on
+    the number of broadcasts; a viewer adds only RTP packing.
+    """
+
+    def __init__(self, broadcast_id: str, host_id: str, source: LiveAvatarSource):
+        self.id = broadcast_id
+        self.host_id = host_id
+        self.source = source
+        self.created_at = time.time()
+        self.viewers: Dict[str, Tuple[RelayTrack, RelayTrack]] = {}
+        self.hls: Optional[HlsWriter] = None
+        self.hls_url = f"/outputs/broadcast/{broadcast_id}/index.m3u8" if settings.BROADCAST_HLS else None
+        self.packets = 0
+        self._video_codec = None
+        self._audio_codec = None
+        self._resampler = av.AudioResampler(format="s16", layout="stereo", rate=AUDIO_SAMPLE_RATE,
+                                            frame_size=OPUS_FRAME_SIZE)
+        self._force_keyframe = False
+        self._last_keyframe = 0.0
+        self._tasks: List[asyncio.Task] = []
+
+    def start(self):
+        self._tasks = [asyncio.create_task(self._pump_video()), asyncio.create_task(self._pump_audio())]
+
+    def add_viewer(self, viewer_id: str) -> Tuple[RelayTrack, RelayTrack]:
+        tracks = (RelayTrack("audio"), RelayTrack("video"))
+        self.viewers[viewer_id] = tracks
+        self.request_keyframe()
+        return tracks
+
+    def remove_viewer(self, viewer_id: str):
+        tracks = self.viewers.pop(viewer_id, None)
+        for track in tracks or ():
+            track.stop()
+
+    def request_keyframe(self):
+        """Let a joining viewer start soon instead of waiting out the GOP"""
+        self._force_keyframe = True
+
+    def stats(self) -> dict:
+        return {
+            "broadcast_id": self.id,
+            "viewers": len(self.viewers),
+            "packets": self.packets,
+            "viewer_drops": sum(track.dropped for tracks in self.viewers.values() for track in tracks),
+            "hls_url": None if self.hls and self.hls.failed else self.hls_url,
+            "video": self.source.video.stats(),
+        }
+
+    def _video_encoder(self, frame: av.VideoFrame):
+        codec = av.CodecContext.create("libx264", "w")
+        codec.width, codec.height = frame.width, frame.height
+        codec.pix_fmt = "yuv420p"
+        codec.time_base = VIDEO_TIME_BASE
+        codec.framerate = fractions.Fraction(self.source.fps, 1)
+        codec.gop_size = max(1, int(self.source.fps * settings.BROADCAST_KEYFRAME_INTERVAL))
+        codec.bit_rate = settings.BROADCAST_VIDEO_BITRATE
+        codec.profile = "Baseline"
+        codec.options = {"tune": "zerolatency"}
+        return codec
+
+    def _encode_video(self, frame: av.VideoFrame) -> List[EncodedPacket]:
+        if self._video_codec is None:
+            self._video_codec = self._video_encoder(frame)
+            if settings.BROADCAST_HLS:
+                directory = os.path.join(settings.OUTPUT_DIR, "broadcast", self.id)
+                self.hls = HlsWriter(directory, frame.width, frame.height, self.source.fps)
+        # Requests are held until MIN_FORCED_KEYFRAME_GAP has passed, so a burst of joins costs one keyframe
+        force = self._force_keyframe and time.monotonic() - self._last_keyframe >= MIN_FORCED_KEYFRAME_GAP
+        if force:
+            self._force_keyframe = False
+        # Frames can be reused objects, so the picture type is always set
+        frame.pict_type = av.video.frame.PictureType.I if force else av.video.frame.PictureType.NONE
+        return [
+            EncodedPacket("video", bytes(packet), packet.pts, VIDEO_TIME_BASE, packet.is_keyframe)
+            for packet in self._video_codec.encode(frame)
+        ]
+
+    def _encode_audio(self, frame: av.AudioFrame) -> List[EncodedPacket]:
+        if self._audio_codec is None:
+            codec = self._audio_codec = av.CodecContext.create("libopus", "w")
+            codec.sample_rate = AUDIO_SAMPLE_RATE
+            codec.layout = "stereo"
+            codec.format = "s16"
+            codec.time_base = AUDIO_TIME_BASE
+            codec.bit_rate = settings.BROADCAST_AUDIO_BITRATE
+            codec.options = {"application": "voip"}
+        packets = []
+        for resampled in self._resampler.resample(frame):
+            for packet in self._audio_codec.encode(resampled):
+                packets.append(EncodedPacket("audio", bytes(packet), packet.pts, AUDIO_TIME_BASE, True))
+        return packets
+
+    async def _pump_video(self):
+        track = self.source.video
+        while True:
+            try:
+                frame = await track.recv()
+                # HlsWriter is created here on the first frame, so it needs the loop thread
+                if self._video_codec is None:
+                    packets = self._encode_video(frame)
+                else:
+                    started = time.perf_counter()
+                    packets = await asyncio.to_thread(self._encode_video, frame)
+                    STAGE_SECONDS.labels("broadcast_encode").observe(time.perf_counter() - started)
+                FRAMES.labels("broadcast").inc()
+            except MediaStreamError:
+                return
+            except Exception as e:
+                ERRORS.labels("broadcast").inc()
+                logger.error(f"Broadcast {self.id} video error: {e}")
+                continue
+            for packet in packets:
+                if packet.keyframe:
+                    self._last_keyframe = time.monotonic()
+                self._publish(packet)
+                if self.hls:
+                    self.hls.offer_video(packet)
+
+    async def _pump_audio(self):
+        track = self.source.audio
+        while True:
+            try:
+                frame = await track.recv()
+                packets = self._encode_audio(frame)
+            except MediaStreamError:
+                return
+            except Exception as e:
+                ERRORS.labels("broadcast").inc()
+                logger.error(f"Broadcast {self.id} audio error: {e}")
+                continue
+            if self.hls:
+                self.hls.offer_audio(frame)
+            for packet in packets:
+                self._publish(packet)
+
+    def _publish(self, packet: EncodedPacket):
+        self.packets += 1
+        index = 0 if packet.kind == "audio" else 1
+        for tracks in self.viewers.values():
+            tracks[index].offer(packet)
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        for viewer_id in list(self.viewers):
+            self.remove_viewer(viewer_id)
+        self.source.stop()
+        if self.hls:
+            try:
+                await self.hls.close()
+            except Exception as e:
+                logger.warning(f"Broadcast {self.id} HLS close error: {e}")
+            # The playlist is live-only; nothing is kept once the broadcast ends
+            await asyncio.to_thread(shutil.rmtree, self.hls.directory, True)
+
+
+class BroadcastService:
+    """One-to-many sessions: a host's replies are rendered and encoded once per broadcast.
+
+    Viewers subscribe over WebRTC (signaled on the WebSocket) or play the
+    HLS playlist; neither adds render or encode work.
+    """
+
+    def __init__(self, streaming_service, webrtc_service):
+        self.streaming = streaming_service
+        self.webrtc = webrtc_service
+        self.broadcasts: Dict[str, Broadcast] = {}
+        BROADCAST_VIEWERS.labels("webrtc").set_function(
+            lambda: sum(len(b.viewers) for b in self.broadcasts.values())
+        )
+
+    def create(self, host_id: str) -> Broadcast:
+        broadcast = Broadcast(uuid.uuid4().hex[:12], host_id, self.streaming.create_source())
+        self.broadcasts[broadcast.id] = broadcast
+        broadcast.start()
+        logger.info(f"Broadcast {broadcast.id} started by {host_id}")
+        return broadcast
+
+    def get(self, broadcast_id: str) -> Optional[Broadcast]:
+        return self.broadcasts.get(broadcast_id)
+
+    def hosted_by(self, host_id: str) -> List[Broadcast]:
+        return [b for b in self.broadcasts.values() if b.host_id == host_id]
+
+    async def speak(self, broadcast_id: str, text: str, on_first_frame=None) -> dict:
+        return await self.streaming.speak_to(self.broadcasts[broadcast_id].source, text, on_first_frame)
+
+    @staticmethod
+    def peer_id(broadcast_id: str, viewer_id: str) -> str:
+        return f"broadcast:{broadcast_id}:{viewer_id}"
+
+    async def join(self, broadcast_id: str, viewer_id: str, offer_sdp: str):
+        """Answer a viewer's offer with relay tracks of the broadcast"""
+        broadcast = self.broadcasts[broadcast_id]
+        broadcast.remove_viewer(viewer_id)
+        tracks = broadcast.add_viewer(viewer_id)
+        try:
+            return await self.webrtc.handle_offer(
+                self.peer_id(broadcast_id, viewer_id),
+                offer_sdp,
+                tracks=tracks,
+                on_closed=lambda: broadcast.remove_viewer(viewer_id),
+                codec_preferences={"video": "video/H264"}
+            )
+        except Exception:
+            broadcast.remove_viewer(viewer_id)
+            raise
+
+    async def leave(self, broadcast_id: str, viewer_id: str):
+        broadcast = self.broadcasts.get(broadcast_id)
+        if broadcast is not None:
+            broadcast.remove_viewer(viewer_id)
+        await self.webrtc.close_connection(self.peer_id(broadcast_id, viewer_id))
+
+    async def leave_all(self, viewer_id: str):
+        for broadcast in list(self.broadcasts.values()):
+            if viewer_id in broadcast.viewers:
+                await self.leave(broadcast.id, viewer_id)
+
+    async def end(self, broadcast_id: str):
+        broadcast = self.broadcasts.pop(broadcast_id, None)
+        if broadcast is None:
+            return
+        for viewer_id in list(broadcast.viewers):
+            await self.webrtc.close_connection(self.peer_id(broadcast_id, viewer_id))
+        await broadcast.stop()
+        logger.info(f"Broadcast {broadcast_id} ended: {broadcast.stats()}")
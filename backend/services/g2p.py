@@ -0,0 +1,192 @@
+import os
+import re
+from bisect import bisect_left
+from functools import lru_cache
+from loguru import logger
+from typing import Dict, List, Optional, Tuple
+
+from backend.config import settings
+from backend.utils.constants import SUPPORTED_LANGUAGES
+
+LEXICON_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "lexicons")
+
+# Brahmic scripts share the ISCII-derived layout, so one table keyed by the
+# offset from the block start covers Devanagari, Bengali, Gujarati, Tamil
+# and Telugu.
+INDIC_BLOCKS = {0x0900: "deva", 0x0980: "beng", 0x0A80: "gujr", 0x0B80: "taml", 0x0C00: "telu"}
+
+INDIC_VOWELS = {
+    0x05: ["ah"], 0x06: ["aa"], 0x07: ["ih"], 0x08: ["iy"], 0x09: ["uh"], 0x0A: ["uw"],
+    0x0B: ["r", "ih"], 0x0E: ["eh"], 0x0F: ["ey"], 0x10: ["ae"], 0x12: ["ow"], 0x13: ["ow"], 0x14: ["aw"],
+}
+INDIC_MATRAS = {
+    0x3E: ["aa"], 0x3F: ["ih"], 0x40: ["iy"], 0x41: ["uh"], 0x42: ["uw"], 0x43: ["r", "ih"],
+    0x46: ["eh"], 0x47: ["ey"], 0x48: ["ae"], 0x4A: ["ow"], 0x4B: ["ow"], 0x4C: ["aw"],
+}
+INDIC_CONSONANTS = {
+    0x15: "k", 0x16: "k", 0x17: "g", 0x18: "g", 0x19: "ng",
+    0x1A: "ch", 0x1B: "ch", 0x1C: "jh", 0x1D: "jh", 0x1E: "n",
+    0x1F: "t", 0x20: "t", 0x21: "d", 0x22: "d", 0x23: "n",
+    0x24: "t", 0x25: "t", 0x26: "d", 0x27: "d", 0x28: "n", 0x29: "n",
+    0x2A: "p", 0x2B: "f", 0x2C: "b", 0x2D: "b", 0x2E: "m",
+    0x2F: "y", 0x30: "r", 0x31: "r", 0x32: "l", 0x33: "l", 0x34: "l", 0x35: "v",
+    0x36: "sh", 0x37: "sh", 0x38: "s", 0x39: "h",
+}
+INDIC_VIRAMA = 0x4D
+INDIC_NASALS = {0x01, 0x02}  # chandrabindu, anusvara
+INDIC_VISARGA = 0x03
+
+# Latin letter-to-sound rules, longest grapheme first
+LATIN_RULES = [
+    ("tion", ["sh", "ah", "n"]), ("igh", ["ay"]), ("ough", ["ow"]),
+    ("sh", ["sh"]), ("ch", ["ch"]), ("th", ["th"]), ("ph", ["f"]), ("ng", ["ng"]),
+    ("ck", ["k"]), ("qu", ["k", "w"]), ("wh", ["w"]), ("ee", ["iy"]), ("ea", ["iy"]),
+    ("oo", ["uw"]), ("ou", ["aw"]), ("ow", ["ow"]), ("oi", ["oy"]), ("oy", ["oy"]),
+    ("ai", ["ey"]), ("ay", ["ey"]), ("au", ["ao"]), ("aw", ["ao"]), ("er", ["er"]),
+    ("ir", ["er"]), ("ur", ["er"]), ("ar", ["aa", "r"]), ("or", ["ao", "r"]),
+    ("a", ["ae"]), ("e", ["eh"]), ("i", ["ih"]), ("o", ["aa"]), ("u", ["ah"]), ("y", ["iy"]),
+    ("b", ["b"]), ("c", ["k"]), ("d", ["d"]), ("f", ["f"]), ("g", ["g"]), ("h", ["h"]),
+    ("j", ["jh"]), ("k", ["k"]), ("l", ["l"]), ("m", ["m"]), ("n", ["n"]), ("p", ["p"]),
+    ("q", ["k"]), ("r", ["r"]), ("s", ["s"]), ("t", ["t"]), ("v", ["v"]), ("w", ["w"]),
+    ("x", ["k", "s"]), ("z", ["z"]),
+]
+
+WORD_CLEAN = re.compile(r"[^\wऀ-೿]+")
+
+
+class Lexicon:
+    """Sorted-array pronunciation lexicon with binary-search lookup"""
+
+    def __init__(self, entries: Dict[str, Tuple[str, ...]]):
+        self.words = sorted(entries)
+        self.pronunciations = [entries[w] for w in self.words]
+
+    def __len__(self) -> int:
+        return len(self.words)
+
+    def lookup(self, word: str) -> Optional[Tuple[str, ...]]:
+        i = bisect_left(self.words, word)
+        if i < len(self.words) and self.words[i] == word:
+            return self.pronunciations[i]
+        return None
+
+    @classmethod
+    def load(cls, path: str) -> "Lexicon":
+        """Read `word<TAB>ph1 ph2 ...` lines; '#' starts a comment"""
+        entries = {}
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line or line.startswith("#") or "\t" not in line:
+                    continue
+                word, phonemes = line.split("\t", 1)
+                entries[word.lower()] = tuple(phonemes.split())
+        return cls(entries)
+
+
+class GraphemeToPhoneme:
+    """Lexicon-first G2P with script-based rule fallback and an LRU memo.
+
+    Each language in SUPPORTED_LANGUAGES gets its lexicon from
+    `backend/data/lexicons/<lang>.tsv` when present. Words missing from
+    the lexicon fall back to Brahmic-script rules (with word-final schwa
+    deletion) or Latin letter-to-sound rules depending on their script;
+    Latin words inside Indic-language text also try the en-US lexicon.
+    """
+
+    def __init__(self, lexicon_dir: str = LEXICON_DIR, cache_size: int = None):
+        self.lexicons: Dict[str, Lexicon] = {}
+        for language in SUPPORTED_LANGUAGES:
+            path = os.path.join(lexicon_dir, f"{language}.tsv")
+            if os.path.exists(path):
+                self.lexicons[language] = Lexicon.load(path)
+        logger.info(f"G2P lexicons loaded: { {k: len(v) for k, v in self.lexicons.items()} }")
+
+        self._phonemize_word = lru_cache(maxsize=cache_size or settings.G2P_CACHE_SIZE)(self._phonemize_uncached)
+
+    def phonemize(self, word: str, language: str = "hi-IN") -> List[str]:
+        return list(self._phonemize_word(self.normalize(word), language))
+
+    def phonemize_batch(self, words: List[str], language: str = "hi-IN") -> List[List[str]]:
+        """Phonemize a whole utterance, resolving each distinct word once"""
+        normalized = [self.normalize(w) for w in words]
+        resolved = {w: self._phonemize_word(w, language) for w in set(normalized)}
+        return [list(resolved[w]) for w in normalized]
+
+    def cache_info(self):
+        return self._phonemize_word.cache_info()
+
+    @staticmethod
+    def normalize(word: str) -> str:
+        return WORD_CLEAN.sub("", word.lower())
+
+    def _phonemize_uncached(self, word: str, language: str) -> Tuple[str, ...]:
+        if not word:
+            return ()
+        block = self._indic_block(word)
+        lexicon = self.lexicons.get(language if block is not None else "en-US")
+        if lexicon:
+            pronunciation = lexicon.lookup(word)
+            if pronunciation:
+                return pronunciation
+        if block is not None:
+            return tuple(self._indic_rules(word, block))
+        return tuple(self._latin_rules(word))
+
+    @staticmethod
+    def _indic_block(word: str) -> Optional[int]:
+        for char in word:
+            code = ord(char)
+            for start in INDIC_BLOCKS:
+                if start <= code < start + 0x80:
+                    return start
+        return None
+
+    def _indic_rules(self, word: str, block: int) -> List[str]:
+        phonemes: List[str] = []
+        pending_schwa = False
+        for char in word:
+            offset = ord(char) - block
+            if not 0 <= offset < 0x80:
+                continue
+            if offset in INDIC_CONSONANTS:
+                if pending_schwa:
+                    phonemes.append("ah")
+                phonemes.append(INDIC_CONSONANTS[offset])
+                pending_schwa = True
+            elif offset in INDIC_MATRAS:
+                phonemes.extend(INDIC_MATRAS[offset])
+                pending_schwa = False
+            elif offset == INDIC_VIRAMA:
+                pending_schwa = False
+            elif offset in INDIC_VOWELS:
+                if pending_schwa:
+                    phonemes.append("ah")
+                phonemes.extend(INDIC_VOWELS[offset])
+                pending_schwa = False
+            elif offset in INDIC_NASALS:
+                if pending_schwa:
+                    phonemes.append("ah")
+                    pending_schwa = False
+                phonemes.append("n")
+            elif offset == INDIC_VISARGA:
+                phonemes.append("h")
+        # A pending inherent vowel at the end of the word is dropped (schwa deletion)
+        return phonemes
+
+    def _latin_rules(self, word: str) -> List[str]:
+        phonemes: List[str] = []
+        i = 0
+        # A final silent 'e' after a consonant only lengthens the vowel
+        if len(word) > 2 and word.endswith("e") and word[-2] not in "aeiou":
+            word = word[:-1]
+        while i < len(word):
+            for grapheme, sounds in LATIN_RULES:
+                if word.startswith(grapheme, i):
+                    if not phonemes or phonemes[-1] != sounds[0] or len(sounds) > 1:
+                        phonemes.extend(sounds)
+                    i += len(grapheme)
+                    break
+            else:
+                i += 1
+        return phonemes
@@ -0,0 +1,165 @@
+import hashlib
+import math
+import os
+import re
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from loguru import logger
+from PIL import Image, ImageDraw
+
+from backend.config import settings
+
+# Bump when the animation changes so stale cache files are not reused
+LOOP_VERSION = 1
+# Motion amplitudes, small enough that the neutral pose is never far away
+SWAY_DEGREES = 0.6
+BREATH_LIFT = 0.004  # fraction of the frame height
+BREATH_SCALE = 0.003
+BREATHS_PER_LOOP = 2
+# Blinks as (start, length) fractions of the loop
+BLINKS = ((0.17, 0.04), (0.7, 0.045))
+
+# Loops opened by this process, shared by every stream of that avatar and size
+_open_loops: Dict[Tuple[str, int, int], "IdleLoop"] = {}
+
+
+class IdleLoop:
+    """A seamless idle animation (breathing, sway, blinks) for one avatar and size.
+
+    Frames are stored as yuv420p planes, the encoder's input format, in a
+    memory-mapped .npy file, so playing them back is a plane copy and every
+    stream and worker process shares the same pages. Frame 0 is the
+    avatar's neutral pose, the same one speech frames are drawn on.
+    """
+
+    def __init__(self, path: str, fps: int):
+        self.path = path
+        self.fps = fps
+        self.frames = np.load(path, mmap_mode="r")
+        self.height = self.frames.shape[1] * 2 // 3
+        self.width = self.frames.shape[2]
+
+    def __len__(self) -> int:
+        return len(self.frames)
+
+
+def even_size(image: np.ndarray) -> Tuple[int, int]:
+    """(width, height) rounded down to even, as yuv420p needs"""
+    height, width = image.shape[:2]
+    return width - width % 2, height - height % 2
+
+
+def _eye_boxes(mouth_region: tuple, width: int, height: int) -> List[tuple]:
+    """Eye boxes placed from the mouth by typical face proportions"""
+    x1, y1, x2, _ = mouth_region
+    span = x2 - x1
+    center_x, center_y = (x1 + x2) / 2, y1 - 1.1 * span
+    half = 0.225 * span
+    boxes = []
+    for eye_x in (center_x - 0.5 * span, center_x + 0.5 * span):
+        box = (int(eye_x - half), int(center_y - half), int(eye_x + half), int(center_y + half))
+        if box[0] >= 0 and box[1] >= 8 and box[2] <= width and box[3] <= height:
+            boxes.append(box)
+    return boxes
+
+
+def _draw_lids(image: Image.Image, boxes: List[tuple], lid_colors: List[tuple], closure: float):
+    draw = ImageDraw.Draw(image)
+    for (x1, y1, x2, y2), color in zip(boxes, lid_colors):
+        lid_y = y1 + closure * (y2 - y1)
+        mask = Image.new("L", image.size, 0)
+        ImageDraw.Draw(mask).ellipse([x1, y1, x2, y2], fill=255)
+        ImageDraw.Draw(mask).rectangle([x1, lid_y, x2, y2], fill=0)
+        image.paste(color, mask=mask)
+        # Lash line along the lid edge
+        a, b = (x2 - x1) / 2, (y2 - y1) / 2
+        dy = (lid_y - (y1 + b)) / b
+        if abs(dy) < 1:
+            half = a * math.sqrt(1 - dy * dy)
+            draw.line([x1 + a - half, lid_y, x1 + a + half, lid_y], fill=(40, 25, 20), width=3)
+
+
+def _closure(phase: float) -> float:
+    for start, length in BLINKS:
+        x = (phase - start) / length
+        if 0 <= x <= 1:
+            return math.sin(math.pi * x)
+    return 0.0
+
+
+def _pose_matrix(phase: float, width: int, height: int) -> tuple:
+    """Inverse affine coefficients (output -> input) for PIL's transform"""
+    breath = (1 - math.cos(2 * math.pi * BREATHS_PER_LOOP * phase)) / 2
+    angle = math.radians(SWAY_DEGREES * math.sin(2 * math.pi * phase))
+    scale = 1 + BREATH_SCALE * breath
+    lift = BREATH_LIFT * height * breath
+    # Rotate and scale about the neck, then lift
+    px, py = width / 2, height * 0.85
+    cos_a, sin_a = math.cos(angle) / scale, math.sin(angle) / scale
+    ox, oy = px, py - lift
+    return (
+        cos_a, sin_a, px - cos_a * ox - sin_a * oy,
+        -sin_a, cos_a, py + sin_a * ox - cos_a * oy,
+    )
+
+
+def render_idle_loop(path: str, base: np.ndarray, mouth_region: Optional[tuple], seconds: float, fps: int):
+    """Render the loop straight into a .npy file, one yuv420p frame at a time"""
+    from av import VideoFrame
+
+    width, height = even_size(base)
+    image = Image.fromarray(np.ascontiguousarray(base[:height, :width])).convert("RGB")
+    count = max(1, int(round(seconds * fps)))
+    boxes = _eye_boxes(mouth_region, width, height) if settings.IDLE_BLINK and mouth_region else []
+    # Lids take the skin colour just above each eye
+    pixels = np.asarray(image)
+    lid_colors = [tuple(int(c) for c in np.median(pixels[y1 - 8:y1 - 2, x1:x2].reshape(-1, 3), axis=0))
+                  for x1, y1, x2, _ in boxes]
+    background = tuple(int(c) for c in pixels[0, 0])
+
+    tmp = f"{path}.{os.getpid()}.tmp"
+    out = np.lib.format.open_memmap(tmp, mode="w+", dtype=np.uint8, shape=(count, height * 3 // 2, width))
+    for i in range(count):
+        phase = i / count
+        frame = image.copy()
+        closure = _closure(phase)
+        if closure > 0.05 and boxes:
+            _draw_lids(frame, boxes, lid_colors, closure)
+        if i:
+            frame = frame.transform(frame.size, Image.AFFINE, _pose_matrix(phase, width, height),
+                                    resample=Image.BILINEAR, fillcolor=background)
+        out[i] = VideoFrame.from_ndarray(np.asarray(frame), format="rgb24").reformat(format="yuv420p").to_ndarray()
+    out.flush()
+    del out
+    os.replace(tmp, path)
+
+
+def cache_path(avatar_id: str, base: np.ndarray, mouth_region: Optional[tuple]) -> Path:
+    width, height = even_size(base)
+    digest = hashlib.blake2b(digest_size=8)
+    digest.update(np.ascontiguousarray(base).tobytes())
+    digest.update(repr((LOOP_VERSION, mouth_region, settings.IDLE_LOOP_SECONDS,
+                        settings.IDLE_LOOP_FPS, settings.IDLE_BLINK)).encode())
+    slug = re.sub(r"[^A-Za-z0-9_.-]+", "_", avatar_id)
+    return Path(settings.IDLE_CACHE_DIR) / f"{slug}-{width}x{height}-{digest.hexdigest()}.npy"
+
+
+def load_idle_loop(avatar_id: str, base: np.ndarray, mouth_region: Optional[tuple]) -> IdleLoop:
+    """The avatar's idle loop at the base image's size, rendered on first use.
+
+    Blocking (rendering takes about a second per avatar); call it from a
+    worker thread.
+    """
+    key = (avatar_id,) + even_size(base)
+    loop = _open_loops.get(key)
+    if loop is not None:
+        return loop
+    path = cache_path(avatar_id, base, mouth_region)
+    if not path.exists():
+        path.parent.mkdir(parents=True, exist_ok=True)
+        render_idle_loop(str(path), base, mouth_region, settings.IDLE_LOOP_SECONDS, settings.IDLE_LOOP_FPS)
+        logger.info(f"Rendered idle loop for {avatar_id} to {path}")
+    loop = _open_loops[key] = IdleLoop(str(path), settings.IDLE_LOOP_FPS)
+    return loop
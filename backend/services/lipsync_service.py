@@ -1,34 +1,77 @@
-import cv2
+from functools import lru_cache
 import numpy as np
 from PIL import Image, ImageDraw, ImageFilter
 import json
 from loguru import logger
-from typing import List, Dict, Any
-import torch
-import torch.nn as nn
-
+from typing import List, Dict, Any, Iterator, Optional
 import os
-import cv2
-import numpy as np
+import time
+
+from backend.config import settings
+from backend.utils.audio import PCMAudio
+from backend.utils.constants import MOUTH_SHAPES, MOUTH_SHAPE_COLUMNS
+from backend.utils.metrics import FRAMES, FRAMES_PER_SECOND, STAGE_SECONDS
+from backend.utils.viseme_timeline import VisemeTimeline, SILENCE_ID
+
+# Room around the mouth region for shape offsets, depth layers and blur
+MOUTH_MARGIN = 16
+# Mouth size is snapped to this many pixels and blend to 1/BLEND_STEPS, so
+# the shapes a reply passes through repeat and their patches can be reused
+MOUTH_GRID = 2
+BLEND_STEPS = 16
 
 class LipSyncService:
-    def __init__(self, avatar_path: str = None):
-        # Set default avatar path if none is provided
-        if avatar_path is None:
-            avatar_path = r"C:\Users\hp\Downloads\advanced-avatar-main\000723.jpg"
-
-        self.avatar = self._load_avatar(avatar_path)
-        self.mouth_region = self._detect_mouth_region()
-        self.viseme_shapes = self._load_viseme_shapes()
+    def __init__(self, avatar_path: str = None, bundle=None):
+        self._sprites = None
+        self._sprite_patches = {}
+        # Mouth patches by snapped geometry, shared by every mode
+        self._patch = lru_cache(maxsize=settings.LIPSYNC_PATCH_CACHE)(self._draw_mouth)
+        if bundle is not None:
+            # Compiled bundle: memory-mapped, shared by every worker process
+            self.avatar = bundle.base
+            self.mouth_region = bundle.mouth_region
+        else:
+            # Set default avatar path if none is provided
+            if avatar_path is None:
+                avatar_path = r"C:\Users\hp\Downloads\advanced-avatar-main\000723.jpg"
+
+            self.avatar = self._load_avatar(avatar_path)
+            self.mouth_region = self._detect_mouth_region()
+        self.mouth_box = self._mouth_box()
+        if bundle is not None:
+            self.sprites = bundle.sprites
         self.prev_shape = None
         self.smoothing_factor = 0.3
 
+    @property
+    def sprites(self) -> Optional[np.ndarray]:
+        return self._sprites
+
+    @sprites.setter
+    def sprites(self, sprites: Optional[np.ndarray]):
+        """Pre-rendered patches for the table shapes, served whenever a frame snaps to one"""
+        self._sprites = sprites
+        self._sprite_patches = {} if sprites is None else {
+            self._mouth_key(shape, 1.0): sprite for shape, sprite in zip(MOUTH_SHAPES, sprites)
+        }
+
+    @classmethod
+    def for_avatar(cls, avatar_id: str) -> "LipSyncService":
+        """Use the avatar's compiled bundle when it is current, else its source image"""
+        from backend.services.avatar_bundle import open_bundle, source_image
+        bundle = open_bundle(avatar_id)
+        if bundle is not None:
+            return cls(bundle=bundle)
+        return cls(avatar_path=source_image(avatar_id))
+
     def _load_avatar(self, avatar_path: str) -> np.ndarray:
         """Load avatar image"""
         if os.path.exists(avatar_path): 
-            img = cv2.imread(avatar_path)
-            if img is not None:
-                return cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+            try:
+                with Image.open(avatar_path) as img:
+                    return np.array(img.convert('RGB'))
+            except OSError as e:
+                logger.warning(f"Could not read avatar {avatar_path}: {e}")
         return self._create_animated_avatar()
 
     def _create_animated_avatar(self) -> np.ndarray:
@@ -37,8 +80,6 @@ class LipSyncService:
     def _detect_mouth_region(self):
         pass
 
-    def _load_viseme_shapes(self):
-        pass
     def _create_animated_avatar(self) -> np.ndarray:
         """Create a professional animated avatar"""
         img = Image.new('RGBA', (1024, 1024), (255, 255, 255, 0))
@@ -57,39 +98,25 @@ class LipSyncService:
     def _detect_mouth_region(self) -> tuple:
         """Detect mouth region in avatar"""
         return (400, 600, 624, 700) 
+
+    def _mouth_box(self) -> tuple:
+        """Patch that every mouth shape is drawn inside (clipped to the frame)"""
+        x1, y1, x2, y2 = self.mouth_region
+        height, width = self.avatar.shape[:2]
+        return (
+            max(0, x1 - MOUTH_MARGIN), max(0, y1 - MOUTH_MARGIN),
+            min(width, x2 + MOUTH_MARGIN), min(height, y2 + MOUTH_MARGIN)
+        )
         
-    def _load_viseme_shapes(self) -> Dict[str, Dict[str, float]]:
-        """Load viseme to mouth shape mappings"""
-        return {
-            'viseme_silence': {'width': 0.2, 'height': 0.1, 'jaw': 0.0, 'round': 0.0, 'x_offset': 0, 'y_offset': 0},
-            'viseme_aa': {'width': 0.8, 'height': 0.7, 'jaw': 0.8, 'round': 0.2, 'x_offset': 0, 'y_offset': 0},
-            'viseme_ii': {'width': 0.5, 'height': 0.9, 'jaw': 0.3, 'round': 0.1, 'x_offset': 5, 'y_offset': -5},
-            'viseme_uu': {'width': 0.6, 'height': 0.4, 'jaw': 0.4, 'round': 0.9, 'x_offset': 0, 'y_offset': 5},
-            'viseme_e': {'width': 0.7, 'height': 0.5, 'jaw': 0.5, 'round': 0.3, 'x_offset': 0, 'y_offset': -3},
-            'viseme_o': {'width': 0.6, 'height': 0.5, 'jaw': 0.5, 'round': 0.7, 'x_offset': 0, 'y_offset': 2},
-            'viseme_k': {'width': 0.5, 'height': 0.3, 'jaw': 0.3, 'round': 0.2, 'x_offset': -2, 'y_offset': 0},
-            'viseme_g': {'width': 0.5, 'height': 0.3, 'jaw': 0.3, 'round': 0.2, 'x_offset': 2, 'y_offset': 0},
-            'viseme_t': {'width': 0.4, 'height': 0.2, 'jaw': 0.2, 'round': 0.1, 'x_offset': 3, 'y_offset': 0},
-            'viseme_d': {'width': 0.4, 'height': 0.2, 'jaw': 0.2, 'round': 0.1, 'x_offset': -2, 'y_offset': 0},
-            'viseme_n': {'width': 0.4, 'height': 0.2, 'jaw': 0.2, 'round': 0.1, 'x_offset': 0, 'y_offset': 0},
-            'viseme_m': {'width': 0.4, 'height': 0.2, 'jaw': 0.2, 'round': 0.1, 'x_offset': 0, 'y_offset': 0},
-            'viseme_p': {'width': 0.3, 'height': 0.1, 'jaw': 0.1, 'round': 0.1, 'x_offset': 0, 'y_offset': 2},
-            'viseme_b': {'width': 0.3, 'height': 0.1, 'jaw': 0.1, 'round': 0.1, 'x_offset': 0, 'y_offset': 1},
-            'viseme_s': {'width': 0.4, 'height': 0.1, 'jaw': 0.1, 'round': 0.1, 'x_offset': 0, 'y_offset': 1},
-            'viseme_h': {'width': 0.5, 'height': 0.3, 'jaw': 0.3, 'round': 0.2, 'x_offset': 0, 'y_offset': 0}
-        }
-        
-    def generate_frames(self, viseme_sequence: List[Dict], duration: float, fps: int = 30) -> List[np.ndarray]:
+    def generate_frames(self, timeline: VisemeTimeline, duration: float, fps: int = 30) -> List[np.ndarray]:
         """Generate frames with lip sync"""
         try:
             frames = []
             num_frames = int(duration * fps)
+            ids, blends = timeline.active(np.arange(num_frames) / fps)
             
-            for i in range(num_frames):
-                current_time = i / fps
-                viseme = self._get_active_viseme(viseme_sequence, current_time)
-                
-                frame = self._render_frame(viseme)
+            for viseme, blend in zip(ids, blends):
+                frame = self._render_frame(viseme, blend)
                 frames.append(frame)
                 
             return frames
@@ -98,100 +125,205 @@ class LipSyncService:
             logger.error(f"Frame generation error: {e}")
             return []
             
-    def _get_active_viseme(self, viseme_sequence: List[Dict], time: float) -> Dict:
-        """Get active viseme at given time with blending"""
-        active_visemes = []
-        
-        for viseme in viseme_sequence:
-            start = viseme['start']
-            end = start + viseme.get('duration', 0.1)
-            
-            if start <= time <= end:
-                # Calculate blend factor
-                blend_duration = viseme.get('blend', 0.05)
-                if time - start < blend_duration:
-                    # Blending in
-                    blend = (time - start) / blend_duration
-                elif end - time < blend_duration:
-                    # Blending out
-                    blend = (end - time) / blend_duration
-                else:
-                    blend = 1.0
-                    
-                active_visemes.append({
-                    'viseme': viseme['viseme'],
-                    'blend': blend
-                })
-                
-        if not active_visemes:
-            return {'viseme': 'viseme_silence', 'blend': 1.0}
-            
-        # Return the one with highest blend
-        return max(active_visemes, key=lambda x: x['blend'])
-        
-    def _render_frame(self, viseme_info: Dict) -> np.ndarray:
+    def animate(self, audio: PCMAudio, timeline: VisemeTimeline, mode: str = None, fps: int = 30) -> List[np.ndarray]:
+        """Generate frames for a reply using the configured LIPSYNC_MODE"""
+        mode = mode or settings.LIPSYNC_MODE
+        started = time.perf_counter()
+        if mode == "phoneme":
+            frames = self.generate_frames(timeline, duration=audio.duration, fps=fps)
+        else:
+            frames = self.generate_frames_from_audio(
+                audio,
+                fps=fps,
+                timeline=timeline if mode == "hybrid" else None
+            )
+        elapsed = time.perf_counter() - started
+        STAGE_SECONDS.labels("lipsync").observe(elapsed)
+        FRAMES.labels("lipsync").inc(len(frames))
+        if frames and elapsed > 0:
+            FRAMES_PER_SECOND.labels("lipsync").set(len(frames) / elapsed)
+        return frames
+
+    def generate_frames_from_audio(
+        self,
+        audio: PCMAudio,
+        fps: int = 30,
+        timeline: Optional[VisemeTimeline] = None,
+        audio_weight: float = None
+    ) -> List[np.ndarray]:
+        """Generate frames with mouth curves driven by the audio envelope.
+
+        Works for any TTS engine. When a viseme `timeline` is given, the
+        phoneme-based shapes are mixed in with weight `1 - audio_weight`.
+        """
+        try:
+            curves = self.audio_mouth_curves(audio, fps)
+            if timeline is not None and len(timeline):
+                weight = settings.LIPSYNC_AUDIO_WEIGHT if audio_weight is None else audio_weight
+                curves = weight * curves + (1 - weight) * timeline.shape_curves(np.arange(len(curves)) / fps)
+
+            return [self._render_shape(shape, 1.0) for shape in curves]
+
+        except Exception as e:
+            logger.error(f"Audio lip-sync error: {e}")
+            return []
+
+    def iter_frames(
+        self,
+        audio: PCMAudio,
+        timeline: Optional[VisemeTimeline],
+        mode: str = None,
+        fps: int = 30,
+        offset: float = 0.0
+    ) -> Iterator[np.ndarray]:
+        """Yield the frames for one chunk of a reply, one at a time, for live streaming.
+
+        `offset` is where the chunk starts within the reply (seconds); chunks
+        fed in order land on the same frame grid as rendering the reply whole,
+        and `timeline` holds absolute reply times.
+        """
+        mode = mode or settings.LIPSYNC_MODE
+        first = int(round(offset * fps))
+        times = (first + np.arange(int(round((offset + audio.duration) * fps)) - first)) / fps
+        if mode == "phoneme":
+            ids, blends = timeline.active(times)
+            for viseme, blend in zip(ids, blends):
+                yield self._render_frame(viseme, blend)
+            return
+
+        curves = self.audio_mouth_curves(audio, fps)
+        if len(curves) < len(times):
+            fill = curves[-1:] if len(curves) else np.asarray([MOUTH_SHAPES[SILENCE_ID]], dtype=np.float32)
+            curves = np.concatenate([curves, np.repeat(fill, len(times) - len(curves), axis=0)])
+        curves = curves[:len(times)]
+        if mode == "hybrid" and timeline is not None and len(timeline):
+            weight = settings.LIPSYNC_AUDIO_WEIGHT
+            curves = weight * curves + (1 - weight) * timeline.shape_curves(times)
+        for shape in curves:
+            yield self._render_shape(shape, 1.0)
+
+    def audio_mouth_curves(self, audio: PCMAudio, fps: int = 30) -> np.ndarray:
+        """Per-frame (width, height, jaw, round) curves from RMS and spectral centroid"""
+        n_frames = int(audio.duration * fps)
+        if n_frames == 0:
+            return np.zeros((0, 4), dtype=np.float32)
+
+        # One Hann-windowed slice per video frame, two frame-hops wide
+        hop = audio.sample_rate / fps
+        win = max(2, int(2 * hop))
+        starts = ((np.arange(n_frames) + 0.5) * hop - win / 2).astype(np.int64) + win
+        padded = np.pad(audio.samples, (win, win))
+        windows = padded[starts[:, None] + np.arange(win)[None, :]] * np.hanning(win).astype(np.float32)
+
+        rms = np.sqrt(np.mean(windows ** 2, axis=1))
+        spectrum = np.abs(np.fft.rfft(windows, axis=1))
+        freqs = np.fft.rfftfreq(win, 1.0 / audio.sample_rate)
+        centroid = (spectrum * freqs).sum(axis=1) / (spectrum.sum(axis=1) + 1e-9)
+
+        # Loudness drives the opening, brightness spreads vs. rounds the lips
+        level = rms / (np.percentile(rms, 95) + 1e-9)
+        level = np.sqrt(np.clip(np.where(level < 0.08, 0.0, level), 0.0, 1.0))
+        level = self._attack_release(level, attack=0.6, release=0.25)
+        brightness = np.clip((centroid - 500.0) / 2500.0, 0.0, 1.0)
+
+        silence = dict(zip(MOUTH_SHAPE_COLUMNS, MOUTH_SHAPES[SILENCE_ID]))
+        width = silence['width'] + 0.6 * level * (0.5 + 0.5 * brightness)
+        height = silence['height'] + 0.8 * level
+        jaw = silence['jaw'] + 0.8 * level
+        lip_round = 0.8 * level * (1.0 - brightness)
+        return np.stack([width, height, jaw, lip_round], axis=1).astype(np.float32)
+
+    @staticmethod
+    def _attack_release(values: np.ndarray, attack: float, release: float) -> np.ndarray:
+        out = np.empty_like(values)
+        prev = 0.0
+        for i, value in enumerate(values):
+            coeff = attack if value > prev else release
+            prev = prev + coeff * (value - prev)
+            out[i] = prev
+        return out
+
+    def _render_frame(self, viseme: int, blend: float) -> np.ndarray:
         """Render a single frame with mouth shape"""
+        shape = MOUTH_SHAPES[viseme]
+
+        # Apply smoothing
+        if self.prev_shape is not None:
+            shape = self.prev_shape * (1 - self.smoothing_factor) + shape * self.smoothing_factor
+        self.prev_shape = shape
+        return self._render_shape(shape, blend)
+
+    def render_sprites(self) -> np.ndarray:
+        """Mouth patch for every viseme ID at full blend (what bundles store)"""
+        return np.stack([self._draw_mouth(*self._mouth_key(shape, 1.0)) for shape in MOUTH_SHAPES])
+
+    def _render_shape(self, shape: np.ndarray, blend: float) -> np.ndarray:
+        """Draw the mouth for a MOUTH_SHAPES row (offset columns optional)"""
         try:
             frame = self.avatar.copy()
-            viseme_name = viseme_info['viseme']
-            blend = viseme_info['blend']
-            
-            # Get mouth shape parameters
-            shape = self.viseme_shapes.get(viseme_name, self.viseme_shapes['viseme_silence'])
-            
-            # Apply smoothing
-            if self.prev_shape is None:
-                self.prev_shape = shape
-            else:
-                # Interpolate shapes
-                for key in shape:
-                    if isinstance(shape[key], (int, float)):
-                        shape[key] = self.prev_shape[key] * (1 - self.smoothing_factor) + shape[key] * self.smoothing_factor
-                self.prev_shape = shape
-                
-            # Calculate mouth dimensions
-            x1, y1, x2, y2 = self.mouth_region
-            mouth_width = x2 - x1
-            mouth_height = y2 - y1
-            
-            # Apply shape modifications
-            new_width = int(mouth_width * shape['width'])
-            new_height = int(mouth_height * shape['height'])
-            x_offset = shape.get('x_offset', 0)
-            y_offset = shape.get('y_offset', 0)
-            
-            # Center the mouth
-            new_x1 = x1 + (mouth_width - new_width) // 2 + x_offset
-            new_y1 = y1 + (mouth_height - new_height) // 2 + y_offset
-            new_x2 = new_x1 + new_width
-            new_y2 = new_y1 + new_height
-            
-            # Draw mouth with gradient
-            img = Image.fromarray(frame)
-            draw = ImageDraw.Draw(img, 'RGBA')
-            
-            # Draw multiple layers for depth
-            for i in range(3):
-                alpha = int(255 * (0.7 - i * 0.2) * blend)
-                offset = i * 3
-                draw.ellipse(
-                    [new_x1 - offset, new_y1 - offset, new_x2 + offset, new_y2 + offset],
-                    fill=(255, 100, 100, alpha)
-                )
-                
-            # Add highlight
-            highlight_y1 = new_y1 + new_height // 4
-            highlight_y2 = new_y1 + new_height // 2
+            bx1, by1, bx2, by2 = self.mouth_box
+            frame[by1:by2, bx1:bx2] = self._render_mouth(shape, blend)
+            return frame
+
+        except Exception as e:
+            logger.error(f"Frame rendering error: {e}")
+            return self.avatar
+
+    def _render_mouth(self, shape: np.ndarray, blend: float) -> np.ndarray:
+        """The mouth patch for a shape: a bundle sprite, a cached patch or a fresh drawing"""
+        key = self._mouth_key(shape, blend)
+        sprite = self._sprite_patches.get(key)
+        return sprite if sprite is not None else self._patch(*key)
+
+    def _mouth_key(self, shape: np.ndarray, blend: float) -> tuple:
+        """Snapped (width, height, x offset, y offset, blend) the patch is drawn from"""
+        x1, y1, x2, y2 = self.mouth_region
+        return (
+            int(round((x2 - x1) * shape[0] / MOUTH_GRID)) * MOUTH_GRID,
+            int(round((y2 - y1) * shape[1] / MOUTH_GRID)) * MOUTH_GRID,
+            int(shape[4]) if len(shape) > 4 else 0,
+            int(shape[5]) if len(shape) > 5 else 0,
+            round(blend * BLEND_STEPS) / BLEND_STEPS,
+        )
+
+    def _draw_mouth(self, new_width: int, new_height: int, x_offset: int, y_offset: int, blend: float) -> np.ndarray:
+        """Draw the mouth patch; only this patch is drawn and blurred"""
+        bx1, by1, bx2, by2 = self.mouth_box
+
+        # Calculate mouth dimensions (patch coordinates)
+        x1, y1, x2, y2 = self.mouth_region
+        x1, x2, y1, y2 = x1 - bx1, x2 - bx1, y1 - by1, y2 - by1
+        mouth_width = x2 - x1
+        mouth_height = y2 - y1
+        
+        # Center the mouth
+        new_x1 = x1 + (mouth_width - new_width) // 2 + x_offset
+        new_y1 = y1 + (mouth_height - new_height) // 2 + y_offset
+        new_x2 = new_x1 + new_width
+        new_y2 = new_y1 + new_height
+        
+        # Draw mouth with gradient
+        img = Image.fromarray(np.ascontiguousarray(self.avatar[by1:by2, bx1:bx2]))
+        draw = ImageDraw.Draw(img, 'RGBA')
+        
+        # Draw multiple layers for depth
+        for i in range(3):
+            alpha = int(255 * (0.7 - i * 0.2) * blend)
+            offset = i * 3
             draw.ellipse(
-                [new_x1 + 5, highlight_y1, new_x2 - 5, highlight_y2],
-                fill=(255, 255, 255, 100)
+                [new_x1 - offset, new_y1 - offset, new_x2 + offset, new_y2 + offset],
+                fill=(255, 100, 100, alpha)
             )
             
-            # Apply subtle blur
-            img = img.filter(ImageFilter.GaussianBlur(radius=0.5))
-            
-            return np.array(img)
-            
-        except Exception as e:
-            logger.error(f"Frame rendering error: {e}")
-            return self.avatar
\ No newline at end of file
+        # Add highlight
+        highlight_y1 = new_y1 + new_height // 4
+        highlight_y2 = new_y1 + new_height // 2
+        draw.ellipse(
+            [new_x1 + 5, highlight_y1, new_x2 - 5, highlight_y2],
+            fill=(255, 255, 255, 100)
+        )
+        
+        # Apply subtle blur
+        img = img.filter(ImageFilter.GaussianBlur(radius=0.5))
+        
+        return np.array(img)
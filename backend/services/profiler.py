@@ -0,0 +1,303 @@
+import asyncio
+import cProfile
+import io
+import os
+import pstats
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import Counter
+from typing import Dict, List, Optional
+
+import numpy as np
+from loguru import logger
+
+from backend.config import settings
+
+MODES = ("sampling", "deterministic")
+# Leaf frames of threads parked waiting for work; left out unless include_idle
+IDLE_FRAMES = {
+    ("selectors.py", "select"),
+    ("threading.py", "wait"),
+    ("queue.py", "get"),
+    ("thread.py", "_worker"),
+}
+
+
+def _frame_label(code) -> str:
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def fold_stack(frame, thread_name: str) -> str:
+    """Root-first `thread;outer;...;leaf` line, the collapsed-stack format flame graph tools read"""
+    labels = []
+    while frame is not None:
+        labels.append(_frame_label(frame.f_code))
+        frame = frame.f_back
+    labels.append(thread_name)
+    return ";".join(reversed(labels))
+
+
+def _is_idle(frame) -> bool:
+    code = frame.f_code
+    return (os.path.basename(code.co_filename), code.co_name) in IDLE_FRAMES
+
+
+class Capture:
+    """One profiling window: sampled stacks, loop lag and blocked-loop stacks.
+
+    A daemon thread snapshots every thread's Python stack each `interval`
+    seconds, so the event loop and the render/STT worker threads are covered
+    alike. A heartbeat task on the loop measures scheduling lag; whenever the
+    heartbeat is overdue by more than PROFILE_BLOCK_THRESHOLD the sampler
+    attributes the time to the loop thread's current stack, which is the
+    blocking-call report. In deterministic mode cProfile additionally traces
+    the loop thread for exact call counts.
+
+    Session-scoped captures only record while one of the target session's
+    turns is running; other sessions' work overlapping those turns is
+    included, as the process is shared.
+    """
+
+    def __init__(self, mode: str = "sampling", seconds: Optional[float] = None, session_id: Optional[str] = None,
+                 turns: Optional[int] = None, interval: float = None, include_idle: bool = False):
+        if mode not in MODES:
+            raise ValueError(f"mode must be one of {MODES}")
+        self.id = uuid.uuid4().hex[:12]
+        self.mode = mode
+        self.session_id = session_id
+        self.turns_left = (turns or 1) if session_id else None
+        self.turns_total = self.turns_left
+        self.seconds = min(seconds or settings.PROFILE_MAX_SECONDS, settings.PROFILE_MAX_SECONDS)
+        self.interval = interval or settings.PROFILE_SAMPLE_INTERVAL
+        self.include_idle = include_idle
+        self.status = "pending"
+        self.started_at = None
+        self.finished_at = None
+        self.recording_seconds = 0.0
+
+        self.stacks: Counter = Counter()
+        self.blocking: Counter = Counter()
+        self.lags: List[float] = []
+        self.samples = 0
+        self.profile: Optional[cProfile.Profile] = None
+        self.pstats_path: Optional[str] = None
+
+        self._recording = False
+        self._recording_since = None
+        self._heartbeat = time.perf_counter()
+        self._loop_thread_id = None
+        self._stop_event = threading.Event()
+        # Guards the counters the sampler thread writes while reports are read
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._tasks: List[asyncio.Task] = []
+        self.done = asyncio.Event()
+
+    async def start(self):
+        loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self.status = "running"
+        self.started_at = time.time()
+        if self.mode == "deterministic":
+            self.profile = cProfile.Profile()
+        self._thread = threading.Thread(target=self._sample, name="profiler-sampler", daemon=True)
+        self._thread.start()
+        self._tasks.append(asyncio.create_task(self._watch_loop(loop)))
+        self._tasks.append(asyncio.create_task(self._expire()))
+        if self.session_id is None:
+            self._set_recording(True)
+
+    def turn_started(self):
+        self._set_recording(True)
+
+    def turn_finished(self):
+        self._set_recording(False)
+        self.turns_left -= 1
+        if self.turns_left <= 0:
+            self.stop()
+
+    def _set_recording(self, on: bool):
+        # Only ever toggled from the loop thread, which is the one cProfile traces
+        if on == self._recording:
+            return
+        now = time.perf_counter()
+        if on:
+            self._heartbeat = now
+            self._recording_since = now
+            if self.profile:
+                self.profile.enable()
+        else:
+            if self.profile:
+                self.profile.disable()
+            self.recording_seconds += now - self._recording_since
+        self._recording = on
+
+    def stop(self, status: str = "finished"):
+        if self.status != "running":
+            return
+        self._set_recording(False)
+        self._stop_event.set()
+        for task in self._tasks:
+            if task is not asyncio.current_task():
+                task.cancel()
+        if self.profile:
+            fd, self.pstats_path = tempfile.mkstemp(prefix=f"profile-{self.id}-", suffix=".prof")
+            os.close(fd)
+            self.profile.dump_stats(self.pstats_path)
+        self.status = status
+        self.finished_at = time.time()
+        self.done.set()
+        logger.info(f"Profile {self.id} {status}: {self.samples} samples over {self.recording_seconds:.1f}s")
+
+    def discard(self):
+        """Delete the cProfile dump once the capture is no longer kept"""
+        if self.pstats_path:
+            try:
+                os.remove(self.pstats_path)
+            except FileNotFoundError:
+                pass
+            self.pstats_path = None
+
+    async def _expire(self):
+        await asyncio.sleep(self.seconds)
+        # Session captures that never saw enough turns end at the time cap too
+        self.stop("finished" if self.session_id is None else "expired")
+
+    async def _watch_loop(self, loop):
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            self._heartbeat = time.perf_counter()
+            if self._recording:
+                self.lags.append(max(0.0, loop.time() - expected))
+
+    def _sample(self):
+        me = threading.get_ident()
+        block_after = self.interval + settings.PROFILE_BLOCK_THRESHOLD
+        while not self._stop_event.wait(self.interval):
+            if not self._recording:
+                continue
+            names = {t.ident: t.name for t in threading.enumerate()}
+            now = time.perf_counter()
+            sampled = []
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == me:
+                    continue
+                is_loop = thread_id == self._loop_thread_id
+                name = "event-loop" if is_loop else names.get(thread_id, f"thread-{thread_id}")
+                blocked = is_loop and now - self._heartbeat > block_after
+                if blocked or self.include_idle or not _is_idle(frame):
+                    sampled.append((fold_stack(frame, name), blocked))
+            with self._lock:
+                for stack, blocked in sampled:
+                    self.stacks[stack] += 1
+                    if blocked:
+                        self.blocking[stack] += 1
+                self.samples += 1
+
+    def folded(self) -> str:
+        """Collapsed stacks (`a;b;c count` per line) for flamegraph.pl, speedscope or inferno"""
+        with self._lock:
+            stacks = self.stacks.most_common()
+        return "".join(f"{stack} {count}\n" for stack, count in stacks)
+
+    def report(self, top: int = 25) -> dict:
+        with self._lock:
+            stacks, blocking = Counter(self.stacks), Counter(self.blocking)
+        lags = np.array(self.lags) * 1000 if self.lags else None
+        self_time = Counter()
+        for stack, count in stacks.items():
+            self_time[stack.rsplit(";", 1)[-1]] += count
+        total = sum(stacks.values()) or 1
+        report = {
+            "id": self.id,
+            "mode": self.mode,
+            "status": self.status,
+            "session_id": self.session_id,
+            "turns": None if self.turns_total is None else self.turns_total - max(self.turns_left, 0),
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "recording_seconds": round(self.recording_seconds, 3),
+            "interval_ms": self.interval * 1000,
+            "samples": self.samples,
+            "hot_frames": [
+                {"frame": frame, "samples": count, "share": round(count / total, 4)}
+                for frame, count in self_time.most_common(top)
+            ],
+            "loop_lag_ms": None if lags is None else {
+                "samples": int(lags.size),
+                "mean": round(float(lags.mean()), 3),
+                "p99": round(float(np.percentile(lags, 99)), 3),
+                "max": round(float(lags.max()), 3),
+            },
+            "blocking": [
+                {"stack": stack, "samples": count, "approx_ms": round(count * self.interval * 1000, 1)}
+                for stack, count in blocking.most_common(top)
+            ],
+        }
+        if self.pstats_path:
+            out = io.StringIO()
+            pstats.Stats(self.pstats_path, stream=out).sort_stats("cumulative").print_stats(top)
+            report["pstats"] = out.getvalue()
+        return report
+
+
+class Profiler:
+    """On-demand captures for a running node; one at a time, kept until replaced.
+
+    With no capture armed the only cost is the `turn_started` check the
+    WebSocket handler makes per turn.
+    """
+
+    def __init__(self):
+        self.current: Optional[Capture] = None
+        self.history: Dict[str, Capture] = {}
+        self._session_capture: Dict[str, Capture] = {}
+
+    @property
+    def busy(self) -> bool:
+        return self.current is not None and self.current.status == "running"
+
+    async def start(self, **options) -> Capture:
+        if self.busy:
+            raise RuntimeError(f"capture {self.current.id} is still running")
+        capture = Capture(**options)
+        await capture.start()
+        self.current = capture
+        kept = list(self.history.values())
+        for evicted in kept[settings.PROFILE_HISTORY - 1:]:
+            evicted.discard()
+        self.history = {capture.id: capture, **{c.id: c for c in kept[:settings.PROFILE_HISTORY - 1]}}
+        self._session_capture = {capture.session_id: capture} if capture.session_id else {}
+        return capture
+
+    def get(self, capture_id: str) -> Optional[Capture]:
+        return self.history.get(capture_id)
+
+    def turn_started(self, session_id: str) -> bool:
+        if not self._session_capture:
+            return False
+        capture = self._session_capture.get(session_id)
+        if capture is None or capture.status != "running":
+            return False
+        capture.turn_started()
+        return True
+
+    def turn_finished(self, session_id: str):
+        capture = self._session_capture.get(session_id)
+        if capture is not None and capture.status == "running":
+            capture.turn_finished()
+
+    def stop(self):
+        if self.busy:
+            self.current.stop("stopped")
+
+    def close(self):
+        """Stop capturing and delete every kept capture's files (at shutdown)"""
+        self.stop()
+        for capture in self.history.values():
+            capture.discard()
+        self.history = {}
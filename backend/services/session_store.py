@@ -0,0 +1,207 @@
+import asyncio
+import time
+from datetime import datetime
+from loguru import logger
+from typing import Dict, List, Optional, Tuple
+
+from backend.config import settings
+from backend.utils.metrics import QUEUE_DEPTH
+
+# Sync URLs in settings map to their asyncio drivers
+ASYNC_DRIVERS = {
+    "sqlite://": "sqlite+aiosqlite://",
+    "postgresql://": "postgresql+asyncpg://",
+    "postgres://": "postgresql+asyncpg://",
+    "mysql://": "mysql+aiomysql://",
+}
+
+SESSION_DEFAULTS = {"avatar_id": None, "user_id": None, "end_time": None, "status": "active", "video_path": None, "metadata": {}}
+TURN_DEFAULTS = {
+    "avatar_id": None, "text_length": 0, "prerendered": False, "tts_ms": None, "viseme_ms": None,
+    "lipsync_ms": None, "render_ms": None, "total_ms": None, "video_path": None, "status": "ok",
+}
+
+Op = Tuple[str, str, dict]
+# Queued by stop(): the writer flushes what it holds and exits
+_STOP: Op = ("stop", "", {})
+
+
+def async_database_url(url: str) -> str:
+    for prefix, async_prefix in ASYNC_DRIVERS.items():
+        if url.startswith(prefix):
+            return async_prefix + url[len(prefix):]
+    return url
+
+
+class SessionStore:
+    """Write-behind persistence for session lifecycle and per-turn timings.
+
+    Recording methods only enqueue and never await, so request handlers do
+    not wait on the database. A background task drains the queue in batches
+    of up to PERSIST_BATCH_SIZE (or whatever arrived within
+    PERSIST_FLUSH_INTERVAL), folds repeated updates to one session into a
+    single statement and writes the batch in one transaction. When the queue
+    is full or a batch fails, events are dropped and counted rather than
+    blocking the caller.
+    """
+
+    def __init__(self, database_url: str = None, batch_size: int = None, flush_interval: float = None, queue_size: int = None):
+        self.database_url = async_database_url(database_url or settings.DATABASE_URL)
+        self.batch_size = batch_size or settings.PERSIST_BATCH_SIZE
+        self.flush_interval = flush_interval if flush_interval is not None else settings.PERSIST_FLUSH_INTERVAL
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size or settings.PERSIST_QUEUE_SIZE)
+        self.engine = None
+        self.enabled = False
+        self._task: Optional[asyncio.Task] = None
+        QUEUE_DEPTH.labels("persist").set_function(self._queue.qsize)
+
+        self.written = 0
+        self.dropped = 0
+        self.batches = 0
+        self.failed_batches = 0
+        self.last_flush_ms = None
+
+    async def start(self):
+        from sqlalchemy.ext.asyncio import create_async_engine
+        from backend.models.avatar_model import Base
+
+        engine_options = {"pool_pre_ping": True}
+        if not self.database_url.startswith("sqlite"):
+            engine_options["pool_size"] = settings.DB_POOL_SIZE
+        self.engine = create_async_engine(self.database_url, **engine_options)
+        async with self.engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        self.enabled = True
+        self._task = asyncio.create_task(self._run())
+        logger.info(f"Session store writing to {self.database_url.split('://')[0]} "
+                    f"(batch {self.batch_size}, every {self.flush_interval}s)")
+
+    async def stop(self):
+        """Flush whatever is still queued, then release the engine"""
+        self.enabled = False
+        if self._task:
+            # Queued behind every pending event, so the writer finishes its
+            # current batch and everything before the sentinel first
+            await self._queue.put(_STOP)
+            await self._task
+            self._task = None
+        if self.engine:
+            await self.engine.dispose()
+
+    def session_started(self, session_id: str, avatar_id: str = None, user_id: str = None, metadata: dict = None):
+        """Create the session row if it does not exist yet"""
+        fields = {"avatar_id": avatar_id, "user_id": user_id, "metadata": metadata or {}, "start_time": datetime.utcnow()}
+        self._enqueue(("start", session_id, {k: v for k, v in fields.items() if v is not None}))
+
+    def session_updated(self, session_id: str, **fields):
+        self._enqueue(("update", session_id, fields))
+
+    def session_ended(self, session_id: str, status: str = "ended"):
+        self.session_updated(session_id, status=status, end_time=datetime.utcnow())
+
+    def record_turn(self, session_id: str, **fields):
+        self._enqueue(("turn", session_id, {**fields, "created_at": datetime.utcnow()}))
+
+    def _enqueue(self, op: Op):
+        if not self.enabled:
+            return
+        try:
+            self._queue.put_nowait(op)
+        except asyncio.QueueFull:
+            self.dropped += 1
+            if self.dropped % 1000 == 1:
+                logger.warning(f"Session store queue full, {self.dropped} events dropped so far")
+
+    def _drain(self, limit: Optional[int]) -> List[Op]:
+        batch = []
+        while not self._queue.empty() and (limit is None or len(batch) < limit):
+            batch.append(self._queue.get_nowait())
+        return batch
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.batch_size and batch[-1] is not _STOP:
+                batch.extend(self._drain(self.batch_size - len(batch)))
+                remaining = deadline - loop.time()
+                if len(batch) >= self.batch_size or remaining <= 0 or _STOP in batch:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+            # Nothing is enqueued once stop() has queued the sentinel
+            stopping = _STOP in batch
+            if stopping:
+                batch = [op for op in batch if op is not _STOP]
+            if batch:
+                await self._flush(batch)
+            if stopping:
+                return
+
+    async def _flush(self, batch: List[Op]):
+        from sqlalchemy import insert, select, update
+        from backend.models.avatar_model import AvatarSession, SessionTurn
+
+        sessions = AvatarSession.__table__
+        starts: Dict[str, dict] = {}
+        updates: Dict[str, dict] = {}
+        turns = []
+        for kind, session_id, fields in batch:
+            if kind == "start":
+                starts.setdefault(session_id, fields)
+            elif kind == "update":
+                updates.setdefault(session_id, {}).update(fields)
+            else:
+                turns.append({**TURN_DEFAULTS, **fields, "session_id": session_id})
+
+        t0 = time.perf_counter()
+        try:
+            async with self.engine.begin() as conn:
+                session_ids = set(starts) | set(updates)
+                if session_ids:
+                    result = await conn.execute(
+                        select(sessions.c.session_id).where(sessions.c.session_id.in_(session_ids))
+                    )
+                    existing = set(result.scalars())
+                    # New sessions are inserted with their pending updates folded in
+                    new_rows = [
+                        {
+                            **SESSION_DEFAULTS,
+                            "start_time": datetime.utcnow(),
+                            **starts.get(session_id, {}),
+                            **updates.pop(session_id, {}),
+                            "session_id": session_id,
+                        }
+                        for session_id in sorted(session_ids - existing)
+                    ]
+                    if new_rows:
+                        await conn.execute(insert(sessions), new_rows)
+                    for session_id, fields in updates.items():
+                        await conn.execute(
+                            update(sessions).where(sessions.c.session_id == session_id).values(**fields)
+                        )
+                if turns:
+                    await conn.execute(insert(SessionTurn.__table__), turns)
+        except Exception as e:
+            self.failed_batches += 1
+            self.dropped += len(batch)
+            logger.error(f"Session store flush of {len(batch)} events failed: {e}")
+            return
+
+        self.batches += 1
+        self.written += len(batch)
+        self.last_flush_ms = round((time.perf_counter() - t0) * 1000, 2)
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "queued": self._queue.qsize(),
+            "written": self.written,
+            "dropped": self.dropped,
+            "batches": self.batches,
+            "failed_batches": self.failed_batches,
+            "last_flush_ms": self.last_flush_ms,
+        }
@@ -1,49 +1,467 @@
 import asyncio
+import fractions
+import time
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, List, Optional
+
 import numpy as np
 from aiortc import MediaStreamTrack
-from av import VideoFrame
+from aiortc.mediastreams import MediaStreamError
+from av import AudioFrame, VideoFrame
 from loguru import logger
 
+from backend.config import settings
+from backend.services.audio_ingest import PolyphaseResampler
+from backend.services.idle_loop import IdleLoop, even_size, load_idle_loop
+from backend.utils.audio import PCMAudio
+from backend.utils.metrics import ERRORS, FRAMES, STAGE_SECONDS, STREAM_FRAMES, STREAM_JITTER
+from backend.utils.singleflight import SingleFlight
+
+VIDEO_CLOCK_RATE = 90000
+VIDEO_TIME_BASE = fractions.Fraction(1, VIDEO_CLOCK_RATE)
+AUDIO_PTIME = 0.02  # 20 ms audio frames, the Opus packetization browsers use
+# Frames rendered per worker-thread hop; small so the first ones go out early
+RENDER_BATCH = 4
+# Finished replies are kept this long past their end so the slower track drains them
+UTTERANCE_GRACE = 0.5
+# How much faster than real time the idle loop winds back to its neutral frame before a reply
+IDLE_RETURN_SPEED = 3.0
+
+
+class MediaClock:
+    """Wall-clock timebase shared by a session's audio and video tracks.
+
+    Media time 0 is the first `recv()` of either track. Each track sleeps
+    until `start + t` for its next frame and stamps pts from that same `t`,
+    so audio and video scheduled for one media time leave together.
+    """
+
+    def __init__(self):
+        self.start: Optional[float] = None
+
+    def now(self) -> float:
+        if self.start is None:
+            self.start = time.monotonic()
+        return time.monotonic() - self.start
+
+    async def wait_until(self, t: float):
+        delay = t - self.now()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+class Utterance:
+    """One live reply: PCM and frames as they are produced, played from `start`.
+
+    `start` (media time) is set when the first frames arrive, so the reply's
+    audio and video begin together however long TTS and the first render
+    took. Speech is never skipped: if the audio runs dry before the reply is
+    finished, `start` moves later by the gap, so the video holds its frame
+    and playout resumes where it stopped once more audio arrives.
+    """
+
+    def __init__(self, source: "LiveAvatarSource"):
+        self.source = source
+        self.start: Optional[float] = None
+        self.finished = False
+        self.frames: Deque[np.ndarray] = deque()
+        self.frame_base = 0
+        self.frames_total = 0
+        # Last frame index asked for and last one handed out
+        self.requested = -1
+        self.shown = -1
+        self.audio = np.zeros(0, dtype=np.int16)
+        self.audio_base = 0
+        self.samples_total = 0
+        self._resampler: Optional[PolyphaseResampler] = None
+
+    @property
+    def end(self) -> float:
+        return self.start + self.samples_total / self.source.sample_rate
+
+    def push_audio(self, audio: PCMAudio):
+        if self._resampler is None or self._resampler.in_rate != audio.sample_rate:
+            self._resampler = PolyphaseResampler(audio.sample_rate, self.source.sample_rate)
+        self._append_audio(self._resampler.process(audio.samples))
+
+    def push_frames(self, frames: List[np.ndarray]):
+        self.frames.extend(frames)
+        self.frames_total += len(frames)
+        self._schedule()
+
+    def finish(self):
+        if self._resampler is not None:
+            self._append_audio(self._resampler.flush())
+        self._schedule()
+        self.finished = True
+
+    def _append_audio(self, samples: np.ndarray):
+        pcm = (np.clip(samples, -1.0, 1.0) * 32767).astype(np.int16)
+        self.audio = np.concatenate([self.audio, pcm])
+        self.samples_total += len(pcm)
+
+    def _schedule(self):
+        if self.start is None:
+            self.start = self.source.next_start()
+
+    def frame_at(self, t: float) -> Optional[np.ndarray]:
+        """Frame for media time `t`; the newest one while rendering lags behind"""
+        index = int((t - self.start) * self.source.fps)
+        late = 0
+        while index > self.frame_base and len(self.frames) > 1:
+            # Its slot came and went while the previous frame was held;
+            # frames of slots the consumer skipped are counted there
+            if self.frame_base <= self.requested and self.frame_base != self.shown:
+                late += 1
+            self.frames.popleft()
+            self.frame_base += 1
+        self.requested = max(self.requested, index)
+        if late:
+            self.source.video.frames_late(late)
+        if self.finished and index >= self.frames_total:
+            return None
+        if not self.frames:
+            return None
+        self.shown = self.frame_base
+        return self.frames[0]
+
+    def audio_at(self, t: float, count: int) -> np.ndarray:
+        """The next `count` samples for media time `t`, silence where none are buffered"""
+        sample_rate = self.source.sample_rate
+        first = int(round((t - self.start) * sample_rate))
+        if first != self.audio_base and (self.audio_base < self.samples_total or not self.finished):
+            # Playout got ahead of the buffered speech (or started mid-frame):
+            # pause the reply's timeline instead of skipping samples
+            self.source.delay(self, (first - self.audio_base) / sample_rate)
+        out = np.zeros(count, dtype=np.int16)
+        available = min(count, len(self.audio))
+        out[:available] = self.audio[:available]
+        self.audio = self.audio[available:]
+        self.audio_base += available
+        return out
+
+
+class LiveAvatarSource:
+    """Per-session playout state read by the paired audio and video tracks.
+
+    Replies are queued back to back on the shared clock; between them the
+    video plays `idle_loop` (or holds `idle_frame` until the loop is loaded)
+    and the audio is silent.
+    """
+
+    def __init__(self, idle_frame: np.ndarray, fps: int = None, sample_rate: int = None):
+        self.clock = MediaClock()
+        self.fps = fps or settings.VIDEO_FPS
+        self.sample_rate = sample_rate or settings.RTC_AUDIO_SAMPLE_RATE
+        self.idle_frame = idle_frame
+        self.idle_loop: Optional[IdleLoop] = None
+        self.pixel_format = "rgba" if idle_frame.ndim == 3 and idle_frame.shape[2] == 4 else "rgb24"
+        # Every frame is sent at the idle loop's (even) size so the encoder never restarts
+        self.width, self.height = even_size(idle_frame)
+        self.utterances: Deque[Utterance] = deque()
+        self.video = VideoStreamTrack(self)
+        self.audio = AudioStreamTrack(self)
+
+    def begin(self) -> Utterance:
+        utterance = Utterance(self)
+        self.utterances.append(utterance)
+        return utterance
+
+    def next_start(self) -> float:
+        start = self.clock.now() + settings.RTC_PLAYOUT_DELAY
+        for utterance in self.utterances:
+            if utterance.start is not None:
+                start = max(start, utterance.end)
+        return start
+
+    def delay(self, utterance: Utterance, seconds: float):
+        """Move `utterance` and the replies queued after it later by `seconds`"""
+        shifting = False
+        for queued in self.utterances:
+            shifting = shifting or queued is utterance
+            if shifting and queued.start is not None:
+                queued.start += seconds
+
+    def _playing(self, t: float) -> Optional[Utterance]:
+        while self.utterances:
+            head = self.utterances[0]
+            if head.finished and head.start is not None and t >= head.end + UTTERANCE_GRACE:
+                self.utterances.popleft()
+                continue
+            if head.start is not None and t >= head.start:
+                return head
+            return None
+        return None
+
+    def video_frame(self, t: float) -> Optional[np.ndarray]:
+        """The reply frame for media time `t`, or None when idle"""
+        utterance = self._playing(t)
+        return utterance.frame_at(t) if utterance is not None else None
+
+    def speech_pending(self, t: float) -> bool:
+        """A reply is being prepared but has not started playing"""
+        return bool(self.utterances) and self._playing(t) is None
+
+    def to_video_frame(self, array: np.ndarray) -> VideoFrame:
+        if array.shape[0] != self.height or array.shape[1] != self.width:
+            array = np.ascontiguousarray(array[:self.height, :self.width])
+        return VideoFrame.from_ndarray(array, format=self.pixel_format)
+
+    def audio_samples(self, t: float, count: int) -> np.ndarray:
+        utterance = self._playing(t)
+        if utterance is None:
+            return np.zeros(count, dtype=np.int16)
+        return utterance.audio_at(t, count)
+
+    def stats(self) -> dict:
+        return {"video": self.video.stats(), "queued_replies": len(self.utterances)}
+
+    def stop(self):
+        self.video.stop()
+        self.audio.stop()
+
+
 class VideoStreamTrack(MediaStreamTrack):
-    """A video track that yields frames from an async generator."""
+    """Avatar video at a fixed frame rate, paced and stamped by the session clock.
+
+    Frame slots are fixed on the clock. When the consumer (the encoder)
+    falls more than a slot behind, the missed slots are dropped rather than
+    sent late, so latency stays bounded; when rendering falls behind, the
+    last frame is repeated and the frames that arrive after their slot are
+    dropped. Both kinds of drop are counted. Repeated slots reuse the
+    converted frame.
+
+    Idle slots play the avatar's cached idle loop, a plane copy per new
+    loop frame. The loop starts from its neutral frame, which matches the
+    pose speech frames are drawn in, and while a reply is pending it winds
+    back to that frame through its neighbours, so neither hand-off jumps.
+    """
     kind = "video"
 
-    def __init__(self, frame_generator, fps=30):
+    def __init__(self, source: LiveAvatarSource):
         super().__init__()
-        self.frame_generator = frame_generator
-        self.fps = fps
+        self.source = source
         self.counter = 0
+        self.sent = 0
+        self.dropped = 0
+        self.repeated = 0
+        self.jitter_total = 0.0
+        self.jitter_max = 0.0
+        self._idle: Optional[VideoFrame] = None
+        self._idle_pos: Optional[float] = None
+        self._idle_t = 0.0
+        self._idle_index = -1
+        self._idle_loop_frame: Optional[VideoFrame] = None
+        self._last_array: Optional[np.ndarray] = None
+        self._last_frame: Optional[VideoFrame] = None
 
-    async def recv(self):
-        # Wait for next frame
-        try:
-            frame = await self.frame_generator.__anext__()
-        except StopAsyncIteration:
-            # End of stream, send a black frame
-            frame = np.zeros((1080, 1920, 3), dtype=np.uint8)
-        except Exception as e:
-            logger.error(f"Error in video stream: {e}")
-            frame = np.zeros((1080, 1920, 3), dtype=np.uint8)
+    async def recv(self) -> VideoFrame:
+        if self.readyState != "live":
+            raise MediaStreamError
+        fps = self.source.fps
+        behind = self.source.clock.now() - self.counter / fps
+        if behind > 1 / fps:
+            missed = int(behind * fps)
+            self.counter += missed
+            self.dropped += missed
+            STREAM_FRAMES.labels("dropped").inc(missed)
+        t = self.counter / fps
+        self.counter += 1
+        await self.source.clock.wait_until(t)
+        jitter = max(0.0, self.source.clock.now() - t)
+
+        array = self.source.video_frame(t)
+        if array is None:
+            frame = self._idle_video(t)
+            self._last_array = None
+        else:
+            self._idle_pos = None
+            if array is self._last_array:
+                frame = self._last_frame
+                self.repeated += 1
+                STREAM_FRAMES.labels("repeated").inc()
+            else:
+                frame = self.source.to_video_frame(array)
+            self._last_array, self._last_frame = array, frame
+
+        # Reusing a frame object is safe: the sender encodes it before calling recv() again
+        frame.pts = int(round(t * VIDEO_CLOCK_RATE))
+        frame.time_base = VIDEO_TIME_BASE
+        self.sent += 1
+        self.jitter_total += jitter
+        self.jitter_max = max(self.jitter_max, jitter)
+        STREAM_FRAMES.labels("sent").inc()
+        STREAM_JITTER.observe(jitter)
+        return frame
+
+    def frames_late(self, count: int):
+        """Rendered frames discarded because they arrived after their slot"""
+        self.dropped += count
+        STREAM_FRAMES.labels("dropped").inc(count)
+
+    def _idle_video(self, t: float) -> VideoFrame:
+        loop = self.source.idle_loop
+        if loop is None:
+            if self._idle is None:
+                # Converted once to the encoder's input format
+                self._idle = self.source.to_video_frame(self.source.idle_frame).reformat(format="yuv420p")
+            return self._idle
+
+        count = len(loop)
+        if self._idle_pos is None:
+            self._idle_pos = 0.0
+        elif self.source.speech_pending(t):
+            step = IDLE_RETURN_SPEED * (t - self._idle_t) * loop.fps
+            pos = self._idle_pos % count
+            self._idle_pos = max(0.0, pos - step) if pos < count / 2 else min(float(count), pos + step)
+        else:
+            self._idle_pos += (t - self._idle_t) * loop.fps
+        self._idle_t = t
+
+        index = int(self._idle_pos) % count
+        if index != self._idle_index:
+            self._idle_loop_frame = VideoFrame.from_ndarray(loop.frames[index], format="yuv420p")
+            self._idle_index = index
+        return self._idle_loop_frame
+
+    def stats(self) -> dict:
+        return {
+            "sent": self.sent,
+            "dropped": self.dropped,
+            "repeated": self.repeated,
+            "jitter_ms": {
+                "mean": round(self.jitter_total / self.sent * 1000, 3) if self.sent else None,
+                "max": round(self.jitter_max * 1000, 3),
+            },
+        }
+
+
+class AudioStreamTrack(MediaStreamTrack):
+    """Mono s16 reply audio in 20 ms frames on the same clock as the video"""
+    kind = "audio"
+
+    def __init__(self, source: LiveAvatarSource):
+        super().__init__()
+        self.source = source
+        self.samples_per_frame = int(source.sample_rate * AUDIO_PTIME)
+        self.time_base = fractions.Fraction(1, source.sample_rate)
+        self.counter = 0
 
-        # Convert to VideoFrame
-        video_frame = VideoFrame.from_ndarray(frame, format="bgr24")
-        video_frame.pts = self.counter
-        video_frame.time_base = 1 / self.fps
+    async def recv(self) -> AudioFrame:
+        if self.readyState != "live":
+            raise MediaStreamError
+        pts = self.counter * self.samples_per_frame
+        t = pts / self.source.sample_rate
         self.counter += 1
-        return video_frame
+        await self.source.clock.wait_until(t)
+
+        samples = self.source.audio_samples(t, self.samples_per_frame)
+        frame = AudioFrame.from_ndarray(samples.reshape(1, -1), format="s16", layout="mono")
+        frame.sample_rate = self.source.sample_rate
+        frame.pts = pts
+        frame.time_base = self.time_base
+        return frame
+
+
+def _take(frames, count: int) -> List[np.ndarray]:
+    batch = []
+    for frame in frames:
+        batch.append(frame)
+        if len(batch) == count:
+            break
+    return batch
 
 
 class StreamingService:
-    def __init__(self):
-        self.active_streams = {}
-
-    async def start_stream(self, session_id, frame_generator):
-        """Start streaming frames for a session"""
-        track = VideoStreamTrack(frame_generator)
-        self.active_streams[session_id] = track
-        return track
-
-    async def stop_stream(self, session_id):
-        """Stop streaming for a session"""
-        if session_id in self.active_streams:
-            del self.active_streams[session_id]
\ No newline at end of file
+    """Live WebRTC delivery: TTS chunks and lip-sync frames go straight to the tracks.
+
+    Per chunk of streamed TTS the audio is queued on the session's audio
+    track and its frames are rendered a few at a time in a worker thread
+    and queued on the video track; nothing is muxed or written to disk.
+    """
+
+    def __init__(self, tts_service, viseme_service, lipsync_service, avatar_id: str = None):
+        self.tts = tts_service
+        self.viseme = viseme_service
+        self.lipsync = lipsync_service
+        self.avatar_id = avatar_id or settings.DEFAULT_AVATAR
+        self.active_streams: Dict[str, LiveAvatarSource] = {}
+        self._idle_loads = SingleFlight()
+
+    def create_source(self) -> LiveAvatarSource:
+        source = LiveAvatarSource(self.lipsync.avatar)
+        asyncio.create_task(self._attach_idle_loop(source))
+        return source
+
+    def start_stream(self, session_id: str) -> LiveAvatarSource:
+        """Fresh audio/video track pair for a session, replacing any previous one"""
+        self.stop_stream(session_id)
+        source = self.active_streams[session_id] = self.create_source()
+        return source
+
+    async def _attach_idle_loop(self, source: LiveAvatarSource):
+        # Rendered once per avatar and size; until then the stream holds the still frame
+        try:
+            source.idle_loop = await self._idle_loads.do(
+                self.avatar_id, asyncio.to_thread,
+                load_idle_loop, self.avatar_id, self.lipsync.avatar, self.lipsync.mouth_region
+            )
+        except Exception as e:
+            logger.warning(f"Idle loop unavailable for {self.avatar_id}: {e}")
+
+    def stop_stream(self, session_id: str):
+        source = self.active_streams.pop(session_id, None)
+        if source is not None:
+            source.stop()
+            logger.info(f"Live stream for {session_id} stopped: {source.stats()['video']}")
+
+    def get_stream(self, session_id: str) -> Optional[LiveAvatarSource]:
+        return self.active_streams.get(session_id)
+
+    async def speak(self, session_id: str, text: str,
+                    on_first_frame: Callable[[float], Awaitable[None]] = None) -> dict:
+        """Stream a reply to the session's tracks; returns once it is fully queued"""
+        return await self.speak_to(self.active_streams[session_id], text, on_first_frame)
+
+    async def speak_to(self, source: LiveAvatarSource, text: str,
+                       on_first_frame: Callable[[float], Awaitable[None]] = None) -> dict:
+        started = time.perf_counter()
+        stats = {"first_frame_ms": None, "frames": 0, "audio_seconds": 0.0, "stream": None}
+        utterance = source.begin()
+        timings = []
+        offset = 0.0
+        try:
+            async for chunk in self.tts.synthesize_stream(text):
+                audio = chunk["audio"]
+                timings.extend(chunk["timings"])
+                if audio is None or not len(audio):
+                    continue
+                utterance.push_audio(audio)
+                timeline = self.viseme.generate_visemes(timings, self.tts.language)
+
+                frames = self.lipsync.iter_frames(audio, timeline, fps=source.fps, offset=offset)
+                while True:
+                    batch = await asyncio.to_thread(_take, frames, RENDER_BATCH)
+                    if not batch:
+                        break
+                    utterance.push_frames(batch)
+                    FRAMES.labels("live").inc(len(batch))
+                    stats["frames"] += len(batch)
+                    if stats["first_frame_ms"] is None:
+                        elapsed = time.perf_counter() - started
+                        STAGE_SECONDS.labels("live_first_frame").observe(elapsed)
+                        stats["first_frame_ms"] = elapsed * 1000
+                        if on_first_frame is not None:
+                            await on_first_frame(elapsed)
+                offset += audio.duration
+        except Exception:
+            ERRORS.labels("live").inc()
+            raise
+        finally:
+            utterance.finish()
+
+        stats["audio_seconds"] = offset
+        stats["stream"] = source.stats()
+        STAGE_SECONDS.labels("live").observe(time.perf_counter() - started)
+        logger.debug(f"Live reply: {stats['frames']} frames, {offset:.2f}s audio")
+        return stats
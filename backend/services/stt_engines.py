@@ -0,0 +1,177 @@
+import abc
+import asyncio
+import hashlib
+import io
+import time
+import numpy as np
+from loguru import logger
+from typing import Optional
+
+from backend.config import settings
+from backend.utils.helpers import pcm_to_wav
+from backend.utils.registry import LazyRegistry
+
+
+class STTEngine(abc.ABC):
+    """Base class for speech-to-text engines.
+
+    Engines receive 16-bit mono PCM. Blocking engines implement `transcribe`
+    and are run by `SpeechToTextService` in its bounded executor; engines with
+    a native async client derive from `AsyncSTTEngine` instead.
+    """
+    name = "base"
+    blocking = True
+
+    def __init__(self, language: str = "hi-IN"):
+        self.language = language
+
+    @abc.abstractmethod
+    def transcribe(self, pcm: bytes, sample_rate: int) -> Optional[str]:
+        ...
+
+    async def atranscribe(self, pcm: bytes, sample_rate: int) -> Optional[str]:
+        return await asyncio.to_thread(self.transcribe, pcm, sample_rate)
+
+    def close(self):
+        pass
+
+
+class AsyncSTTEngine(STTEngine):
+    """Base class for engines with a native async client; they implement `atranscribe`"""
+    blocking = False
+
+    @abc.abstractmethod
+    async def atranscribe(self, pcm: bytes, sample_rate: int) -> Optional[str]:
+        ...
+
+    def transcribe(self, pcm: bytes, sample_rate: int) -> Optional[str]:
+        # For callers without a running event loop
+        return asyncio.run(self.atranscribe(pcm, sample_rate))
+
+
+class GoogleSTTEngine(STTEngine):
+    """Google Web Speech API through speech_recognition"""
+    name = "google"
+
+    def __init__(self, language: str = "hi-IN"):
+        super().__init__(language)
+        import speech_recognition as sr
+        self._sr = sr
+        self.recognizer = sr.Recognizer()
+        self.recognizer.dynamic_energy_threshold = True
+        self.recognizer.energy_threshold = 3000
+        self.recognizer.operation_timeout = settings.STT_TIMEOUT
+
+    def transcribe(self, pcm: bytes, sample_rate: int) -> Optional[str]:
+        audio = self._sr.AudioData(pcm, sample_rate, 2)
+        try:
+            return self.recognizer.recognize_google(audio, language=self.language)
+        except self._sr.UnknownValueError:
+            # No speech detected
+            return None
+
+
+class AzureSTTEngine(STTEngine):
+    """Azure Cognitive Services STT, sharing one SpeechConfig across calls"""
+    name = "azure"
+
+    def __init__(self, language: str = "hi-IN"):
+        super().__init__(language)
+        import azure.cognitiveservices.speech as speechsdk
+        self._speechsdk = speechsdk
+        self.speech_config = speechsdk.SpeechConfig(
+            subscription=settings.AZURE_SPEECH_KEY,
+            region=settings.AZURE_SPEECH_REGION
+        )
+        self.speech_config.speech_recognition_language = language
+
+    def transcribe(self, pcm: bytes, sample_rate: int) -> Optional[str]:
+        speechsdk = self._speechsdk
+        stream_format = speechsdk.audio.AudioStreamFormat(
+            samples_per_second=sample_rate, bits_per_sample=16, channels=1
+        )
+        stream = speechsdk.audio.PushAudioInputStream(stream_format=stream_format)
+        stream.write(pcm)
+        stream.close()
+
+        # A recognizer is bound to its audio input, so only the config is shared
+        recognizer = speechsdk.SpeechRecognizer(
+            speech_config=self.speech_config,
+            audio_config=speechsdk.audio.AudioConfig(stream=stream)
+        )
+        result = recognizer.recognize_once()
+        if result.reason == speechsdk.ResultReason.RecognizedSpeech:
+            return result.text
+        return None
+
+
+class WhisperSTTEngine(AsyncSTTEngine):
+    """OpenAI Whisper STT (native async client)"""
+    name = "whisper"
+
+    def __init__(self, language: str = "hi-IN"):
+        super().__init__(language)
+        import openai
+        self._openai = openai
+
+    async def atranscribe(self, pcm: bytes, sample_rate: int) -> Optional[str]:
+        audio_file = io.BytesIO(pcm_to_wav(pcm, sample_rate))
+        audio_file.name = "audio.wav"
+
+        response = await self._openai.Audio.atranscribe(
+            model="whisper-1",
+            file=audio_file,
+            language=self.language[:2]  # 'hi' for Hindi
+        )
+        return response.text
+
+
+class LocalSTTEngine(STTEngine):
+    """Deterministic offline engine for load tests and development.
+
+    Returns `STT_LOCAL_TRANSCRIPT` (or a transcript derived from the audio
+    digest) for any chunk louder than `STT_LOCAL_ENERGY_THRESHOLD`, after an
+    optional simulated latency of `STT_LOCAL_LATENCY` seconds.
+    """
+    name = "local"
+
+    def __init__(self, language: str = "hi-IN"):
+        super().__init__(language)
+        self.transcript = settings.STT_LOCAL_TRANSCRIPT
+        self.latency = settings.STT_LOCAL_LATENCY
+        self.energy_threshold = settings.STT_LOCAL_ENERGY_THRESHOLD
+
+    def transcribe(self, pcm: bytes, sample_rate: int) -> Optional[str]:
+        if self.latency > 0:
+            time.sleep(self.latency)
+
+        samples = np.frombuffer(pcm[:len(pcm) - len(pcm) % 2], dtype=np.int16)
+        if samples.size == 0:
+            return None
+        rms = float(np.sqrt(np.mean(samples.astype(np.float32) ** 2)))
+        if rms < self.energy_threshold:
+            return None
+
+        if self.transcript:
+            return self.transcript
+        digest = hashlib.md5(pcm).hexdigest()[:8]
+        return f"utterance {digest} {samples.size * 1000 // sample_rate}ms"
+
+
+# Engine SDKs are imported by the constructors, so only the selected one loads.
+# Out-of-tree engines can be added with STT_ENGINES.register("name", "pkg.module:Class").
+STT_ENGINES = LazyRegistry("stt engine", {
+    "google": GoogleSTTEngine,
+    "azure": AzureSTTEngine,
+    "whisper": WhisperSTTEngine,
+    "local": LocalSTTEngine,
+})
+
+
+def create_stt_engine(engine: str, language: str = "hi-IN") -> STTEngine:
+    """Instantiate the engine registered under `engine` (falls back to Google)"""
+    engine_cls = STT_ENGINES.get(engine)
+    if engine_cls is None:
+        logger.warning(f"Unknown STT engine '{engine}', falling back to google")
+        engine_cls = GoogleSTTEngine
+    return engine_cls(language)
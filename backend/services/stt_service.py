@@ -1,115 +1,246 @@
 import asyncio
-import speech_recognition as sr
-import io
-import wave
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 from loguru import logger
-from typing import Optional, AsyncGenerator
-import aiohttp
-import json
+from typing import Optional, AsyncGenerator, Awaitable, Callable
+
+from backend.config import settings
+from backend.services.audio_ingest import AudioIngest
+from backend.services.stt_engines import create_stt_engine
+from backend.utils.metrics import ERRORS, QUEUE_DEPTH, STAGE_SECONDS
 
 class SpeechToTextService:
     def __init__(self, engine="google", language="hi-IN"):
-        self.engine = engine
         self.language = language
-        self.recognizer = sr.Recognizer()
-        
-        # Adjust for ambient noise
-        self.recognizer.dynamic_energy_threshold = True
-        self.recognizer.energy_threshold = 3000
-        
-    async def convert_stream(self, audio_generator: AsyncGenerator[bytes, None]) -> AsyncGenerator[str, None]:
-        """Convert audio stream to text in real-time"""
-        async for audio_chunk in audio_generator:
-            text = await self._convert_chunk(audio_chunk)
-            if text:
-                yield text
-                
+        self.engine = create_stt_engine(engine, language)
+        self.sample_rate = settings.AUDIO_SAMPLE_RATE
+        self.timeout = settings.STT_TIMEOUT
+
+        # Blocking engines run here so recognition never stalls the event loop
+        self.executor = ThreadPoolExecutor(
+            max_workers=settings.STT_MAX_WORKERS,
+            thread_name_prefix="stt"
+        )
+        self._slots = asyncio.Semaphore(settings.STT_MAX_WORKERS)
+
+    async def convert_stream(self, audio_generator: AsyncGenerator[bytes, None]) -> AsyncGenerator[dict, None]:
+        """Convert a PCM stream to `text_partial` / `text_recognized` events in real-time"""
+        queue: asyncio.Queue = asyncio.Queue()
+        stream = self.open_stream(emit=queue.put)
+
+        async def pump():
+            try:
+                async for audio_chunk in audio_generator:
+                    await stream.push(audio_chunk)
+                await stream.finish()
+            finally:
+                await queue.put(None)
+
+        task = asyncio.create_task(pump())
+        try:
+            while (event := await queue.get()) is not None:
+                yield event
+            await task
+        finally:
+            stream.close()
+            task.cancel()
+
+    def open_stream(self, emit: Callable[[dict], Awaitable], on_stable_partial: Callable[[str, str], Awaitable] = None) -> "RecognitionStream":
+        """Open an endpointed recognition stream emitting events through `emit`"""
+        return RecognitionStream(self, emit, on_stable_partial)
+
+    def create_ingest(self, fmt: str = "pcm16", sample_rate: Optional[int] = None, channels: int = 1) -> AudioIngest:
+        """Create a per-stream decoder producing PCM at the recognizer rate"""
+        return AudioIngest(
+            fmt=fmt,
+            sample_rate=sample_rate or self.sample_rate,
+            channels=channels,
+            target_rate=self.sample_rate
+        )
+
     async def _convert_chunk(self, audio_data: bytes) -> Optional[str]:
-        """Convert single audio chunk to text"""
+        """Convert single chunk of 16-bit mono PCM to text"""
+        pending = QUEUE_DEPTH.labels("stt_pending")
+        pending.inc()
         try:
-            # Convert to WAV format
-            wav_data = self._convert_to_wav(audio_data)
-            
-            # Use speech recognition
-            with sr.AudioFile(io.BytesIO(wav_data)) as source:
-                audio = self.recognizer.record(source)
-                
-            if self.engine == "google":
-                text = self.recognizer.recognize_google(audio, language=self.language)
-            elif self.engine == "azure":
-                text = await self._azure_speech_to_text(wav_data)
-            elif self.engine == "whisper":
-                text = await self._whisper_stt(wav_data)
-            else:
-                text = self.recognizer.recognize_google(audio, language=self.language)
-                
-            logger.info(f"STT: {text}")
+            with STAGE_SECONDS.time("stt"):
+                text = await asyncio.wait_for(
+                    self._transcribe(audio_data),
+                    timeout=self.timeout
+                )
+
+            if text:
+                logger.info(f"STT: {text}")
             return text
-            
-        except sr.UnknownValueError:
-            # No speech detected
+
+        except asyncio.TimeoutError:
+            ERRORS.labels("stt_timeout").inc()
+            logger.warning(f"STT timed out after {self.timeout}s ({self.engine.name})")
             return None
         except Exception as e:
+            ERRORS.labels("stt").inc()
             logger.error(f"STT error: {e}")
             return None
-            
-    def _convert_to_wav(self, audio_data: bytes, sample_rate=16000) -> bytes:
-        """Convert raw audio to WAV format"""
-        try:
-            # Assuming audio_data is in appropriate format
-            # In production, you'd use proper audio conversion
-            wav_io = io.BytesIO()
-            with wave.open(wav_io, 'wb') as wav_file:
-                wav_file.setnchannels(1)
-                wav_file.setsampwidth(2)
-                wav_file.setframerate(sample_rate)
-                wav_file.writeframes(audio_data)
-            return wav_io.getvalue()
-        except Exception as e:
-            logger.error(f"Audio conversion error: {e}")
-            return audio_data
-            
-    async def _azure_speech_to_text(self, audio_data: bytes) -> Optional[str]:
-        """Use Azure Cognitive Services for STT"""
-        try:
-            import azure.cognitiveservices.speech as speechsdk
-            
-            speech_config = speechsdk.SpeechConfig(
-                subscription=settings.AZURE_SPEECH_KEY,
-                region=settings.AZURE_SPEECH_REGION
-            )
-            speech_config.speech_recognition_language = self.language
-            
-            audio_input = speechsdk.AudioDataStream(audio_data)
-            recognizer = speechsdk.SpeechRecognizer(speech_config, audio_input)
-            
-            result = await recognizer.recognize_once_async()
-            
-            if result.reason == speechsdk.ResultReason.RecognizedSpeech:
-                return result.text
-                
-        except Exception as e:
-            logger.error(f"Azure STT error: {e}")
-            return None
-            
-    async def _whisper_stt(self, audio_data: bytes) -> Optional[str]:
-        """Use OpenAI Whisper for STT"""
+        finally:
+            pending.dec()
+
+    async def _transcribe(self, pcm: bytes) -> Optional[str]:
+        """Run the engine in a worker slot.
+
+        A blocking call that times out cannot be stopped, so its slot is only
+        given back when its thread returns: hung calls then make new requests
+        time out waiting for a slot instead of queueing behind them in the
+        executor.
+        """
+        await self._slots.acquire()
+        if not self.engine.blocking:
+            try:
+                return await self.engine.atranscribe(pcm, self.sample_rate)
+            finally:
+                self._slots.release()
+        loop = asyncio.get_running_loop()
+        job = self.executor.submit(self.engine.transcribe, pcm, self.sample_rate)
+        job.add_done_callback(lambda _: self._release_slot(loop))
+        return await asyncio.wrap_future(job, loop=loop)
+
+    def _release_slot(self, loop: asyncio.AbstractEventLoop):
+        # Called from the worker thread
         try:
-            import openai
-            
-            # Convert to format Whisper expects
-            audio_file = io.BytesIO(audio_data)
-            audio_file.name = "audio.wav"
-            
-            response = await openai.Audio.atranscribe(
-                model="whisper-1",
-                file=audio_file,
-                language=self.language[:2]  # 'hi' for Hindi
-            )
-            
-            return response.text
-            
-        except Exception as e:
-            logger.error(f"Whisper STT error: {e}")
-            return None
\ No newline at end of file
+            loop.call_soon_threadsafe(self._slots.release)
+        except RuntimeError:
+            pass  # the loop is gone, and the semaphore with it
+
+    def close(self):
+        """Release the engine client and stop the executor"""
+        self.engine.close()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+class RecognitionStream:
+    """Endpointed recognition over a continuous 16-bit PCM stream.
+
+    Audio is accumulated per utterance. While speech is ongoing the engine is
+    re-run on the utterance so far every `STT_PARTIAL_INTERVAL` seconds and a
+    `text_partial` event is emitted; a partial whose text matches the previous
+    one is marked `stable` and handed to `on_stable_partial` so callers can
+    start downstream work speculatively. Trailing silence, the utterance
+    length cap or `finish()` close the segment with a `text_recognized` event
+    carrying the same `segment_id`.
+    """
+    FRAME_SECONDS = 0.02
+    PREROLL_SECONDS = 0.3
+
+    def __init__(self, service: SpeechToTextService, emit, on_stable_partial=None):
+        self.service = service
+        self.emit = emit
+        self.on_stable_partial = on_stable_partial
+        self.stream_id = uuid.uuid4().hex[:8]
+
+        rate = service.sample_rate
+        self.frame_bytes = int(rate * self.FRAME_SECONDS) * 2
+        self.partial_bytes = int(rate * settings.STT_PARTIAL_INTERVAL) * 2
+        self.max_bytes = int(rate * settings.STT_MAX_UTTERANCE) * 2
+        self.endpoint_frames = max(1, int(settings.STT_ENDPOINT_SILENCE / self.FRAME_SECONDS))
+        self.preroll_frames = int(self.PREROLL_SECONDS / self.FRAME_SECONDS)
+        self.threshold = settings.STT_VAD_THRESHOLD
+
+        self._seq = 0
+        self._remainder = b""
+        self._preroll = []
+        self._utterance = bytearray()
+        self._segment_id: Optional[str] = None
+        self._silent_frames = 0
+        self._since_partial = 0
+        self._last_partial: Optional[str] = None
+        self._speculated: Optional[str] = None
+        self._partial_task: Optional[asyncio.Task] = None
+
+    async def push(self, pcm: bytes):
+        """Feed PCM; emits events for any partial or finished segment"""
+        data = self._remainder + pcm
+        split = len(data) - len(data) % self.frame_bytes
+        self._remainder = data[split:]
+        if not split:
+            return
+
+        frames = np.frombuffer(data[:split], dtype=np.int16).reshape(-1, self.frame_bytes // 2)
+        rms = np.sqrt(np.mean(frames.astype(np.float32) ** 2, axis=1))
+        voiced = rms >= self.threshold
+
+        for frame, is_voiced in zip(frames, voiced):
+            frame = frame.tobytes()
+            if self._segment_id is None:
+                self._preroll.append(frame)
+                del self._preroll[:-self.preroll_frames or None]
+                if is_voiced:
+                    self._open_segment()
+                continue
+
+            self._utterance.extend(frame)
+            self._since_partial += len(frame)
+            self._silent_frames = 0 if is_voiced else self._silent_frames + 1
+            if self._silent_frames >= self.endpoint_frames or len(self._utterance) >= self.max_bytes:
+                await self._close_segment()
+
+        if self._segment_id and self._since_partial >= self.partial_bytes:
+            if self._partial_task is None or self._partial_task.done():
+                self._since_partial = 0
+                self._partial_task = asyncio.create_task(
+                    self._partial(self._segment_id, bytes(self._utterance))
+                )
+
+    async def finish(self):
+        """End of input: finalize the open segment, if any"""
+        if self._remainder and self._segment_id:
+            self._utterance.extend(self._remainder)
+        self._remainder = b""
+        if self._segment_id:
+            await self._close_segment()
+
+    async def recognize_once(self, pcm: bytes):
+        """Recognize a complete utterance as its own segment, bypassing endpointing"""
+        segment_id = self._next_segment_id()
+        text = await self.service._convert_chunk(pcm)
+        if text:
+            await self.emit({"type": "text_recognized", "segment_id": segment_id, "text": text})
+
+    def close(self):
+        if self._partial_task and not self._partial_task.done():
+            self._partial_task.cancel()
+
+    def _next_segment_id(self) -> str:
+        self._seq += 1
+        return f"{self.stream_id}-{self._seq}"
+
+    def _open_segment(self):
+        self._segment_id = self._next_segment_id()
+        self._utterance = bytearray(b"".join(self._preroll))
+        self._preroll = []
+        self._silent_frames = 0
+        self._since_partial = len(self._utterance)
+        self._last_partial = None
+        self._speculated = None
+
+    async def _close_segment(self):
+        segment_id, audio = self._segment_id, bytes(self._utterance)
+        had_partial = self._last_partial is not None
+        self._segment_id = None
+        self._utterance = bytearray()
+        self.close()
+
+        text = await self.service._convert_chunk(audio)
+        # An empty final retracts partials already shown for this segment
+        if text or had_partial:
+            await self.emit({"type": "text_recognized", "segment_id": segment_id, "text": text or ""})
+
+    async def _partial(self, segment_id: str, audio: bytes):
+        text = await self.service._convert_chunk(audio)
+        if not text or segment_id != self._segment_id:
+            return
+        stable = text == self._last_partial
+        self._last_partial = text
+        await self.emit({"type": "text_partial", "segment_id": segment_id, "text": text, "stable": stable})
+        if stable and self.on_stable_partial and text != self._speculated:
+            self._speculated = text
+            await self.on_stable_partial(segment_id, text)
@@ -0,0 +1,279 @@
+import asyncio
+import json
+import os
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import aiofiles
+from loguru import logger
+
+from backend.config import settings
+from backend.utils.metrics import CACHE_REQUESTS
+
+CacheEntry = Tuple[bytes, list]
+
+
+class MemoryCacheTier:
+    """In-process LRU for hot phrases, bounded by total audio bytes"""
+    name = "memory"
+
+    def __init__(self, max_bytes: int, ttl: int):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.entries: "OrderedDict[str, Tuple[float, CacheEntry]]" = OrderedDict()
+        self.size = 0
+
+    async def get(self, key: str) -> Optional[CacheEntry]:
+        item = self.entries.get(key)
+        if item is None:
+            return None
+        stored_at, entry = item
+        if self.ttl and time.time() - stored_at > self.ttl:
+            self._remove(key)
+            return None
+        self.entries.move_to_end(key)
+        return entry
+
+    async def set(self, key: str, entry: CacheEntry):
+        if len(entry[0]) > self.max_bytes:
+            return
+        self._remove(key)
+        self.entries[key] = (time.time(), entry)
+        self.size += len(entry[0])
+        while self.size > self.max_bytes:
+            self._remove(next(iter(self.entries)))
+
+    async def delete(self, key: str):
+        self._remove(key)
+
+    def _remove(self, key: str):
+        item = self.entries.pop(key, None)
+        if item:
+            self.size -= len(item[1][0])
+
+
+class DiskCacheTier:
+    """Async file tier with TTL and least-recently-used eviction by size.
+
+    Each entry is an audio file plus a timings JSON file. The index of entry
+    sizes and access times is built lazily from the directory on first use.
+    """
+    name = "disk"
+
+    def __init__(self, cache_dir: str, max_bytes: int, ttl: int):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.index: Dict[str, List[float]] = {}  # key -> [size, last_access, created]
+        self.size = 0
+        self._loaded = False
+        self._lock = asyncio.Lock()
+
+    def _paths(self, key: str) -> Tuple[Path, Path]:
+        return self.cache_dir / f"{key}.audio", self.cache_dir / f"{key}.json"
+
+    async def get(self, key: str) -> Optional[CacheEntry]:
+        await self._load_index()
+        meta = self.index.get(key)
+        if meta is None:
+            return None
+        if self.ttl and time.time() - meta[2] > self.ttl:
+            await self._remove(key)
+            return None
+
+        audio_path, timing_path = self._paths(key)
+        try:
+            async with aiofiles.open(audio_path, 'rb') as f:
+                audio_data = await f.read()
+            async with aiofiles.open(timing_path, 'r') as f:
+                timings = json.loads(await f.read())
+        except (OSError, ValueError) as e:
+            logger.warning(f"Dropping unreadable TTS cache entry {key}: {e}")
+            await self._remove(key)
+            return None
+
+        meta[1] = time.time()
+        return audio_data, timings
+
+    async def set(self, key: str, entry: CacheEntry):
+        await self._load_index()
+        audio_data, timings = entry
+        audio_path, timing_path = self._paths(key)
+        async with aiofiles.open(audio_path, 'wb') as f:
+            await f.write(audio_data)
+        async with aiofiles.open(timing_path, 'w') as f:
+            await f.write(json.dumps(timings))
+
+        async with self._lock:
+            previous = self.index.get(key)
+            if previous:
+                self.size -= previous[0]
+            now = time.time()
+            self.index[key] = [len(audio_data), now, now]
+            self.size += len(audio_data)
+        await self._evict()
+
+    async def _evict(self):
+        async with self._lock:
+            if self.size <= self.max_bytes:
+                return
+            victims = []
+            for key, meta in sorted(self.index.items(), key=lambda item: item[1][1]):
+                if self.size <= self.max_bytes:
+                    break
+                victims.append(key)
+                self.size -= meta[0]
+            for key in victims:
+                del self.index[key]
+        await asyncio.to_thread(self._unlink, victims)
+        logger.debug(f"TTS disk cache evicted {len(victims)} entries")
+
+    async def delete(self, key: str):
+        await self._remove(key)
+
+    async def _remove(self, key: str):
+        async with self._lock:
+            meta = self.index.pop(key, None)
+            if meta:
+                self.size -= meta[0]
+        await asyncio.to_thread(self._unlink, [key])
+
+    def _unlink(self, keys: List[str]):
+        for key in keys:
+            for path in self._paths(key):
+                try:
+                    path.unlink()
+                except FileNotFoundError:
+                    pass
+
+    async def _load_index(self):
+        if self._loaded:
+            return
+        async with self._lock:
+            if self._loaded:
+                return
+            self.index = await asyncio.to_thread(self._scan)
+            self.size = sum(meta[0] for meta in self.index.values())
+            self._loaded = True
+
+    def _scan(self) -> Dict[str, List[float]]:
+        index = {}
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith(".audio"):
+                stat = entry.stat()
+                index[entry.name[:-len(".audio")]] = [stat.st_size, stat.st_atime, stat.st_mtime]
+        return index
+
+
+class SharedCacheTier:
+    """Redis tier shared by every node"""
+    name = "shared"
+
+    def __init__(self, redis_url: str, ttl: int):
+        import redis.asyncio as aioredis
+        self.client = aioredis.from_url(redis_url)
+        self.ttl = ttl
+
+    async def get(self, key: str) -> Optional[CacheEntry]:
+        audio_data, timings = await self.client.mget(f"tts:{key}:audio", f"tts:{key}:timings")
+        if audio_data is None or timings is None:
+            return None
+        return audio_data, json.loads(timings)
+
+    async def set(self, key: str, entry: CacheEntry):
+        audio_data, timings = entry
+        async with self.client.pipeline(transaction=False) as pipe:
+            pipe.set(f"tts:{key}:audio", audio_data, ex=self.ttl or None)
+            pipe.set(f"tts:{key}:timings", json.dumps(timings), ex=self.ttl or None)
+            await pipe.execute()
+
+    async def delete(self, key: str):
+        await self.client.delete(f"tts:{key}:audio", f"tts:{key}:timings")
+
+    async def close(self):
+        await self.client.close()
+
+
+class TTSCache:
+    """Memory -> disk -> shared lookup with promotion into faster tiers on hit"""
+
+    def __init__(self, cache_dir: str = None, ttl: int = None):
+        ttl = settings.CACHE_TTL if ttl is None else ttl
+        self.enabled = settings.ENABLE_CACHE
+        self.tiers = [
+            MemoryCacheTier(settings.TTS_CACHE_MEMORY_MB * 1024 * 1024, ttl),
+            DiskCacheTier(cache_dir or settings.TTS_CACHE_DIR, settings.TTS_CACHE_DISK_MB * 1024 * 1024, ttl),
+        ]
+        if settings.TTS_CACHE_SHARED:
+            try:
+                self.tiers.append(SharedCacheTier(settings.REDIS_URL, ttl))
+            except ImportError:
+                logger.warning("redis is not installed, shared TTS cache disabled")
+
+        self.hits = {tier.name: 0 for tier in self.tiers}
+        self.misses = 0
+        self.bytes_read = 0
+        self.bytes_written = 0
+
+    async def get(self, key: str) -> Optional[CacheEntry]:
+        if not self.enabled:
+            return None
+        for depth, tier in enumerate(self.tiers):
+            try:
+                entry = await tier.get(key)
+            except Exception as e:
+                logger.warning(f"TTS cache {tier.name} read error: {e}")
+                continue
+            if entry is None:
+                continue
+            self.hits[tier.name] += 1
+            CACHE_REQUESTS.labels("tts", tier.name).inc()
+            self.bytes_read += len(entry[0])
+            for faster in self.tiers[:depth]:
+                await self._set_tier(faster, key, entry)
+            return entry
+        self.misses += 1
+        CACHE_REQUESTS.labels("tts", "miss").inc()
+        return None
+
+    async def set(self, key: str, audio_data: bytes, timings: list):
+        if not self.enabled or not audio_data:
+            return
+        entry = (audio_data, timings)
+        for tier in self.tiers:
+            await self._set_tier(tier, key, entry)
+        self.bytes_written += len(audio_data)
+
+    async def delete(self, key: str):
+        for tier in self.tiers:
+            try:
+                await tier.delete(key)
+            except Exception as e:
+                logger.warning(f"TTS cache {tier.name} delete error: {e}")
+
+    async def _set_tier(self, tier, key: str, entry: CacheEntry):
+        try:
+            await tier.set(key, entry)
+        except Exception as e:
+            logger.warning(f"TTS cache {tier.name} write error: {e}")
+
+    def stats(self) -> dict:
+        lookups = sum(self.hits.values()) + self.misses
+        return {
+            "enabled": self.enabled,
+            "hits": dict(self.hits),
+            "misses": self.misses,
+            "hit_rate": sum(self.hits.values()) / lookups if lookups else 0.0,
+            "bytes_read": self.bytes_read,
+            "bytes_written": self.bytes_written,
+            "memory_bytes": self.tiers[0].size,
+            "disk_bytes": self.tiers[1].size,
+        }
+
+    async def close(self):
+        for tier in self.tiers:
+            if hasattr(tier, "close"):
+                await tier.close()
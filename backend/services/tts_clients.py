@@ -0,0 +1,137 @@
+import asyncio
+import os
+from contextlib import asynccontextmanager
+from loguru import logger
+
+from backend.config import settings
+
+ELEVENLABS_API = "https://api.elevenlabs.io"
+
+
+class ElevenLabsClient:
+    """Long-lived aiohttp session with a bounded keep-alive connection pool"""
+
+    def __init__(self, pool_size: int = None):
+        self.pool_size = pool_size or settings.TTS_POOL_SIZE
+        self.api_key = settings.ELEVENLABS_API_KEY or os.getenv("ELEVENLABS_API_KEY")
+        self.session = None
+        self.reachable = False
+
+    async def start(self):
+        import aiohttp
+        if self.session and not self.session.closed:
+            return
+        connector = aiohttp.TCPConnector(
+            limit=self.pool_size,
+            keepalive_timeout=settings.TTS_HTTP_KEEPALIVE,
+            ttl_dns_cache=300
+        )
+        self.session = aiohttp.ClientSession(
+            base_url=ELEVENLABS_API,
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=settings.TTS_REQUEST_TIMEOUT),
+            headers={"xi-api-key": self.api_key or ""}
+        )
+
+    async def warm(self):
+        """Open pooled TCP+TLS connections ahead of the first utterance"""
+        await self.start()
+        results = await asyncio.gather(*(self.ping() for _ in range(self.pool_size)))
+        self.reachable = any(results)
+
+    async def ping(self) -> bool:
+        try:
+            async with self.session.get("/v1/models") as response:
+                await response.read()
+                return response.status < 500
+        except Exception as e:
+            logger.warning(f"ElevenLabs health check failed: {e}")
+            return False
+
+    async def health(self) -> bool:
+        # Cheap enough for /health polling: no request, just pool state
+        return self.session is not None and not self.session.closed and self.reachable
+
+    def post(self, path: str, **kwargs):
+        return self.session.post(path, **kwargs)
+
+    async def close(self):
+        if self.session and not self.session.closed:
+            await self.session.close()
+
+
+class AzureSynthesizerPool:
+    """Pool of pre-connected Azure SpeechSynthesizers producing raw 16 kHz PCM.
+
+    A synthesizer serves one request at a time; event handlers connected by
+    a request are dropped when it is released back to the pool.
+    """
+
+    def __init__(self, voice: str, size: int = None):
+        import azure.cognitiveservices.speech as speechsdk
+        self._speechsdk = speechsdk
+        self.size = size or settings.TTS_POOL_SIZE
+        self.speech_config = speechsdk.SpeechConfig(
+            subscription=settings.AZURE_SPEECH_KEY or os.getenv("AZURE_SPEECH_KEY"),
+            region=settings.AZURE_SPEECH_REGION or os.getenv("AZURE_SPEECH_REGION")
+        )
+        self.speech_config.speech_synthesis_voice_name = voice
+        self.speech_config.set_speech_synthesis_output_format(
+            speechsdk.SpeechSynthesisOutputFormat.Raw16Khz16BitMonoPcm
+        )
+        self.synthesizers = []
+        self.connections = []
+        self.open_connections = 0
+        self._idle: asyncio.Queue = asyncio.Queue()
+
+    async def start(self):
+        if self.synthesizers:
+            return
+        speechsdk = self._speechsdk
+        for _ in range(self.size):
+            synthesizer = speechsdk.SpeechSynthesizer(speech_config=self.speech_config, audio_config=None)
+            connection = speechsdk.Connection.from_speech_synthesizer(synthesizer)
+            connection.connected.connect(lambda evt: self._on_connection(1))
+            connection.disconnected.connect(lambda evt: self._on_connection(-1))
+            self.synthesizers.append(synthesizer)
+            self.connections.append(connection)
+            self._idle.put_nowait(synthesizer)
+
+    def _on_connection(self, delta: int):
+        # Called from SDK threads; a plain int update is atomic enough for a gauge
+        self.open_connections = max(0, self.open_connections + delta)
+
+    async def warm(self):
+        """Pre-open the service connection of every pooled synthesizer"""
+        await self.start()
+        await asyncio.gather(*(asyncio.to_thread(c.open, True) for c in self.connections))
+
+    async def health(self) -> bool:
+        return self.open_connections > 0
+
+    @property
+    def in_use(self) -> int:
+        return len(self.synthesizers) - self._idle.qsize()
+
+    @asynccontextmanager
+    async def acquire(self):
+        await self.start()
+        synthesizer = await self._idle.get()
+        try:
+            yield synthesizer
+        finally:
+            for signal in (
+                synthesizer.synthesizing,
+                synthesizer.viseme_received,
+                synthesizer.synthesis_word_boundary,
+                synthesizer.synthesis_completed,
+                synthesizer.synthesis_canceled,
+            ):
+                signal.disconnect_all()
+            self._idle.put_nowait(synthesizer)
+
+    async def close(self):
+        for connection in self.connections:
+            connection.close()
+        self.connections = []
+        self.synthesizers = []
@@ -1,121 +1,373 @@
 import asyncio
+import base64
 import io
-import hashlib
-import os
 import json
-from pathlib import Path
-from gtts import gTTS
-import aiohttp
+import re
+import time
 import numpy as np
 from loguru import logger
-from typing import Tuple, Optional
-import azure.cognitiveservices.speech as speechsdk
+from typing import AsyncGenerator, Tuple, Optional
+
+from backend.config import settings
+from backend.services.tts_cache import TTSCache
+from backend.services.tts_clients import AzureSynthesizerPool, ElevenLabsClient
+from backend.utils.audio import PCMAudio
+from backend.utils.helpers import get_cache_key
+from backend.utils.metrics import CACHE_HIT_RATIO, ERRORS, QUEUE_DEPTH, STAGE_SECONDS
+from backend.utils.singleflight import SingleFlight
+
+# Container each engine returns its audio in
+AUDIO_FORMATS = {"azure": "pcm16", "elevenlabs": "mp3", "google": "mp3", "fake": "pcm16"}
+
+# Sentence boundaries, including the Devanagari danda
+SENTENCE_SPLIT = re.compile(r"(?<=[.!?\u0964])\s+")
 
 class TextToSpeechService:
     def __init__(self, engine="azure", language="hi-IN", voice="hi-IN-SwaraNeural"):
         self.engine = engine
         self.language = language
         self.voice = voice
-        self.cache_dir = Path("cache/tts")
-        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.audio_format = AUDIO_FORMATS.get(engine, "mp3")
+        self.cache = TTSCache()
+        self.inflight = SingleFlight()
+        QUEUE_DEPTH.labels("tts_inflight").set_function(lambda: self.inflight.stats()["in_flight"])
+        CACHE_HIT_RATIO.labels("tts").set_function(lambda: self.cache.stats()["hit_rate"])
         
-        # Initialize Azure if needed
-        if engine == "azure":
-            self.speech_config = speechsdk.SpeechConfig(
-                subscription=os.getenv("AZURE_SPEECH_KEY"),
-                region=os.getenv("AZURE_SPEECH_REGION")
-            )
-            self.speech_config.speech_synthesis_voice_name = voice
+        # Long-lived backend clients, created once per service
+        self.azure_pool = AzureSynthesizerPool(voice) if engine == "azure" else None
+        self.elevenlabs = ElevenLabsClient() if engine == "elevenlabs" else None
+
+    async def start(self):
+        """Create pooled clients and pre-open their connections"""
+        for client in self._clients():
+            try:
+                await client.warm()
+            except Exception as e:
+                logger.warning(f"TTS warm-up failed for {type(client).__name__}: {e}")
+
+    async def warm(self):
+        """Cheap pre-request hook: make sure pooled connections are up"""
+        if not await self.health():
+            await self.start()
+
+    async def health(self) -> bool:
+        for client in self._clients():
+            if not await client.health():
+                return False
+        return True
+
+    def _clients(self) -> list:
+        return [c for c in (self.azure_pool, self.elevenlabs) if c is not None]
             
-    async def synthesize(self, text: str) -> Tuple[Optional[bytes], Optional[list]]:
+    async def synthesize(self, text: str) -> Tuple[Optional[PCMAudio], Optional[list]]:
         """Synthesize speech from text with timings"""
         try:
-            # Check cache
-            cache_key = hashlib.md5(f"{text}_{self.voice}".encode()).hexdigest()
-            cache_path = self.cache_dir / f"{cache_key}.mp3"
-            timing_path = self.cache_dir / f"{cache_key}.json"
-            
-            if cache_path.exists() and timing_path.exists():
-                with open(cache_path, 'rb') as f:
-                    audio_data = f.read()
-                with open(timing_path, 'r') as f:
-                    timings = json.load(f)
-                return audio_data, timings
-                
-            # Generate speech based on engine
-            if self.engine == "azure":
-                audio_data, timings = await self._azure_tts(text)
-            elif self.engine == "elevenlabs":
-                audio_data, timings = await self._elevenlabs_tts(text)
-            else:
-                audio_data, timings = await self._google_tts(text)
-                
-            # Cache results
-            if audio_data:
-                with open(cache_path, 'wb') as f:
-                    f.write(audio_data)
-                with open(timing_path, 'w') as f:
-                    json.dump(timings, f)
-                    
-            return audio_data, timings
+            with STAGE_SECONDS.time("tts"):
+                # Check cache
+                cache_key = self.cache_key(text)
+                cached = await self.cache_get(cache_key)
+                if cached:
+                    return cached
+
+                # Identical concurrent requests share one synthesis
+                return await self.inflight.do(cache_key, self._synthesize_uncached, text, cache_key)
             
         except Exception as e:
+            ERRORS.labels("tts").inc()
             logger.error(f"TTS error: {e}")
             return None, None
-            
-    async def _google_tts(self, text: str) -> Tuple[Optional[bytes], Optional[list]]:
-        """Google TTS implementation"""
+
+    async def _synthesize_uncached(self, text: str, cache_key: str) -> Tuple[Optional[PCMAudio], Optional[list]]:
+        # Generate speech based on engine
+        if self.engine == "azure":
+            audio, timings = await self._azure_tts(text)
+        elif self.engine == "elevenlabs":
+            audio, timings = await self._elevenlabs_tts(text)
+        elif self.engine == "fake":
+            audio, timings = await self._fake_tts(text)
+        else:
+            audio, timings = await self._google_tts(text)
+
+        # Cache results
+        if audio is not None and len(audio):
+            await self.cache_set(cache_key, audio, timings)
+
+        return audio, timings
+
+    async def cache_get(self, cache_key: str) -> Optional[Tuple[PCMAudio, list]]:
+        cached = await self.cache.get(cache_key)
+        if cached is None:
+            return None
+        data, timings = cached
         try:
-            tts = gTTS(text=text, lang=self.language[:2], slow=False)
-            
-            audio_bytes = io.BytesIO()
-            tts.write_to_fp(audio_bytes)
-            audio_bytes.seek(0)
-            audio_data = audio_bytes.read()
-            
-            # Generate approximate timings
-            words = text.split()
-            word_duration = len(audio_data) / (len(words) * 16000)
-            timings = []
-            current_time = 0
-            
-            for word in words:
+            if data[:4] == b"RIFF":
+                audio = PCMAudio.from_wav(data)
+            else:
+                audio = await asyncio.to_thread(PCMAudio.decode, data, self.audio_format)
+        except Exception as e:
+            logger.warning(f"Dropping unreadable TTS cache entry {cache_key[:12]}: {e}")
+            await self.cache.delete(cache_key)
+            return None
+        return audio, timings
+
+    async def cache_set(self, cache_key: str, audio: PCMAudio, timings: list):
+        # Keep the engine's compressed output when there is one (MP3 is about
+        # a tenth of the PCM); anything else is stored as WAV
+        if audio.source is not None and audio.source[0] == self.audio_format:
+            data = audio.source[1]
+        else:
+            data = audio.to_wav()
+        await self.cache.set(cache_key, data, timings)
+
+    async def synthesize_stream(self, text: str) -> AsyncGenerator[dict, None]:
+        """Yield audio chunks with their timings as the engine produces them.
+
+        Each chunk is a dict with the decoded `audio` (PCMAudio) and the
+        `timings` (visemes or words, absolute seconds) that became known
+        with it.
+        """
+        cache_key = self.cache_key(text)
+        cached = await self.cache_get(cache_key)
+        if cached:
+            yield {"audio": cached[0], "timings": cached[1]}
+            return
+
+        if self.engine == "azure":
+            stream = self._azure_tts_stream(text)
+        elif self.engine == "elevenlabs":
+            stream = self._elevenlabs_tts_stream(text)
+        elif self.engine == "fake":
+            stream = self._fake_tts_stream(text)
+        else:
+            stream = self._google_tts_stream(text)
+
+        chunks, timings = [], []
+        started = time.perf_counter()
+        async for chunk in stream:
+            if not chunks:
+                STAGE_SECONDS.labels("tts_first_chunk").observe(time.perf_counter() - started)
+            chunks.append(chunk)
+            timings.extend(chunk["timings"])
+            yield chunk
+
+        audio = PCMAudio.concat(c["audio"] for c in chunks)
+        if len(audio):
+            await self.cache_set(cache_key, audio, timings)
+
+    async def _azure_tts_stream(self, text: str) -> AsyncGenerator[dict, None]:
+        """Azure streaming synthesis: `synthesizing` audio events plus viseme/word events"""
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+
+        def put(kind, value=None):
+            loop.call_soon_threadsafe(queue.put_nowait, (kind, value))
+
+        async with self.azure_pool.acquire() as synthesizer:
+            synthesizer.synthesizing.connect(lambda evt: put("audio", evt.result.audio_data))
+            synthesizer.viseme_received.connect(lambda evt: put("timing", {
+                'viseme': f"viseme_{evt.viseme_id}",
+                'start': evt.audio_offset / 10000000,  # Convert to seconds
+                'duration': 0.1,
+                'blend': 0.2
+            }))
+            synthesizer.synthesis_word_boundary.connect(lambda evt: put("timing", {
+                'word': evt.text,
+                'start': evt.audio_offset / 10000000,
+                'end': evt.audio_offset / 10000000 + evt.duration.total_seconds()
+            }))
+            synthesizer.synthesis_completed.connect(lambda evt: put("done"))
+            synthesizer.synthesis_canceled.connect(
+                lambda evt: put("error", evt.result.cancellation_details.error_details)
+            )
+            synthesizer.speak_text_async(text)
+
+            pending = []
+            finished = False
+            try:
+                while True:
+                    kind, value = await queue.get()
+                    if kind == "timing":
+                        pending.append(value)
+                    elif kind == "audio":
+                        yield {"audio": PCMAudio.from_pcm16(value, 16000), "timings": pending}
+                        pending = []
+                    elif kind == "error":
+                        finished = True
+                        logger.error(f"Azure TTS stream error: {value}")
+                        return
+                    else:
+                        finished = True
+                        if pending:
+                            yield {"audio": PCMAudio.from_pcm16(b"", 16000), "timings": pending}
+                        return
+            finally:
+                # Don't hand a still-speaking synthesizer back to the pool
+                if not finished:
+                    await asyncio.to_thread(synthesizer.stop_speaking)
+
+    async def _elevenlabs_tts_stream(self, text: str) -> AsyncGenerator[dict, None]:
+        """ElevenLabs chunked HTTP streaming with character alignment"""
+        async with self.elevenlabs.post(
+            "/v1/text-to-speech/21m00Tcm4TlvDq8ikWAM/stream/with-timestamps",
+            params={"output_format": "pcm_16000"},
+            json={
+                "text": text,
+                "voice_settings": {
+                    "stability": 0.5,
+                    "similarity_boost": 0.5
+                }
+            }
+        ) as response:
+            response.raise_for_status()
+            word = None
+            # One JSON object per line: base64 audio plus the alignment of its characters
+            async for line in response.content:
+                line = line.strip()
+                if not line:
+                    continue
+                data = json.loads(line)
+                timings = []
+                alignment = data.get("alignment") or {}
+                for char, start, end in zip(
+                    alignment.get("characters", []),
+                    alignment.get("character_start_times_seconds", []),
+                    alignment.get("character_end_times_seconds", [])
+                ):
+                    if char.isspace():
+                        if word:
+                            timings.append(word)
+                        word = None
+                    elif word is None:
+                        word = {'word': char, 'start': start, 'end': end}
+                    else:
+                        word['word'] += char
+                        word['end'] = end
+                for item in timings:
+                    item['phonemes'] = self._word_to_phonemes(item['word'])
+                yield {
+                    "audio": PCMAudio.from_pcm16(base64.b64decode(data.get("audio_base64") or ""), 16000),
+                    "timings": timings
+                }
+            if word:
+                word['phonemes'] = self._word_to_phonemes(word['word'])
+                yield {"audio": PCMAudio.from_pcm16(b"", 16000), "timings": [word]}
+
+    async def _google_tts_stream(self, text: str) -> AsyncGenerator[dict, None]:
+        """gTTS has no streaming mode, so synthesize sentence by sentence"""
+        offset = 0.0
+        for sentence in self._split_sentences(text):
+            audio = await asyncio.to_thread(self._gtts_audio, sentence)
+            yield {
+                "audio": audio,
+                "timings": self._approximate_timings(sentence, audio.duration, offset)
+            }
+            offset += audio.duration
+
+    async def _fake_tts(self, text: str) -> Tuple[Optional[PCMAudio], Optional[list]]:
+        """Offline engine: the whole fake stream as one buffer"""
+        chunks = [chunk async for chunk in self._fake_tts_stream(text)]
+        timings = [item for chunk in chunks for item in chunk["timings"]]
+        return PCMAudio.concat(chunk["audio"] for chunk in chunks), timings
+
+    async def _fake_tts_stream(self, text: str) -> AsyncGenerator[dict, None]:
+        """Deterministic offline engine: one tone burst per word, one chunk per sentence"""
+        sample_rate = 16000
+        word_seconds = settings.TTS_FAKE_WORD_SECONDS
+        gap = int(sample_rate * 0.05)
+        offset = 0.0
+        for sentence in self._split_sentences(text):
+            if settings.TTS_FAKE_LATENCY:
+                await asyncio.sleep(settings.TTS_FAKE_LATENCY)
+            words = sentence.split()
+            t = np.arange(int(sample_rate * word_seconds) - gap) / sample_rate
+            pieces, timings = [], []
+            for i, word in enumerate(words):
+                tone = 0.3 * np.sin(2 * np.pi * (180 + 20 * (len(word) % 5)) * t)
+                pieces.append((tone * 32767).astype(np.int16))
+                pieces.append(np.zeros(gap, dtype=np.int16))
+                start = offset + i * word_seconds
                 timings.append({
                     'word': word,
-                    'start': current_time,
-                    'end': current_time + word_duration,
+                    'start': start,
+                    'end': start + word_seconds,
                     'phonemes': self._word_to_phonemes(word)
                 })
-                current_time += word_duration
-                
-            return audio_data, timings
+            offset += len(words) * word_seconds
+            yield {
+                "audio": PCMAudio(np.concatenate(pieces) / 32768.0 if pieces else np.zeros(0), sample_rate),
+                "timings": timings
+            }
+
+    def _split_sentences(self, text: str) -> list:
+        return [s for s in SENTENCE_SPLIT.split(text.strip()) if s.strip()]
+
+    def _gtts_audio(self, text: str) -> PCMAudio:
+        from gtts import gTTS
+        tts = gTTS(text=text, lang=self.language[:2], slow=False)
+        audio_bytes = io.BytesIO()
+        tts.write_to_fp(audio_bytes)
+        return PCMAudio.decode(audio_bytes.getvalue(), "mp3")
+
+    def _approximate_timings(self, text: str, duration: float, offset: float = 0.0) -> list:
+        """Spread words evenly over `duration` when the engine gives no timings"""
+        words = text.split()
+        if not words:
+            return []
+        word_duration = duration / len(words)
+        timings = []
+        for i, word in enumerate(words):
+            start = offset + i * word_duration
+            timings.append({
+                'word': word,
+                'start': start,
+                'end': start + word_duration,
+                'phonemes': self._word_to_phonemes(word)
+            })
+        return timings
+            
+    def cache_key(self, text: str) -> str:
+        return get_cache_key(text, self.voice, self.engine, self.language, self.audio_format)
+
+    async def close(self):
+        for client in self._clients():
+            await client.close()
+        await self.cache.close()
+
+    async def _google_tts(self, text: str) -> Tuple[Optional[PCMAudio], Optional[list]]:
+        """Google TTS implementation"""
+        try:
+            audio = await asyncio.to_thread(self._gtts_audio, text)
+            
+            # Generate approximate timings from the decoded duration
+            return audio, self._approximate_timings(text, audio.duration)
             
         except Exception as e:
             logger.error(f"Google TTS error: {e}")
             return None, None
             
-    async def _azure_tts(self, text: str) -> Tuple[Optional[bytes], Optional[list]]:
+    async def _azure_tts(self, text: str) -> Tuple[Optional[PCMAudio], Optional[list]]:
         """Azure TTS with viseme events"""
+        import azure.cognitiveservices.speech as speechsdk
         try:
-            synthesizer = speechsdk.SpeechSynthesizer(speech_config=self.speech_config)
-            
-            # Enable viseme events
-            viseme_data = []
-            
-            def viseme_callback(evt):
-                viseme_data.append({
-                    'viseme_id': evt.viseme_id,
-                    'audio_offset': evt.audio_offset / 10000000,  # Convert to seconds
-                    'animation': evt.animation
-                })
+            async with self.azure_pool.acquire() as synthesizer:
+                # Enable viseme events
+                viseme_data = []
                 
-            synthesizer.viseme_received.connect(viseme_callback)
-            
-            # Synthesize
-            result = await synthesizer.speak_text_async(text)
+                def viseme_callback(evt):
+                    viseme_data.append({
+                        'viseme_id': evt.viseme_id,
+                        'audio_offset': evt.audio_offset / 10000000,  # Convert to seconds
+                        'animation': evt.animation
+                    })
+                    
+                synthesizer.viseme_received.connect(viseme_callback)
+                
+                # Synthesize (the SDK future blocks, so wait for it off the event loop)
+                future = synthesizer.speak_text_async(text)
+                result = await asyncio.to_thread(future.get)
             
             if result.reason == speechsdk.ResultReason.SynthesizingAudioCompleted:
-                audio_data = result.audio_data
+                audio = PCMAudio.from_pcm16(result.audio_data, 16000)
                 
                 # Process visemes
                 timings = []
@@ -127,48 +379,32 @@ class TextToSpeechService:
                         'blend': 0.2
                     })
                     
-                return audio_data, timings
+                return audio, timings
+            return None, None
                 
         except Exception as e:
             logger.error(f"Azure TTS error: {e}")
             return None, None
             
-    async def _elevenlabs_tts(self, text: str) -> Tuple[Optional[bytes], Optional[list]]:
+    async def _elevenlabs_tts(self, text: str) -> Tuple[Optional[PCMAudio], Optional[list]]:
         """ElevenLabs TTS implementation"""
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.post(
-                    "https://api.elevenlabs.io/v1/text-to-speech/21m00Tcm4TlvDq8ikWAM",
-                    headers={
-                        "xi-api-key": os.getenv("ELEVENLABS_API_KEY"),
-                        "Content-Type": "application/json"
-                    },
-                    json={
-                        "text": text,
-                        "voice_settings": {
-                            "stability": 0.5,
-                            "similarity_boost": 0.5
-                        }
+            async with self.elevenlabs.post(
+                "/v1/text-to-speech/21m00Tcm4TlvDq8ikWAM",
+                json={
+                    "text": text,
+                    "voice_settings": {
+                        "stability": 0.5,
+                        "similarity_boost": 0.5
                     }
-                ) as response:
-                    audio_data = await response.read()
+                }
+            ) as response:
+                response.raise_for_status()
+                audio_data = await response.read()
+            audio = await asyncio.to_thread(PCMAudio.decode, audio_data, "mp3")
                     
             # ElevenLabs doesn't provide timings, so approximate
-            words = text.split()
-            word_duration = len(audio_data) / (len(words) * 16000)
-            timings = []
-            current_time = 0
-            
-            for word in words:
-                timings.append({
-                    'word': word,
-                    'start': current_time,
-                    'end': current_time + word_duration,
-                    'phonemes': self._word_to_phonemes(word)
-                })
-                current_time += word_duration
-                
-            return audio_data, timings
+            return audio, self._approximate_timings(text, audio.duration)
             
         except Exception as e:
             logger.error(f"ElevenLabs TTS error: {e}")
@@ -3,96 +3,74 @@ from typing import List, Dict
 import json
 from loguru import logger
 
+from backend.services.g2p import GraphemeToPhoneme
+from backend.utils.metrics import CACHE_HIT_RATIO, STAGE_SECONDS
+from backend.utils.viseme_timeline import VisemeTimeline, viseme_id, SILENCE_ID
+
 class VisemeService:
-    def __init__(self):
-        # Load viseme mappings
-        self.viseme_map = self._load_viseme_map()
-        self.phoneme_to_viseme = self._load_phoneme_map()
-        
-    def _load_viseme_map(self) -> Dict:
-        """Load viseme to shape mapping"""
-        return {
-            'viseme_silence': {'id': 0, 'jaw': 0.0, 'lip': 0.0, 'mouth_width': 0.2, 'mouth_height': 0.1},
-            'viseme_aa': {'id': 1, 'jaw': 0.8, 'lip': 0.2, 'mouth_width': 0.8, 'mouth_height': 0.7},
-            'viseme_ii': {'id': 2, 'jaw': 0.3, 'lip': 0.1, 'mouth_width': 0.5, 'mouth_height': 0.9},
-            'viseme_uu': {'id': 3, 'jaw': 0.4, 'lip': 0.9, 'mouth_width': 0.6, 'mouth_height': 0.4},
-            'viseme_ee': {'id': 4, 'jaw': 0.5, 'lip': 0.3, 'mouth_width': 0.7, 'mouth_height': 0.5},
-            'viseme_oo': {'id': 5, 'jaw': 0.5, 'lip': 0.7, 'mouth_width': 0.6, 'mouth_height': 0.5},
-            'viseme_k': {'id': 6, 'jaw': 0.3, 'lip': 0.2, 'mouth_width': 0.5, 'mouth_height': 0.3},
-            'viseme_g': {'id': 7, 'jaw': 0.3, 'lip': 0.2, 'mouth_width': 0.5, 'mouth_height': 0.3},
-            'viseme_t': {'id': 8, 'jaw': 0.2, 'lip': 0.1, 'mouth_width': 0.4, 'mouth_height': 0.2},
-            'viseme_d': {'id': 9, 'jaw': 0.2, 'lip': 0.1, 'mouth_width': 0.4, 'mouth_height': 0.2},
-            'viseme_n': {'id': 10, 'jaw': 0.2, 'lip': 0.1, 'mouth_width': 0.4, 'mouth_height': 0.2},
-            'viseme_m': {'id': 11, 'jaw': 0.2, 'lip': 0.1, 'mouth_width': 0.4, 'mouth_height': 0.2},
-            'viseme_p': {'id': 12, 'jaw': 0.1, 'lip': 0.1, 'mouth_width': 0.3, 'mouth_height': 0.1},
-            'viseme_b': {'id': 13, 'jaw': 0.1, 'lip': 0.1, 'mouth_width': 0.3, 'mouth_height': 0.1},
-            'viseme_s': {'id': 14, 'jaw': 0.1, 'lip': 0.1, 'mouth_width': 0.4, 'mouth_height': 0.1},
-            'viseme_h': {'id': 15, 'jaw': 0.3, 'lip': 0.2, 'mouth_width': 0.5, 'mouth_height': 0.3}
+    def __init__(self, language: str = "hi-IN"):
+        self.language = language
+        self.g2p = GraphemeToPhoneme()
+        CACHE_HIT_RATIO.labels("g2p").set_function(self._g2p_hit_ratio)
+        # Phoneme -> viseme ID; shapes live in constants.MOUTH_SHAPES
+        self.phoneme_to_viseme = {
+            phoneme: viseme_id(name) for phoneme, name in self._load_phoneme_map().items()
         }
         
     def _load_phoneme_map(self) -> Dict:
         """Map phonemes to viseme IDs (simplified)"""
         return {
             'aa': 'viseme_aa', 'ae': 'viseme_aa', 'ah': 'viseme_aa',
-            'eh': 'viseme_ee', 'er': 'viseme_ee', 'ey': 'viseme_ee',
-            'ih': 'viseme_ii', 'iy': 'viseme_ii',
-            'ow': 'viseme_oo', 'oy': 'viseme_oo', 'uw': 'viseme_uu',
-            'p': 'viseme_p', 'b': 'viseme_b', 'm': 'viseme_m',
-            't': 'viseme_t', 'd': 'viseme_d', 'n': 'viseme_n',
+            'aw': 'viseme_aa', 'ay': 'viseme_aa',
+            'eh': 'viseme_ee', 'er': 'viseme_ee', 'ey': 'viseme_ee', 'r': 'viseme_ee',
+            'ih': 'viseme_ii', 'iy': 'viseme_ii', 'y': 'viseme_ii',
+            'ow': 'viseme_oo', 'oy': 'viseme_oo', 'ao': 'viseme_oo',
+            'uw': 'viseme_uu', 'uh': 'viseme_uu', 'w': 'viseme_uu',
+            'p': 'viseme_p', 'b': 'viseme_b', 'm': 'viseme_m', 'f': 'viseme_p', 'v': 'viseme_b',
+            't': 'viseme_t', 'd': 'viseme_d', 'n': 'viseme_n', 'th': 'viseme_t', 'dh': 'viseme_d', 'l': 'viseme_t',
             'k': 'viseme_k', 'g': 'viseme_g', 'ng': 'viseme_g',
-            's': 'viseme_s', 'z': 'viseme_s', 'sh': 'viseme_s',
-            'h': 'viseme_h',
+            's': 'viseme_s', 'z': 'viseme_s', 'sh': 'viseme_s', 'zh': 'viseme_s', 'ch': 'viseme_s', 'jh': 'viseme_s',
+            'h': 'viseme_h', 'hh': 'viseme_h',
             'sil': 'viseme_silence'
         }
         
-    def generate_visemes(self, timings: List[Dict]) -> List[Dict]:
-        """Generate viseme sequence from word timings"""
-        viseme_sequence = []
-        
-        for item in timings:
-            word = item.get('word', '')
+    def generate_visemes(self, timings: List[Dict], language: str = None) -> VisemeTimeline:
+        """Generate a viseme timeline from TTS timings.
+
+        Engines that report visemes (Azure) are used as-is; otherwise word
+        timings are phonemized and each word's span is split evenly.
+        """
+        with STAGE_SECONDS.time("viseme"):
+            return self._generate_visemes(timings, language)
+
+    def _generate_visemes(self, timings: List[Dict], language: str = None) -> VisemeTimeline:
+        viseme_events = [item for item in timings if 'viseme' in item]
+        if viseme_events:
+            return VisemeTimeline.from_events(viseme_events)
+
+        word_timings = [item for item in timings if 'word' in item]
+        # Phonemize the utterance in one pass; repeated words resolve once
+        words = [item['word'] for item in word_timings]
+        utterance_phonemes = self.g2p.phonemize_batch(words, language or self.language)
+
+        starts, ends, ids = [], [], []
+        for item, phonemes in zip(word_timings, utterance_phonemes):
             start = item.get('start', 0)
-            end = item.get('end', 0.5)
-            
-            # Get phonemes for word (simplified - use actual phonemizer in production)
-            phonemes = self._text_to_phonemes(word)
-            
-            # Distribute phonemes across word duration
-            if phonemes:
-                phoneme_duration = (end - start) / len(phonemes)
-                for i, phoneme in enumerate(phonemes):
-                    phoneme_start = start + i * phoneme_duration
-                    phoneme_end = phoneme_start + phoneme_duration
-                    
-                    viseme_name = self.phoneme_to_viseme.get(phoneme, 'viseme_silence')
-                    viseme = self.viseme_map.get(viseme_name, self.viseme_map['viseme_silence'])
-                    
-                    viseme_sequence.append({
-                        'viseme': viseme_name,
-                        'start': phoneme_start,
-                        'end': phoneme_end,
-                        'blend': 0.1,  # 100ms blend
-                        'shape': viseme
-                    })
-            else:
-                # No phonemes, use silence
-                viseme_sequence.append({
-                    'viseme': 'viseme_silence',
-                    'start': start,
-                    'end': end,
-                    'blend': 0.1,
-                    'shape': self.viseme_map['viseme_silence']
-                })
-                
-        return viseme_sequence
+            end = item.get('end', start + 0.5)
+            if not phonemes:
+                phonemes = ['sil']
+            bounds = np.linspace(start, end, len(phonemes) + 1)
+            starts.extend(bounds[:-1])
+            ends.extend(bounds[1:])
+            ids.extend(self.phoneme_to_viseme.get(p, SILENCE_ID) for p in phonemes)
+
+        return VisemeTimeline.from_arrays(starts, ends, ids, blend=0.1)  # 100ms blend
         
-    def _text_to_phonemes(self, text: str) -> List[str]:
-        """Very simplified phoneme conversion - replace with real phonemizer"""
-        # This should use a proper phonemizer like gruut or espeak
-        phonemes = []
-        for char in text.lower():
-            if char in 'aeiou':
-                phonemes.append('aa')  # Simplified
-            elif char.isalpha():
-                phonemes.append(char)
-        return phonemes
\ No newline at end of file
+    def _g2p_hit_ratio(self) -> float:
+        info = self.g2p.cache_info()
+        lookups = info.hits + info.misses
+        return info.hits / lookups if lookups else 0.0
+
+    def _text_to_phonemes(self, text: str, language: str = None) -> List[str]:
+        """Phonemes for a single word (lexicon lookup, then letter-to-sound rules)"""
+        return self.g2p.phonemize(text, language or self.language)
\ No newline at end of file
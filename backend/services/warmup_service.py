@@ -0,0 +1,134 @@
+import asyncio
+import json
+import os
+import time
+from loguru import logger
+from typing import Dict, List
+
+from backend.config import settings
+from backend.services.lipsync_service import LipSyncService
+
+MANIFEST_NAME = "phrases.json"
+
+
+class WarmupService:
+    """Pre-synthesizes and pre-renders scripted phrases into the TTS and video caches.
+
+    Phrases come from `phrases.json` manifests: one per avatar at
+    `avatars/<category>/<model>/phrases.json`, plus an optional global
+    `avatars/phrases.json` used for the default avatar. A manifest is either
+    a list of strings or `{"phrases": [...]}`. Work runs one phrase at a
+    time in the background so interactive sessions keep priority.
+    """
+
+    def __init__(self, tts_service, viseme_service, lipsync_service, render_service):
+        self.tts = tts_service
+        self.viseme = viseme_service
+        self.lipsync = lipsync_service
+        self.render = render_service
+        self._lipsync_by_avatar = {settings.DEFAULT_AVATAR: lipsync_service}
+
+        self.ready = False
+        self.total = 0
+        self.done = 0
+        self.cached = 0
+        self.failed = 0
+        self.current = None
+        self.started_at = None
+        self.finished_at = None
+        self._task = None
+
+    def start(self) -> asyncio.Task:
+        """Run the warm-up in the background"""
+        if self._task is None:
+            self._task = asyncio.create_task(self.run())
+        return self._task
+
+    async def stop(self):
+        if self._task and not self._task.done():
+            self._task.cancel()
+
+    def load_manifests(self) -> Dict[str, List[str]]:
+        manifests: Dict[str, List[str]] = {}
+        global_manifest = os.path.join(settings.AVATAR_DIR, MANIFEST_NAME)
+        if os.path.exists(global_manifest):
+            manifests[settings.DEFAULT_AVATAR] = self._read_manifest(global_manifest)
+
+        for category in settings.AVATAR_MODELS:
+            category_path = os.path.join(settings.AVATAR_DIR, category)
+            if not os.path.isdir(category_path):
+                continue
+            for model in sorted(os.listdir(category_path)):
+                path = os.path.join(category_path, model, MANIFEST_NAME)
+                if os.path.exists(path):
+                    phrases = manifests.setdefault(f"{category}/{model}", [])
+                    phrases.extend(p for p in self._read_manifest(path) if p not in phrases)
+        return manifests
+
+    def _read_manifest(self, path: str) -> List[str]:
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Skipping phrase manifest {path}: {e}")
+            return []
+        phrases = data.get("phrases", []) if isinstance(data, dict) else data
+        return [p.strip() for p in phrases if isinstance(p, str) and p.strip()]
+
+    async def run(self):
+        self.started_at = time.time()
+        manifests = await asyncio.to_thread(self.load_manifests)
+        work = [(avatar_id, phrase) for avatar_id, phrases in manifests.items() for phrase in phrases]
+        self.total = len(work)
+        logger.info(f"Warm-up: {self.total} phrases across {len(manifests)} avatars")
+
+        for avatar_id, phrase in work:
+            self.current = f"{avatar_id}: {phrase[:40]}"
+            try:
+                await self.warm_phrase(avatar_id, phrase)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.failed += 1
+                logger.warning(f"Warm-up failed for '{phrase[:40]}' ({avatar_id}): {e}")
+            self.done += 1
+            logger.info(f"Warm-up progress {self.done}/{self.total}")
+
+        self.current = None
+        self.ready = True
+        self.finished_at = time.time()
+        logger.info(f"Warm-up finished in {self.finished_at - self.started_at:.1f}s ({self.failed} failed)")
+
+    async def warm_phrase(self, avatar_id: str, phrase: str):
+        video_key = self.render.video_cache_key(self.tts.cache_key(phrase), avatar_id, settings.LIPSYNC_MODE)
+        if self.render.cached_video(video_key):
+            self.cached += 1
+            return
+        await self.render.inflight.do(video_key, self._render_phrase, avatar_id, phrase, video_key)
+
+    async def _render_phrase(self, avatar_id: str, phrase: str, video_key: str):
+        audio, timings = await self.tts.synthesize(phrase)
+        if audio is None or not len(audio):
+            raise RuntimeError("TTS failed")
+        timeline = self.viseme.generate_visemes(timings, self.tts.language)
+        lipsync = self._lipsync_for(avatar_id)
+        frames = await asyncio.to_thread(lipsync.animate, audio, timeline)
+        if not await self.render.render_video(frames, audio, cache_key=video_key):
+            raise RuntimeError("render failed")
+
+    def _lipsync_for(self, avatar_id: str) -> LipSyncService:
+        if avatar_id not in self._lipsync_by_avatar:
+            self._lipsync_by_avatar[avatar_id] = LipSyncService.for_avatar(avatar_id)
+        return self._lipsync_by_avatar[avatar_id]
+
+    def status(self) -> dict:
+        return {
+            "ready": self.ready,
+            "enabled": self._task is not None,
+            "total": self.total,
+            "done": self.done,
+            "already_cached": self.cached,
+            "failed": self.failed,
+            "progress": self.done / self.total if self.total else (1.0 if self.ready else 0.0),
+            "current": self.current,
+        }
@@ -1,16 +1,19 @@
 import asyncio
 import json
-from aiortc import RTCPeerConnection, RTCSessionDescription, RTCIceCandidate
-from aiortc.contrib.media import MediaPlayer
+from aiortc import RTCConfiguration, RTCIceServer, RTCPeerConnection, RTCRtpSender, RTCSessionDescription
+from aiortc.sdp import candidate_from_sdp
 from loguru import logger
 
+from backend.config import settings
+
 class WebRTCService:
     def __init__(self):
         self.peer_connections = {}  # peer_id -> RTCPeerConnection
 
-    async def create_peer_connection(self, peer_id, on_track_callback=None):
+    async def create_peer_connection(self, peer_id, on_track_callback=None, on_closed=None):
         """Create a new RTCPeerConnection"""
-        pc = RTCPeerConnection()
+        configuration = RTCConfiguration(iceServers=[RTCIceServer(**server) for server in settings.RTC_ICE_SERVERS])
+        pc = RTCPeerConnection(configuration=configuration)
         self.peer_connections[peer_id] = pc
 
         if on_track_callback:
@@ -18,19 +21,41 @@ class WebRTCService:
             async def on_track(track):
                 await on_track_callback(track)
 
-        @pc.on("iceconnectionstatechange")
-        async def on_iceconnectionstatechange():
-            logger.info(f"ICE connection state for {peer_id}: {pc.iceConnectionState}")
-            if pc.iceConnectionState == "failed":
+        @pc.on("connectionstatechange")
+        async def on_connectionstatechange():
+            logger.info(f"Connection state for {peer_id}: {pc.connectionState}")
+            if pc.connectionState in ("failed", "closed"):
                 await pc.close()
-                self.peer_connections.pop(peer_id, None)
+                if self.peer_connections.get(peer_id) is pc:
+                    self.peer_connections.pop(peer_id)
+                    if on_closed:
+                        on_closed()
 
         return pc
 
-    async def handle_offer(self, peer_id, offer_sdp, on_track_callback=None):
-        """Process an offer and return answer"""
-        pc = await self.create_peer_connection(peer_id, on_track_callback)
+    async def handle_offer(self, peer_id, offer_sdp, on_track_callback=None, tracks=(), on_closed=None,
+                           codec_preferences=None):
+        """Process an offer and return answer, sending `tracks` to the peer.
+
+        `codec_preferences` maps a track kind to the one mime type it may use
+        (e.g. {"video": "video/H264"}), for tracks that carry pre-encoded packets.
+        """
+        await self.close_connection(peer_id)
+        pc = await self.create_peer_connection(peer_id, on_track_callback, on_closed)
+        codec_preferences = codec_preferences or {}
+        for track in tracks:
+            # Preferences only apply if the transceiver exists before the offer is applied
+            if track.kind in codec_preferences:
+                mime_type = codec_preferences[track.kind].lower()
+                codecs = [
+                    codec for codec in RTCRtpSender.getCapabilities(track.kind).codecs
+                    if codec.mimeType.lower() in (mime_type, f"{track.kind}/rtx")
+                ]
+                pc.addTransceiver(track, direction="sendonly").setCodecPreferences(codecs)
         await pc.setRemoteDescription(RTCSessionDescription(sdp=offer_sdp, type="offer"))
+        for track in tracks:
+            if track.kind not in codec_preferences:
+                pc.addTrack(track)
         answer = await pc.createAnswer()
         await pc.setLocalDescription(answer)
         return pc.localDescription
@@ -38,12 +63,11 @@ class WebRTCService:
     async def add_ice_candidate(self, peer_id, candidate_dict):
         """Add an ICE candidate to the peer connection"""
         pc = self.peer_connections.get(peer_id)
-        if pc:
-            candidate = RTCIceCandidate(
-                sdpMid=candidate_dict["sdpMid"],
-                sdpMLineIndex=candidate_dict["sdpMLineIndex"],
-                candidate=candidate_dict["candidate"]
-            )
+        if pc and candidate_dict.get("candidate"):
+            sdp = candidate_dict["candidate"]
+            candidate = candidate_from_sdp(sdp[len("candidate:"):] if sdp.startswith("candidate:") else sdp)
+            candidate.sdpMid = candidate_dict.get("sdpMid")
+            candidate.sdpMLineIndex = candidate_dict.get("sdpMLineIndex")
             await pc.addIceCandidate(candidate)
 
     async def close_connection(self, peer_id):
@@ -53,4 +77,4 @@ class WebRTCService:
             await pc.close()
 
     def get_connection(self, peer_id):
-        return self.peer_connections.get(peer_id)
\ No newline at end of file
+        return self.peer_connections.get(peer_id)
@@ -0,0 +1,87 @@
+import io
+import wave
+import numpy as np
+from typing import Iterable, Optional, Tuple
+
+from backend.utils.helpers import bytes_to_ndarray, ndarray_to_float32, float32_to_pcm16, pcm_to_wav
+
+
+class PCMAudio:
+    """Decoded mono audio shared by every pipeline stage.
+
+    TTS output is decoded into this once; duration, timings, lip-sync and the
+    final mux all read `samples` (float32 in [-1, 1]) directly, and the audio
+    is only encoded again when the video is written.
+    """
+
+    def __init__(self, samples: np.ndarray, sample_rate: int):
+        samples = np.asarray(samples, dtype=np.float32)
+        if samples.ndim == 2:
+            samples = samples.mean(axis=1) if samples.shape[1] > 1 else samples[:, 0]
+        self.samples = samples
+        self.sample_rate = sample_rate
+        # (format, bytes) of the compressed engine output this was decoded from
+        self.source: Optional[Tuple[str, bytes]] = None
+
+    @property
+    def duration(self) -> float:
+        return len(self.samples) / self.sample_rate if self.sample_rate else 0.0
+
+    def __len__(self) -> int:
+        return len(self.samples)
+
+    @classmethod
+    def from_pcm16(cls, data: bytes, sample_rate: int, channels: int = 1) -> "PCMAudio":
+        return cls(ndarray_to_float32(bytes_to_ndarray(data, channels=channels)), sample_rate)
+
+    @classmethod
+    def from_wav(cls, data: bytes) -> "PCMAudio":
+        with wave.open(io.BytesIO(data), 'rb') as wav_file:
+            frames = wav_file.readframes(wav_file.getnframes())
+            sample_width = wav_file.getsampwidth()
+            samples = bytes_to_ndarray(frames, sample_width=sample_width, channels=wav_file.getnchannels())
+            return cls(ndarray_to_float32(samples), wav_file.getframerate())
+
+    @classmethod
+    def decode(cls, data: bytes, fmt: str, sample_rate: int = None) -> "PCMAudio":
+        """Decode engine output ("pcm16", "wav" or any container FFmpeg reads)"""
+        if fmt == "pcm16":
+            return cls.from_pcm16(data, sample_rate)
+        if fmt == "wav":
+            return cls.from_wav(data)
+
+        import av
+        chunks = []
+        rate = sample_rate
+        with av.open(io.BytesIO(data), format=fmt) as container:
+            for frame in container.decode(audio=0):
+                rate = frame.sample_rate
+                samples = frame.to_ndarray()
+                channels = len(frame.layout.channels)
+                samples = samples.T if frame.format.is_planar else samples.reshape(-1, channels)
+                chunks.append(ndarray_to_float32(samples).mean(axis=1))
+        samples = np.concatenate(chunks) if chunks else np.zeros(0, dtype=np.float32)
+        audio = cls(samples, rate or 16000)
+        audio.source = (fmt, data)
+        return audio
+
+    @classmethod
+    def concat(cls, parts: Iterable["PCMAudio"]) -> "PCMAudio":
+        parts = [p for p in parts if p is not None]
+        if not parts:
+            return cls(np.zeros(0, dtype=np.float32), 16000)
+        rate = parts[0].sample_rate
+        if any(p.sample_rate != rate for p in parts):
+            raise ValueError("Cannot concatenate audio with different sample rates")
+        audio = cls(np.concatenate([p.samples for p in parts]), rate)
+        if len(parts) == 1:
+            # Joined MP3s pick up encoder padding at every seam, so only a
+            # single part keeps its source
+            audio.source = parts[0].source
+        return audio
+
+    def to_pcm16(self) -> bytes:
+        return float32_to_pcm16(self.samples)
+
+    def to_wav(self) -> bytes:
+        return pcm_to_wav(self.to_pcm16(), self.sample_rate)
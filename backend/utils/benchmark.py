@@ -0,0 +1,463 @@
+import argparse
+import asyncio
+import base64
+import fnmatch
+import gc
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+# Reply lengths in seconds the duration-dependent cases run at
+DURATIONS = (1, 10, 30, 120)
+DEFAULT_BASELINE = "benchmarks/baseline.json"
+# A case regresses when its fastest run grows by more than this fraction...
+DEFAULT_THRESHOLD = 0.25
+# ...except for cases that are noisy by nature
+CASE_THRESHOLDS = {"render.render_video": 0.5, "stt.transcribe[local]": 0.5}
+# Differences below this are timer noise, whatever the ratio
+NOISE_FLOOR_MS = 0.05
+# Frame-producing stages return every frame at once; skip lengths that would not fit
+# (iter_frames and the renderer cover long replies without holding every frame)
+DEFAULT_FRAME_BUDGET_MB = 1536
+# A case whose warm-up call alone takes this long is timed once more, not three times
+SLOW_CASE_SECONDS = 10.0
+
+WORDS = "नमस्ते मैं आपका अवतार हूँ hello how can I help you today".split()
+
+Case = Tuple[str, Optional[float], Callable[[], Callable[[], object]]]
+
+
+class SkipCase(Exception):
+    pass
+
+
+_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+def _run(coro):
+    # One loop for the whole run, so services holding loop-bound state keep working
+    global _loop
+    if _loop is None:
+        _loop = asyncio.new_event_loop()
+    return _loop.run_until_complete(coro)
+
+
+def synthetic_reply(seconds: float) -> Tuple[str, list]:
+    """Reply text and fake-engine word timings lasting `seconds`"""
+    from backend.config import settings
+    count = max(1, int(round(seconds / settings.TTS_FAKE_WORD_SECONDS)))
+    words = [WORDS[i % len(WORDS)] for i in range(count)]
+    timings = []
+    for i, word in enumerate(words):
+        start = i * settings.TTS_FAKE_WORD_SECONDS
+        timings.append({"word": word, "start": start, "end": start + settings.TTS_FAKE_WORD_SECONDS})
+    return " ".join(words), timings
+
+
+def synthetic_timeline(entries: int, seconds_per_entry: float = 0.08):
+    """Random viseme timeline with `entries` back-to-back entries"""
+    from backend.utils.viseme_timeline import VisemeTimeline
+    from backend.utils.constants import MOUTH_SHAPES
+    rng = np.random.default_rng(entries)
+    starts = np.arange(entries) * seconds_per_entry
+    ids = rng.integers(0, len(MOUTH_SHAPES), entries)
+    return VisemeTimeline.from_arrays(starts, starts + seconds_per_entry, ids, blend=0.03)
+
+
+class FrameLoop:
+    """`length` frames played from a shorter clip on repeat, without copying it"""
+
+    def __init__(self, frames: List[np.ndarray], length: int):
+        self.frames = frames
+        self.length = length
+
+    def __len__(self) -> int:
+        return self.length
+
+    def __getitem__(self, index: int) -> np.ndarray:
+        if not -self.length <= index < self.length:
+            raise IndexError(index)
+        return self.frames[index % self.length % len(self.frames)]
+
+
+class Inputs:
+    """Shared, lazily built services and per-duration inputs"""
+
+    def __init__(self, avatar_id: str = None, frame_budget_mb: float = DEFAULT_FRAME_BUDGET_MB):
+        from backend.config import settings
+        self.avatar_id = avatar_id or settings.DEFAULT_AVATAR
+        self.frame_budget_mb = frame_budget_mb
+        self._cache: Dict[tuple, object] = {}
+
+    def _get(self, key: tuple, build: Callable[[], object]):
+        if key not in self._cache:
+            self._cache[key] = build()
+        return self._cache[key]
+
+    def tts(self):
+        def build():
+            from backend.services.tts_service import TextToSpeechService
+            tts = TextToSpeechService(engine="fake")
+            tts.cache.enabled = False
+            return tts
+        return self._get(("tts",), build)
+
+    def viseme(self):
+        from backend.services.viseme_service import VisemeService
+        return self._get(("viseme",), VisemeService)
+
+    def lipsync(self, sprites: bool = False):
+        def build():
+            from backend.services.avatar_bundle import source_image
+            from backend.services.lipsync_service import LipSyncService
+            # Always start from the source image so results do not depend on a built bundle
+            service = LipSyncService(avatar_path=source_image(self.avatar_id))
+            if sprites:
+                service.sprites = service.render_sprites()
+            return service
+        return self._get(("lipsync", sprites), build)
+
+    def render(self):
+        def build():
+            from backend.services.avatar_service import AvatarRenderService
+            return AvatarRenderService(output_dir=tempfile.mkdtemp(prefix="avatar-bench-"))
+        return self._get(("render",), build)
+
+    def reply(self, seconds: float):
+        """(text, word timings, fake-engine audio, viseme timeline)"""
+        def build():
+            text, timings = synthetic_reply(seconds)
+            audio, _ = _run(self.tts()._fake_tts(text))
+            timeline = self.viseme().generate_visemes(timings)
+            return text, timings, audio, timeline
+        return self._get(("reply", seconds), build)
+
+    def check_frame_budget(self, seconds: float):
+        from backend.config import settings
+        needed = self.lipsync().avatar.nbytes * int(seconds * settings.VIDEO_FPS) / 1e6
+        if needed > self.frame_budget_mb:
+            raise SkipCase(f"frames need {needed:.0f} MB, budget {self.frame_budget_mb:.0f} MB")
+
+    def frames(self, seconds: float):
+        from backend.config import settings
+        return self._get(
+            ("frames", seconds),
+            lambda: self.lipsync().generate_frames(self.reply(seconds)[3], seconds, settings.VIDEO_FPS)
+        )
+
+    def frame_loop(self, seconds: float) -> FrameLoop:
+        """Frames for a `seconds` long video, looping the first second of lip-sync"""
+        from backend.config import settings
+        return FrameLoop(self.frames(1), int(seconds * settings.VIDEO_FPS))
+
+
+def build_cases(inputs: Inputs, durations: List[float]) -> List[Case]:
+    """(name, reply seconds or None, setup) triples; setup returns the timed callable"""
+    from backend.config import settings
+    fps = settings.VIDEO_FPS
+    cases: List[Case] = []
+
+    def frame_setup(sprites: bool):
+        def setup():
+            service = inputs.lipsync(sprites)
+            return lambda: service._render_frame(3, 1.0)
+        return setup
+
+    cases.append(("lipsync._render_frame", None, frame_setup(False)))
+    cases.append(("lipsync._render_frame[sprites]", None, frame_setup(True)))
+
+    # Timeline lookups, scaling with timeline length rather than reply length
+    for entries in (10, 100, 1_000, 10_000):
+        def scalar_setup(entries=entries):
+            timeline = synthetic_timeline(entries)
+            t = np.array([timeline.duration / 2])
+            return lambda: timeline.active(t)
+        cases.append((f"timeline.active[scalar,{entries}]", None, scalar_setup))
+
+    for seconds in durations:
+        def tts_setup(seconds=seconds):
+            text = inputs.reply(seconds)[0]
+            return lambda: _run(inputs.tts().synthesize(text))
+
+        def stt_setup(seconds=seconds):
+            from backend.services.stt_engines import create_stt_engine
+            engine = create_stt_engine("local")
+            audio = inputs.reply(seconds)[2]
+            pcm = audio.to_pcm16()
+            return lambda: engine.transcribe(pcm, audio.sample_rate)
+
+        def viseme_setup(seconds=seconds):
+            timings = inputs.reply(seconds)[1]
+            service = inputs.viseme()
+            return lambda: service.generate_visemes(timings)
+
+        def frames_active_setup(seconds=seconds):
+            timeline = inputs.reply(seconds)[3]
+            times = np.arange(int(seconds * fps)) / fps
+            return lambda: timeline.active(times)
+
+        def generate_frames_setup(seconds=seconds, sprites=False):
+            inputs.check_frame_budget(seconds)
+            timeline = inputs.reply(seconds)[3]
+            service = inputs.lipsync(sprites)
+            return lambda: service.generate_frames(timeline, seconds, fps)
+
+        def animate_setup(seconds=seconds):
+            inputs.check_frame_budget(seconds)
+            _, _, audio, timeline = inputs.reply(seconds)
+            service = inputs.lipsync()
+            return lambda: service.animate(audio, timeline, mode="hybrid", fps=fps)
+
+        def iter_frames_setup(seconds=seconds, mode="hybrid"):
+            # The streaming path: frames are consumed as produced, so any length fits
+            _, _, audio, timeline = inputs.reply(seconds)
+            service = inputs.lipsync()
+
+            def consume():
+                for _ in service.iter_frames(audio, timeline, mode=mode, fps=fps):
+                    pass
+            return consume
+
+        def render_setup(seconds=seconds):
+            import cv2  # noqa: F401  (skip cleanly when the renderer's deps are missing)
+            import moviepy  # noqa: F401
+            # Encoding cost depends on the length, not on which frames are shown
+            frames = inputs.frame_loop(seconds)
+            audio = inputs.reply(seconds)[2]
+            service = inputs.render()
+
+            def render():
+                path = _run(service.render_video(frames, audio, fps=fps))
+                if path is None:
+                    raise RuntimeError("render_video failed")
+                os.remove(path)
+            return render
+
+        def video_message_setup(seconds=seconds):
+            from backend.api.websocket import WebSocketManager
+            bitrate = int(settings.VIDEO_BITRATE.rstrip("k")) * 1000
+            video = np.random.default_rng(0).bytes(int(seconds * bitrate / 8))
+            return lambda: WebSocketManager._encode({
+                "type": "video_data", "video": base64.b64encode(video).decode(), "format": "mp4"
+            })
+
+        def timeline_message_setup(seconds=seconds):
+            from backend.api.websocket import WebSocketManager
+            timeline = inputs.reply(seconds)[3]
+            return lambda: WebSocketManager._encode({"type": "visemes", "visemes": timeline.to_list()})
+
+        cases += [
+            ("tts.synthesize[fake]", seconds, tts_setup),
+            ("stt.transcribe[local]", seconds, stt_setup),
+            ("viseme.generate_visemes", seconds, viseme_setup),
+            ("timeline.active[frames]", seconds, frames_active_setup),
+            ("lipsync.generate_frames", seconds, generate_frames_setup),
+            ("lipsync.generate_frames[sprites]", seconds, lambda seconds=seconds: generate_frames_setup(seconds, True)),
+            ("lipsync.animate[hybrid]", seconds, animate_setup),
+            ("lipsync.iter_frames[hybrid]", seconds, iter_frames_setup),
+            ("lipsync.iter_frames[phoneme]", seconds, lambda seconds=seconds: iter_frames_setup(seconds, "phoneme")),
+            ("render.render_video", seconds, render_setup),
+            ("encode.video_message", seconds, video_message_setup),
+            ("encode.timeline_message", seconds, timeline_message_setup),
+        ]
+    return cases
+
+
+def case_key(name: str, seconds: Optional[float]) -> str:
+    return name if seconds is None else f"{name}@{seconds:g}s"
+
+
+def measure(fn: Callable[[], object], min_time: float, max_repeats: int) -> dict:
+    """Median/min/max of repeated calls after one warm-up call"""
+    t0 = time.perf_counter()
+    fn()
+    if time.perf_counter() - t0 > SLOW_CASE_SECONDS:
+        max_repeats = 1
+    samples = []
+    deadline = time.perf_counter() + min_time
+    # Like timeit: collect between runs, never inside one
+    gc_was_enabled = gc.isenabled()
+    try:
+        while len(samples) < max_repeats and (len(samples) < 3 or time.perf_counter() < deadline):
+            gc.collect()
+            gc.disable()
+            t0 = time.perf_counter()
+            fn()
+            samples.append((time.perf_counter() - t0) * 1000)
+            gc.enable()
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+    return {
+        "median_ms": round(statistics.median(samples), 4),
+        "min_ms": round(min(samples), 4),
+        "max_ms": round(max(samples), 4),
+        "repeats": len(samples),
+    }
+
+
+def run(durations: List[float] = DURATIONS, pattern: str = "*", min_time: float = 0.5, max_repeats: int = 200,
+        avatar_id: str = None, frame_budget_mb: float = DEFAULT_FRAME_BUDGET_MB) -> dict:
+    from loguru import logger
+
+    inputs = Inputs(avatar_id, frame_budget_mb)
+    results = {}
+    for name, seconds, setup in build_cases(inputs, list(durations)):
+        key = case_key(name, seconds)
+        if not fnmatch.fnmatch(key, pattern):
+            continue
+        try:
+            fn = setup()
+        except ImportError as e:
+            results[key] = {"skipped": f"missing dependency: {e.name}"}
+            continue
+        except SkipCase as e:
+            results[key] = {"skipped": str(e)}
+            continue
+        except Exception as e:
+            results[key] = {"error": f"{type(e).__name__}: {e}"}
+            logger.error(f"{key}: setup failed: {results[key]['error']}")
+            continue
+        try:
+            result = measure(fn, min_time, max_repeats)
+        except Exception as e:
+            # Unlike a skip, a case that stops working fails the comparison
+            results[key] = {"error": f"{type(e).__name__}: {e}"}
+            logger.error(f"{key}: {results[key]['error']}")
+            continue
+        if seconds is not None:
+            # Per reply-second cost makes lengths comparable
+            result["ms_per_reply_second"] = round(result["median_ms"] / seconds, 4)
+        results[key] = result
+        del fn
+        logger.info(f"{key}: {result['median_ms']:.3f} ms")
+    return {
+        "meta": environment(),
+        "selection": {"only": pattern, "durations": [float(d) for d in durations]},
+        "results": results,
+    }
+
+
+def environment() -> dict:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = None
+    return {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "commit": commit or None,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "processor": platform.processor() or None,
+        "cpus": os.cpu_count(),
+    }
+
+
+def selected(key: str, selection: dict) -> bool:
+    """Whether a run with `selection` (its --only and --durations) covers case `key`"""
+    if not fnmatch.fnmatch(key, selection["only"]):
+        return False
+    if "@" not in key:
+        return True
+    return float(key.rsplit("@", 1)[1].rstrip("s")) in selection["durations"]
+
+
+def compare(current: dict, baseline: dict, threshold: float = DEFAULT_THRESHOLD) -> List[dict]:
+    """Per-case comparison of the fastest run, the statistic least disturbed by other load.
+
+    Cases that raised, and baseline cases this run should have covered but
+    did not produce, come back as failed rows.
+    """
+    rows = []
+    failed = {key: result["error"] for key, result in current["results"].items() if "error" in result}
+    selection = current.get("selection")
+    if selection:
+        for key in baseline["results"]:
+            if key not in current["results"] and selected(key, selection):
+                failed[key] = "missing from results"
+    for key, error in failed.items():
+        base = baseline["results"].get(key, {})
+        rows.append({
+            "case": key, "baseline_ms": base.get("min_ms"), "current_ms": None,
+            "ratio": None, "regressed": True, "error": error,
+        })
+
+    for key, result in current["results"].items():
+        base = baseline["results"].get(key)
+        if "min_ms" not in result or not base or "min_ms" not in base:
+            continue
+        name = key.split("@")[0]
+        limit = CASE_THRESHOLDS.get(name, threshold)
+        ratio = result["min_ms"] / base["min_ms"] if base["min_ms"] else float("inf")
+        rows.append({
+            "case": key,
+            "baseline_ms": base["min_ms"],
+            "current_ms": result["min_ms"],
+            "ratio": round(ratio, 3),
+            "regressed": ratio > 1 + limit and result["min_ms"] - base["min_ms"] > NOISE_FLOOR_MS,
+        })
+    return rows
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Offline microbenchmarks for the avatar pipeline stages")
+    parser.add_argument("--durations", type=float, nargs="+", default=list(DURATIONS), help="reply lengths in seconds")
+    parser.add_argument("--only", default="*", help="glob over case keys, e.g. 'lipsync.*'")
+    parser.add_argument("--min-time", type=float, default=0.5, help="seconds to spend per case")
+    parser.add_argument("--max-repeats", type=int, default=200)
+    parser.add_argument("--avatar", default=None, help="avatar id (default: settings.DEFAULT_AVATAR)")
+    parser.add_argument("--frame-budget-mb", type=float, default=DEFAULT_FRAME_BUDGET_MB,
+                        help="skip frame-producing cases whose frames would exceed this")
+    parser.add_argument("--output", help="write results JSON here")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="baseline JSON to compare against")
+    parser.add_argument("--save-baseline", action="store_true", help="overwrite the baseline with these results")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="allowed slowdown, e.g. 0.25 = 25%%")
+    args = parser.parse_args(argv)
+
+    current = run(args.durations, args.only, args.min_time, args.max_repeats, args.avatar, args.frame_budget_mb)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(current, f, indent=2)
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(args.baseline) or ".", exist_ok=True)
+        with open(args.baseline, "w") as f:
+            json.dump(current, f, indent=2)
+        print(f"Baseline written to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(json.dumps(current["results"], indent=2))
+        print(f"No baseline at {args.baseline}; run with --save-baseline to create one")
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    rows = compare(current, baseline, args.threshold)
+    for row in rows:
+        if "error" in row:
+            print(f"{row['case']:48s} FAILED ({row['error']})")
+            continue
+        flag = "REGRESSED" if row["regressed"] else ""
+        print(f"{row['case']:48s} {row['baseline_ms']:10.3f} -> {row['current_ms']:10.3f} ms  x{row['ratio']:<6.2f} {flag}")
+    for key, result in current["results"].items():
+        if "skipped" in result:
+            print(f"{key:48s} skipped ({result['skipped']})")
+    regressed = [row["case"] for row in rows if row["regressed"]]
+    if regressed:
+        print(f"{len(regressed)} case(s) failed or regressed beyond threshold")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,4 +1,6 @@
-# Viseme IDs (common standard, e.g., Azure viseme IDs)
+import numpy as np
+
+# Viseme IDs used throughout the pipeline (Azure IDs are remapped below)
 VISEME_MAP = {
     'sil': 0,
     'aa': 1,
@@ -18,25 +20,55 @@ VISEME_MAP = {
     'h': 15,
 }
 
-# Mouth shape parameters for each viseme ID (normalized)
-MOUTH_SHAPES = {
-    0: {'width': 0.2, 'height': 0.1, 'jaw': 0.0, 'round': 0.0},   # silence
-    1: {'width': 0.8, 'height': 0.7, 'jaw': 0.8, 'round': 0.2},   # aa
-    2: {'width': 0.5, 'height': 0.9, 'jaw': 0.3, 'round': 0.1},   # ii
-    3: {'width': 0.6, 'height': 0.4, 'jaw': 0.4, 'round': 0.9},   # uu
-    4: {'width': 0.7, 'height': 0.5, 'jaw': 0.5, 'round': 0.3},   # ee
-    5: {'width': 0.6, 'height': 0.5, 'jaw': 0.5, 'round': 0.7},   # oo
-    6: {'width': 0.5, 'height': 0.3, 'jaw': 0.3, 'round': 0.2},   # k
-    7: {'width': 0.5, 'height': 0.3, 'jaw': 0.3, 'round': 0.2},   # g
-    8: {'width': 0.4, 'height': 0.2, 'jaw': 0.2, 'round': 0.1},   # t
-    9: {'width': 0.4, 'height': 0.2, 'jaw': 0.2, 'round': 0.1},   # d
-    10: {'width': 0.4, 'height': 0.2, 'jaw': 0.2, 'round': 0.1},  # n
-    11: {'width': 0.4, 'height': 0.2, 'jaw': 0.2, 'round': 0.1},  # m
-    12: {'width': 0.3, 'height': 0.1, 'jaw': 0.1, 'round': 0.1},  # p
-    13: {'width': 0.3, 'height': 0.1, 'jaw': 0.1, 'round': 0.1},  # b
-    14: {'width': 0.4, 'height': 0.1, 'jaw': 0.1, 'round': 0.1},  # s
-    15: {'width': 0.5, 'height': 0.3, 'jaw': 0.3, 'round': 0.2},  # h
-}
+# Mouth shape table indexed by viseme ID (normalized; offsets in pixels).
+# This is the only copy: services look shapes up by ID, never by name.
+MOUTH_SHAPE_COLUMNS = ('width', 'height', 'jaw', 'round', 'x_offset', 'y_offset')
+MOUTH_SHAPES = np.array([
+    [0.2, 0.1, 0.0, 0.0, 0, 0],   # silence
+    [0.8, 0.7, 0.8, 0.2, 0, 0],   # aa
+    [0.5, 0.9, 0.3, 0.1, 5, -5],  # ii
+    [0.6, 0.4, 0.4, 0.9, 0, 5],   # uu
+    [0.7, 0.5, 0.5, 0.3, 0, -3],  # ee
+    [0.6, 0.5, 0.5, 0.7, 0, 2],   # oo
+    [0.5, 0.3, 0.3, 0.2, -2, 0],  # k
+    [0.5, 0.3, 0.3, 0.2, 2, 0],   # g
+    [0.4, 0.2, 0.2, 0.1, 3, 0],   # t
+    [0.4, 0.2, 0.2, 0.1, -2, 0],  # d
+    [0.4, 0.2, 0.2, 0.1, 0, 0],   # n
+    [0.4, 0.2, 0.2, 0.1, 0, 0],   # m
+    [0.3, 0.1, 0.1, 0.1, 0, 2],   # p
+    [0.3, 0.1, 0.1, 0.1, 0, 1],   # b
+    [0.4, 0.1, 0.1, 0.1, 0, 1],   # s
+    [0.5, 0.3, 0.3, 0.2, 0, 0],   # h
+], dtype=np.float32)
+
+VISEME_NAMES = sorted(VISEME_MAP, key=VISEME_MAP.get)
+
+# Azure Speech viseme IDs (0-21) to the IDs above
+AZURE_VISEME_MAP = [
+    0,   # silence
+    1,   # ae ax ah
+    1,   # aa
+    5,   # ao
+    4,   # ey eh uh
+    4,   # er
+    2,   # y iy ih ix
+    3,   # w uw
+    5,   # ow
+    1,   # aw
+    5,   # oy
+    1,   # ay
+    15,  # h
+    4,   # r
+    8,   # l
+    14,  # s z
+    14,  # sh ch jh zh
+    8,   # dh
+    12,  # f v
+    8,   # d t n th
+    6,   # k g ng
+    12,  # p b m
+]
 
 # Default avatar settings
 DEFAULT_AVATAR_SETTINGS = {
@@ -2,6 +2,8 @@ import base64
 import hashlib
 import os
 import json
+import io
+import wave
 from pathlib import Path
 from loguru import logger
 import numpy as np
@@ -13,9 +15,9 @@ def decode_base64_to_audio(base64_str: str) -> bytes:
     """Decode base64 string to audio bytes"""
     return base64.b64decode(base64_str)
 
-def get_cache_key(text: str, voice: str) -> str:
+def get_cache_key(text: str, voice: str, engine: str = "", language: str = "", fmt: str = "") -> str:
     """Generate a cache key for TTS"""
-    return hashlib.md5(f"{text}_{voice}".encode()).hexdigest()
+    return hashlib.sha256(f"{engine}|{language}|{voice}|{fmt}|{text}".encode()).hexdigest()
 
 def ensure_dir(path: str):
     """Ensure directory exists"""
@@ -31,11 +33,47 @@ def load_json(filepath):
     with open(filepath, 'r', encoding='utf-8') as f:
         return json.load(f)
 
-def bytes_to_ndarray(audio_bytes: bytes, sample_width=2, channels=1, sample_rate=16000):
-    """Convert audio bytes to numpy array (simplified)"""
-    import numpy as np
-    return np.frombuffer(audio_bytes, dtype=np.int16).reshape(-1, channels)
+def bytes_to_ndarray(audio_bytes: bytes, sample_width=2, channels=1, sample_rate=16000, is_float=False):
+    """Convert interleaved audio bytes to a (frames, channels) numpy array.
+
+    16-bit samples are returned as int16, 32-bit samples as float32 when
+    `is_float` is set and int32 otherwise. Trailing bytes that do not form a
+    whole frame are dropped.
+    """
+    if sample_width == 2:
+        dtype = np.int16
+    elif sample_width == 4:
+        dtype = np.float32 if is_float else np.int32
+    else:
+        raise ValueError(f"Unsupported sample width: {sample_width}")
+    frame_size = sample_width * channels
+    usable = len(audio_bytes) - len(audio_bytes) % frame_size
+    return np.frombuffer(audio_bytes[:usable], dtype=dtype).reshape(-1, channels)
+
+def ndarray_to_float32(audio_array: np.ndarray) -> np.ndarray:
+    """Scale integer PCM to float32 in [-1, 1]"""
+    if audio_array.dtype == np.float32:
+        return audio_array
+    if audio_array.dtype == np.int16:
+        return audio_array.astype(np.float32) / 32768.0
+    if audio_array.dtype == np.int32:
+        return (audio_array / 2147483648.0).astype(np.float32)
+    return audio_array.astype(np.float32)
+
+def float32_to_pcm16(audio_array: np.ndarray) -> bytes:
+    """Convert float32 samples in [-1, 1] to 16-bit PCM bytes"""
+    return (np.clip(audio_array, -1.0, 1.0) * 32767.0).astype(np.int16).tobytes()
 
 def ndarray_to_bytes(audio_array: np.ndarray):
     """Convert numpy array to bytes"""
-    return audio_array.tobytes()
\ No newline at end of file
+    return audio_array.tobytes()
+
+def pcm_to_wav(pcm: bytes, sample_rate=16000, channels=1, sample_width=2) -> bytes:
+    """Wrap raw PCM bytes in a WAV container"""
+    wav_io = io.BytesIO()
+    with wave.open(wav_io, 'wb') as wav_file:
+        wav_file.setnchannels(channels)
+        wav_file.setsampwidth(sample_width)
+        wav_file.setframerate(sample_rate)
+        wav_file.writeframes(pcm)
+    return wav_io.getvalue()
@@ -0,0 +1,339 @@
+import argparse
+import asyncio
+import base64
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+import uuid
+from typing import Dict, List, Optional
+
+import numpy as np
+
+TURN_TYPES = ("text", "audio", "llm_response")
+PERCENTILES = (50, 90, 95, 99)
+# The knee: throughput gains under this fraction, or p95 time-to-video this many
+# times the lightest level's
+KNEE_MIN_GAIN = 0.1
+KNEE_LATENCY_FACTOR = 2.0
+
+# Engines that need no network; the rest of the pipeline runs for real
+STUB_ENV = {
+    "TTS_ENGINE": "fake",
+    "STT_ENGINE": "local",
+    "STT_LOCAL_TRANSCRIPT": "load test utterance",
+    "WARMUP_ON_STARTUP": "false",
+}
+
+REPLY_WORDS = "नमस्ते मैं आपका अवतार हूँ आज मैं आपकी कैसे मदद कर सकता हूँ hello thanks for waiting".split()
+
+
+def parse_mix(mix: str) -> Dict[str, float]:
+    """'text:1,audio:1,llm_response:2' -> turn type weights"""
+    weights = {}
+    for part in mix.split(","):
+        kind, _, weight = part.partition(":")
+        kind = kind.strip()
+        if kind not in TURN_TYPES:
+            raise ValueError(f"unknown turn type '{kind}', expected one of {TURN_TYPES}")
+        weights[kind] = float(weight or 1)
+    return weights
+
+
+def tone_pcm16(seconds: float, sample_rate: int = 16000) -> bytes:
+    """A voiced-looking utterance for the local STT engine"""
+    t = np.arange(int(seconds * sample_rate)) / sample_rate
+    wave = 0.3 * np.sin(2 * np.pi * 220 * t) * (0.6 + 0.4 * np.sin(2 * np.pi * 3 * t))
+    return (wave * 32767).astype(np.int16).tobytes()
+
+
+class Schedule:
+    """What each simulated client sends and how long it waits between turns"""
+
+    def __init__(self, mix: Dict[str, float], think_time: float, reply_words: int, repeat_fraction: float,
+                 audio_seconds: float, turn_timeout: float, seed: int = 0):
+        self.kinds = list(mix)
+        self.weights = [mix[k] for k in self.kinds]
+        self.think_time = think_time
+        self.reply_words = reply_words
+        self.repeat_fraction = repeat_fraction
+        self.turn_timeout = turn_timeout
+        self.audio = base64.b64encode(tone_pcm16(audio_seconds)).decode()
+        self.rng = random.Random(seed)
+        self._replies = 0
+
+    def next_kind(self) -> str:
+        return self.rng.choices(self.kinds, self.weights)[0]
+
+    def think(self) -> float:
+        # Exponential gaps make arrivals Poisson rather than lock-stepped
+        return self.rng.expovariate(1 / self.think_time) if self.think_time > 0 else 0.0
+
+    def reply(self) -> str:
+        words = [REPLY_WORDS[i % len(REPLY_WORDS)] for i in range(self.reply_words)]
+        if self.rng.random() >= self.repeat_fraction:
+            # A unique tail keeps the TTS cache from answering
+            self._replies += 1
+            words.append(f"#{self._replies}")
+        return " ".join(words)
+
+
+class SimulatedClient:
+    def __init__(self, url: str, schedule: Schedule, deadline: float, results: List[dict]):
+        self.url = url
+        self.schedule = schedule
+        self.deadline = deadline
+        self.results = results
+        self.client_id = f"load-{uuid.uuid4().hex[:8]}"
+        self.ws = None
+
+    async def run(self):
+        from websockets import connect
+
+        while time.perf_counter() < self.deadline:
+            started = time.perf_counter()
+            try:
+                async with connect(f"{self.url}/ws/{self.client_id}", max_size=None, open_timeout=self.schedule.turn_timeout) as ws:
+                    self.ws = ws
+                    await self._expect({"connected"}, time.perf_counter() + self.schedule.turn_timeout)
+                    while time.perf_counter() < self.deadline:
+                        result = await self.turn(self.schedule.next_kind())
+                        self.results.append(result)
+                        if result["error"]:
+                            # A late reply could be credited to the next turn; start clean
+                            break
+                        await asyncio.sleep(min(self.schedule.think(), max(0.0, self.deadline - time.perf_counter())))
+            except Exception as e:
+                self.results.append({"kind": "connect", "error": f"{type(e).__name__}: {e}", "total": time.perf_counter() - started})
+                await asyncio.sleep(1.0)
+
+    async def turn(self, kind: str) -> dict:
+        """One exchange; times are seconds from the first message sent"""
+        result = {"kind": kind, "ttfb": None, "ttv": None, "total": None, "bytes": 0, "error": None}
+        t0 = time.perf_counter()
+        timeout_at = t0 + self.schedule.turn_timeout
+        try:
+            if kind == "text":
+                await self._send({"type": "text", "text": "hello"})
+                result["ttfb"] = await self._expect({"text_received"}, timeout_at, result) - t0
+                await self._expect({"llm_request"}, timeout_at, result)
+                await self._send({"type": "llm_response", "text": self.schedule.reply()})
+            elif kind == "audio":
+                await self._send({"type": "audio", "audio": self.schedule.audio})
+                result["ttfb"] = await self._expect({"text_recognized"}, timeout_at, result) - t0
+                await self._send({"type": "llm_response", "text": self.schedule.reply()})
+            else:
+                await self._send({"type": "llm_response", "text": self.schedule.reply()})
+
+            ready = await self._expect({"video_ready"}, timeout_at, result)
+            result["ttv"] = ready - t0
+            if result["ttfb"] is None:
+                result["ttfb"] = result["ttv"]
+            result["total"] = await self._expect({"video_data"}, timeout_at, result) - t0
+        except asyncio.TimeoutError:
+            result["error"] = "timeout"
+        except Exception as e:
+            result["error"] = f"{type(e).__name__}: {e}"
+        return result
+
+    async def _send(self, message: dict):
+        await self.ws.send(json.dumps(message))
+
+    async def _expect(self, types: set, timeout_at: float, result: dict = None) -> float:
+        """Receive until a message of one of `types`; returns its arrival time"""
+        while True:
+            raw = await asyncio.wait_for(self.ws.recv(), max(0.0, timeout_at - time.perf_counter()))
+            arrived = time.perf_counter()
+            if result is not None:
+                result["bytes"] += len(raw)
+            message = json.loads(raw)
+            if message.get("type") == "error":
+                raise RuntimeError(message.get("message", "server error"))
+            if message.get("type") in types:
+                return arrived
+
+
+def percentiles(values: List[float]) -> Dict[str, Optional[float]]:
+    if not values:
+        return {f"p{p}": None for p in PERCENTILES}
+    return {f"p{p}": round(float(v) * 1000, 1) for p, v in zip(PERCENTILES, np.percentile(values, PERCENTILES))}
+
+
+async def run_level(url: str, clients: int, duration: float, ramp: float, schedule: Schedule) -> dict:
+    """N clients for `duration` seconds (after a linear ramp-up); returns the level's report row"""
+    results: List[dict] = []
+    start = time.perf_counter()
+    deadline = start + ramp + duration
+
+    async def launch(i: int):
+        await asyncio.sleep(ramp * i / clients)
+        await SimulatedClient(url, schedule, deadline, results).run()
+
+    await asyncio.gather(*(launch(i) for i in range(clients)))
+    elapsed = time.perf_counter() - start
+
+    ok = [r for r in results if not r["error"] and r["kind"] != "connect"]
+    errors: Dict[str, int] = {}
+    for r in results:
+        if r["error"]:
+            reason = r["error"].split(":")[0]
+            errors[reason] = errors.get(reason, 0) + 1
+    return {
+        "clients": clients,
+        "turns": len(ok),
+        "errors": sum(errors.values()),
+        "error_kinds": errors,
+        "turns_per_second": round(len(ok) / elapsed, 3),
+        "mb_per_second": round(sum(r["bytes"] for r in results) / elapsed / 1e6, 3),
+        "ttfb_ms": percentiles([r["ttfb"] for r in ok]),
+        "ttv_ms": percentiles([r["ttv"] for r in ok]),
+        "by_kind": {
+            kind: {"turns": len(rows), "ttv_ms": percentiles([r["ttv"] for r in rows])}
+            for kind in TURN_TYPES
+            if (rows := [r for r in ok if r["kind"] == kind])
+        },
+        "seconds": round(elapsed, 2),
+    }
+
+
+def find_knee(levels: List[dict]) -> Optional[int]:
+    """Lowest concurrency past which adding clients stops paying off"""
+    usable = [l for l in levels if l["turns"]]
+    if len(usable) < 2:
+        return None
+    base_p95 = usable[0]["ttv_ms"]["p95"]
+    for prev, level in zip(usable, usable[1:]):
+        gain = level["turns_per_second"] / prev["turns_per_second"] - 1 if prev["turns_per_second"] else 0
+        if gain < KNEE_MIN_GAIN or level["ttv_ms"]["p95"] > KNEE_LATENCY_FACTOR * base_p95:
+            return prev["clients"]
+    return None
+
+
+class StubServer:
+    """Run the app under uvicorn with offline engines for the duration of a test"""
+
+    def __init__(self, port: int, workers: int = 1, env: Dict[str, str] = None):
+        self.port = port
+        self.workers = workers
+        self.workdir = tempfile.mkdtemp(prefix="avatar-load-")
+        self.env = {
+            **os.environ,
+            **STUB_ENV,
+            "DATABASE_URL": f"sqlite:///{os.path.join(self.workdir, 'sessions.db')}",
+            "OUTPUT_DIR": os.path.join(self.workdir, "outputs"),
+            "TTS_CACHE_DIR": os.path.join(self.workdir, "cache", "tts"),
+            "THUMBNAIL_CACHE_DIR": os.path.join(self.workdir, "cache", "thumbnails"),
+            "IDLE_CACHE_DIR": os.path.join(self.workdir, "cache", "idle"),
+            "LOG_FILE": os.path.join(self.workdir, "app.log"),
+            **(env or {}),
+        }
+        self.process: Optional[subprocess.Popen] = None
+
+    @property
+    def url(self) -> str:
+        return f"ws://127.0.0.1:{self.port}"
+
+    def __enter__(self):
+        self.log = open(os.path.join(self.workdir, "server.log"), "w")
+        self.process = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "backend.main:app", "--host", "127.0.0.1",
+             "--port", str(self.port), "--workers", str(self.workers), "--log-level", "warning"],
+            env=self.env, stdout=self.log, stderr=subprocess.STDOUT
+        )
+        deadline = time.time() + 60
+        while time.time() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"server exited with {self.process.returncode}; see {self.log.name}")
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{self.port}/health", timeout=1):
+                    return self
+            except OSError:
+                time.sleep(0.25)
+        self.__exit__()
+        raise RuntimeError("server did not become healthy within 60s")
+
+    def __exit__(self, *exc):
+        if self.process and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+        self.log.close()
+
+
+def print_report(levels: List[dict], knee: Optional[int]):
+    print(f"{'clients':>7} {'turns':>6} {'err':>4} {'turns/s':>8} {'MB/s':>6}  "
+          f"{'ttfb p50':>8} {'p95':>7} {'p99':>7}  {'ttv p50':>8} {'p95':>7} {'p99':>7}")
+    for l in levels:
+        f, v = l["ttfb_ms"], l["ttv_ms"]
+        cell = lambda x: f"{x:7.0f}" if x is not None else f"{'-':>7}"
+        print(f"{l['clients']:>7} {l['turns']:>6} {l['errors']:>4} {l['turns_per_second']:>8.2f} {l['mb_per_second']:>6.2f}  "
+              f"{cell(f['p50']):>8} {cell(f['p95'])} {cell(f['p99'])}  {cell(v['p50']):>8} {cell(v['p95'])} {cell(v['p99'])}")
+        if l["error_kinds"]:
+            print(f"{'':>7} errors: {l['error_kinds']}")
+    if knee is not None:
+        print(f"Knee at ~{knee} concurrent clients (latencies in ms)")
+    else:
+        print("No knee within the tested levels (latencies in ms)")
+
+
+async def run_levels(url: str, levels: List[int], duration: float, ramp: float, schedule: Schedule, cooldown: float) -> List[dict]:
+    from loguru import logger
+
+    rows = []
+    for clients in levels:
+        logger.info(f"Load level: {clients} clients for {duration}s")
+        rows.append(await run_level(url, clients, duration, ramp, schedule))
+        await asyncio.sleep(cooldown)
+    return rows
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="WebSocket load test with simulated avatar clients")
+    parser.add_argument("--url", help="ws://host:port of a running server; default spawns one with stub engines")
+    parser.add_argument("--port", type=int, default=8090, help="port for the spawned server")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers for the spawned server")
+    parser.add_argument("--levels", type=int, nargs="+", default=[1, 2, 4, 8, 16], help="concurrent clients per level")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds per level, after ramp-up")
+    parser.add_argument("--ramp", type=float, default=2.0, help="seconds to bring all clients of a level up")
+    parser.add_argument("--cooldown", type=float, default=2.0, help="pause between levels")
+    parser.add_argument("--mix", default="llm_response:2,audio:1,text:1", help="turn type weights")
+    parser.add_argument("--think-time", type=float, default=2.0, help="mean pause between a client's turns")
+    parser.add_argument("--reply-words", type=int, default=15, help="words per reply (fake TTS: 0.3 s each)")
+    parser.add_argument("--repeat-fraction", type=float, default=0.0, help="share of replies repeated, so TTS-cacheable")
+    parser.add_argument("--audio-seconds", type=float, default=1.5)
+    parser.add_argument("--turn-timeout", type=float, default=60.0)
+    parser.add_argument("--tts-latency", type=float, default=0.0, help="simulated TTS latency per sentence (spawned server)")
+    parser.add_argument("--stt-latency", type=float, default=0.0, help="simulated STT latency (spawned server)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the report as JSON here")
+    args = parser.parse_args(argv)
+
+    schedule = Schedule(parse_mix(args.mix), args.think_time, args.reply_words, args.repeat_fraction,
+                        args.audio_seconds, args.turn_timeout, args.seed)
+
+    def run_against(url: str) -> List[dict]:
+        return asyncio.run(run_levels(url, args.levels, args.duration, args.ramp, schedule, args.cooldown))
+
+    if args.url:
+        levels = run_against(args.url.rstrip("/"))
+    else:
+        env = {"TTS_FAKE_LATENCY": str(args.tts_latency), "STT_LOCAL_LATENCY": str(args.stt_latency)}
+        with StubServer(args.port, args.workers, env) as server:
+            levels = run_against(server.url)
+
+    knee = find_knee(levels)
+    print_report(levels, knee)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"args": vars(args), "levels": levels, "knee_clients": knee}, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
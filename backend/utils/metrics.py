@@ -0,0 +1,281 @@
+import math
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, List, Optional, Tuple
+
+# Latency buckets in seconds, from a cached viseme lookup up to a long render
+STAGE_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    # A gauge whose callback failed reads NaN, which the text format allows
+    if math.isnan(value):
+        return "NaN"
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class _Timer:
+    __slots__ = ("child", "start")
+
+    def __init__(self, child: "_HistogramChild"):
+        self.child = child
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.child.observe(time.perf_counter() - self.start)
+        return False
+
+
+class _CounterChild:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0):
+        self.value += amount
+
+
+class _GaugeChild:
+    __slots__ = ("value", "function")
+
+    def __init__(self):
+        self.value = 0.0
+        self.function: Optional[Callable[[], float]] = None
+
+    def set(self, value: float):
+        self.value = value
+
+    def inc(self, amount: float = 1.0):
+        self.value += amount
+
+    def dec(self, amount: float = 1.0):
+        self.value -= amount
+
+    def set_function(self, function: Callable[[], float]):
+        """Read the value from `function` at scrape time instead"""
+        self.function = function
+
+    def get(self) -> float:
+        if self.function is None:
+            return self.value
+        try:
+            return float(self.function())
+        except Exception:
+            return math.nan
+
+
+class _HistogramChild:
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        self.bounds = bounds
+        # Per-bucket (not cumulative) counts; the last slot is +Inf
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def time(self) -> _Timer:
+        return _Timer(self)
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Estimate from the buckets, interpolating linearly like histogram_quantile()"""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            if seen + n >= rank and n:
+                lower = self.bounds[i - 1] if i else 0.0
+                if i == len(self.bounds):
+                    return lower
+                return lower + (self.bounds[i] - lower) * (rank - seen) / n
+            seen += n
+        return self.bounds[-1]
+
+
+class Metric:
+    """A named metric family; `labels(...)` returns the child holding values.
+
+    Children are cached per label tuple, so the hot path is one dict lookup
+    plus an attribute update. Updates are not locked: they happen on the
+    event loop or, for a few counters, from worker threads where a lost
+    increment under contention is acceptable for monitoring.
+    """
+
+    kind = "untyped"
+    child_class = None
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+
+    def _new_child(self):
+        return self.child_class()
+
+    def labels(self, *values):
+        key = tuple(str(v) for v in values)
+        child = self._children.get(key)
+        if child is None:
+            if len(key) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}, got {key}")
+            child = self._children[key] = self._new_child()
+        return child
+
+    def children(self) -> List[tuple]:
+        return list(self._children.items())
+
+
+class Counter(Metric):
+    kind = "counter"
+    child_class = _CounterChild
+
+    def inc(self, amount: float = 1.0):
+        self.labels().inc(amount)
+
+    def samples(self) -> List[tuple]:
+        return [(self.name + "_total", key, "", child.value) for key, child in self.children()]
+
+
+class Gauge(Metric):
+    kind = "gauge"
+    child_class = _GaugeChild
+
+    def set(self, value: float):
+        self.labels().set(value)
+
+    def set_function(self, function: Callable[[], float]):
+        self.labels().set_function(function)
+
+    def samples(self) -> List[tuple]:
+        return [(self.name, key, "", child.get()) for key, child in self.children()]
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (), buckets: Tuple[float, ...] = STAGE_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+    def time(self, *values) -> _Timer:
+        """Context manager observing the elapsed time under the given labels"""
+        return self.labels(*values).time()
+
+    def samples(self) -> List[tuple]:
+        samples = []
+        for key, child in self.children():
+            cumulative = 0
+            for bound, n in zip(self.buckets + (math.inf,), child.counts):
+                cumulative += n
+                samples.append((self.name + "_bucket", key, f'le="{_format_value(bound)}"', cumulative))
+            samples.append((self.name + "_sum", key, "", child.sum))
+            samples.append((self.name + "_count", key, "", child.count))
+        return samples
+
+
+class MetricsRegistry:
+    def __init__(self, namespace: str = ""):
+        self.namespace = namespace
+        self._metrics: Dict[str, Metric] = {}
+
+    def _register(self, metric: Metric) -> Metric:
+        if self.namespace:
+            metric.name = f"{self.namespace}_{metric.name}"
+        existing = self._metrics.get(metric.name)
+        if existing is not None:
+            return existing
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (), buckets: Tuple[float, ...] = STAGE_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        """Prometheus text exposition format (version 0.0.4)"""
+        lines = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, key, extra, value in metric.samples():
+                lines.append(f"{name}{_format_labels(metric.labelnames, key, extra)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self) -> dict:
+        """JSON-friendly view for the dashboard; histograms reduced to count/mean/p50/p95/p99"""
+        snapshot = {}
+        for metric in self._metrics.values():
+            series = {}
+            for key, child in metric.children():
+                label = ",".join(key) or "_"
+                if isinstance(child, _HistogramChild):
+                    series[label] = {
+                        "count": child.count,
+                        "mean": child.sum / child.count if child.count else None,
+                        "p50": child.quantile(0.5),
+                        "p95": child.quantile(0.95),
+                        "p99": child.quantile(0.99),
+                    }
+                elif isinstance(child, _GaugeChild):
+                    value = child.get()
+                    series[label] = None if math.isnan(value) else value
+                else:
+                    series[label] = child.value
+            snapshot[metric.name] = series
+        return snapshot
+
+
+metrics = MetricsRegistry(namespace="avatar")
+
+# Pipeline instruments shared by the services; see /metrics
+STAGE_SECONDS = metrics.histogram(
+    "stage_seconds", "Time spent per pipeline stage", ("stage",)
+)
+FRAMES = metrics.counter("frames", "Video frames produced", ("stage",))
+FRAMES_PER_SECOND = metrics.gauge(
+    "frames_per_second", "Frame generation throughput of the latest run", ("stage",)
+)
+BYTES_OUT = metrics.counter("bytes_out", "Bytes sent to clients", ("channel",))
+MESSAGES_OUT = metrics.counter("messages_out", "WebSocket messages sent", ("type",))
+CACHE_REQUESTS = metrics.counter("cache_requests", "Cache lookups by result", ("cache", "result"))
+CACHE_HIT_RATIO = metrics.gauge("cache_hit_ratio", "Fraction of lookups served from cache", ("cache",))
+QUEUE_DEPTH = metrics.gauge("queue_depth", "Items waiting in internal queues", ("queue",))
+ACTIVE_SESSIONS = metrics.gauge("active_sessions", "Connected WebSocket sessions")
+ERRORS = metrics.counter("errors", "Pipeline failures", ("stage",))
+BATCH_ITEMS = metrics.counter("batch_items", "Batch render items finished, by outcome", ("outcome",))
+STREAM_FRAMES = metrics.counter("stream_frames", "Live video frame slots by outcome", ("outcome",))
+STREAM_JITTER = metrics.histogram(
+    "stream_jitter_seconds", "Lateness of live video frames against their slot",
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.02, 0.035, 0.05, 0.1, 0.25)
+)
@@ -0,0 +1,176 @@
+import importlib
+import json
+import os
+import subprocess
+import sys
+import time
+from loguru import logger
+from typing import Any, Dict, Iterable, List, Union
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Modules worth watching when sizing workers
+HEAVY_MODULES = [
+    "backend.main",
+    "cv2",
+    "moviepy",
+    "azure.cognitiveservices.speech",
+    "gtts",
+    "speech_recognition",
+    "aiortc",
+    "av",
+]
+
+
+def _rss_mb() -> float:
+    if resource is None:
+        return 0.0
+    # ru_maxrss is KiB on Linux and bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+
+class StartupReport:
+    """Wall time and peak-RSS growth of startup stages and lazy imports"""
+
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self.base_rss_mb = _rss_mb()
+        self.stages: Dict[str, dict] = {}
+        self.imports: Dict[str, dict] = {}
+        self.ready_seconds = None
+
+    def finish(self):
+        """Mark the process ready to serve; timed from when this module was imported"""
+        self.ready_seconds = round(time.perf_counter() - self.started_at, 3)
+
+    def stage(self, name: str) -> "_Measure":
+        return _Measure(self.stages, name)
+
+    def record_import(self, name: str) -> "_Measure":
+        return _Measure(self.imports, name)
+
+    def as_dict(self) -> dict:
+        return {
+            "ready_seconds": self.ready_seconds,
+            "rss_mb": round(_rss_mb(), 1),
+            "rss_growth_mb": round(_rss_mb() - self.base_rss_mb, 1),
+            "stages": self.stages,
+            "imports": self.imports,
+        }
+
+    def log(self):
+        logger.info(f"Startup ready in {self.ready_seconds}s, peak RSS {_rss_mb():.0f} MB")
+        for kind, entries in (("stage", self.stages), ("import", self.imports)):
+            for name, cost in sorted(entries.items(), key=lambda item: -item[1]["seconds"]):
+                logger.info(f"Startup {kind} {name}: {cost['seconds']:.3f}s, +{cost['rss_mb']:.1f} MB")
+
+
+class _Measure:
+    def __init__(self, target: Dict[str, dict], name: str):
+        self.target = target
+        self.name = name
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        self.rss0 = _rss_mb()
+        return self
+
+    def __exit__(self, *exc):
+        self.target[self.name] = {
+            "seconds": round(time.perf_counter() - self.t0, 4),
+            "rss_mb": round(_rss_mb() - self.rss0, 1),
+        }
+        return False
+
+
+# Process-wide report: registries record their imports here and main.py its stages
+startup_report = StartupReport()
+
+
+class LazyRegistry:
+    """Name -> implementation map that imports an implementation on first use.
+
+    Entries are either objects or "package.module:attribute" strings; a string
+    entry costs nothing until `load()` resolves it, so a worker only imports
+    the backends its settings select.
+    """
+
+    def __init__(self, kind: str, entries: Dict[str, Union[str, Any]] = None):
+        self.kind = kind
+        self._entries: Dict[str, Union[str, Any]] = dict(entries or {})
+        self._loaded: Dict[str, Any] = {}
+
+    def register(self, name: str, target: Union[str, Any]):
+        self._entries[name] = target
+        self._loaded.pop(name, None)
+
+    def names(self) -> Iterable[str]:
+        return list(self._entries)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._entries
+
+    def get(self, name: str, default: Any = None) -> Any:
+        if name not in self._entries:
+            return default
+        return self.load(name)
+
+    def load(self, name: str) -> Any:
+        if name in self._loaded:
+            return self._loaded[name]
+        if name not in self._entries:
+            raise KeyError(f"Unknown {self.kind} '{name}' (available: {', '.join(self._entries)})")
+
+        target = self._entries[name]
+        if isinstance(target, str):
+            module_name, _, attr = target.partition(":")
+            with startup_report.record_import(f"{self.kind}:{name}"):
+                module = importlib.import_module(module_name)
+            target = getattr(module, attr) if attr else module
+            logger.debug(f"Loaded {self.kind} '{name}' from {self._entries[name]}")
+        self._loaded[name] = target
+        return target
+
+    def create(self, name: str, *args, **kwargs) -> Any:
+        return self.load(name)(*args, **kwargs)
+
+
+_PROBE = """
+import json, sys, time
+sys.path.insert(0, {cwd!r})
+from backend.utils.registry import _rss_mb
+base = _rss_mb()
+t0 = time.perf_counter()
+try:
+    import {module}
+    error = None
+except Exception as e:
+    error = f"{{type(e).__name__}}: {{e}}"
+print(json.dumps({{"seconds": time.perf_counter() - t0, "rss_mb": _rss_mb() - base, "error": error}}))
+"""
+
+
+def measure_import_costs(modules: List[str] = None) -> Dict[str, dict]:
+    """Import each module in a fresh interpreter and report its time and RSS cost"""
+    costs = {}
+    for module in modules or HEAVY_MODULES:
+        probe = _PROBE.format(cwd=os.getcwd(), module=module)
+        result = subprocess.run([sys.executable, "-c", probe], capture_output=True, text=True)
+        try:
+            costs[module] = json.loads(result.stdout.strip().splitlines()[-1])
+        except (IndexError, ValueError):
+            costs[module] = {"seconds": None, "rss_mb": None, "error": result.stderr.strip()[-200:]}
+    return costs
+
+
+if __name__ == "__main__":
+    # python -m backend.utils.registry [module ...]
+    for module, cost in measure_import_costs(sys.argv[1:] or None).items():
+        if cost["error"]:
+            print(f"{module:40s} not importable ({cost['error']})")
+        else:
+            print(f"{module:40s} {cost['seconds']:7.3f}s  +{cost['rss_mb']:7.1f} MB")
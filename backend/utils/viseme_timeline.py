@@ -0,0 +1,158 @@
+import struct
+import numpy as np
+from typing import Dict, List, Optional, Tuple, Union
+
+from backend.utils.constants import VISEME_MAP, VISEME_NAMES, AZURE_VISEME_MAP, MOUTH_SHAPES
+
+TIMELINE_DTYPE = np.dtype([('start', '<f4'), ('end', '<f4'), ('id', 'u1'), ('blend', '<f4')])
+TIMELINE_MAGIC = b"VTL1"
+SILENCE_ID = VISEME_MAP['sil']
+
+# Older names some producers still emit
+VISEME_ALIASES = {'silence': 'sil', 'e': 'ee', 'o': 'oo'}
+VISEME_LABELS = ['viseme_silence' if name == 'sil' else f"viseme_{name}" for name in VISEME_NAMES]
+
+
+def viseme_id(name: Union[str, int]) -> int:
+    """Resolve 'viseme_aa', 'aa' or an Azure 'viseme_{n}' name to a viseme ID"""
+    if isinstance(name, (int, np.integer)):
+        return int(name)
+    key = name[len("viseme_"):] if name.startswith("viseme_") else name
+    if key.isdigit():
+        azure_id = int(key)
+        return AZURE_VISEME_MAP[azure_id] if azure_id < len(AZURE_VISEME_MAP) else SILENCE_ID
+    return VISEME_MAP.get(VISEME_ALIASES.get(key, key), SILENCE_ID)
+
+
+class VisemeTimeline:
+    """Viseme track stored as one structured array with start/end/id/blend columns.
+
+    Entries are kept sorted by start time. Shapes are not stored: consumers
+    index MOUTH_SHAPES with the `id` column.
+    """
+
+    def __init__(self, entries: Optional[np.ndarray] = None):
+        if entries is None:
+            entries = np.zeros(0, dtype=TIMELINE_DTYPE)
+        entries = np.asarray(entries, dtype=TIMELINE_DTYPE)
+        self.entries = np.sort(entries, order='start', kind='stable')
+        # Plain columns for active(), built on first lookup
+        self._lookup: Optional[Tuple[np.ndarray, ...]] = None
+
+    @classmethod
+    def from_arrays(cls, start, end, ids, blend=0.1) -> "VisemeTimeline":
+        entries = np.zeros(len(start), dtype=TIMELINE_DTYPE)
+        entries['start'] = start
+        entries['end'] = end
+        entries['id'] = ids
+        entries['blend'] = blend
+        return cls(entries)
+
+    @classmethod
+    def from_events(cls, events: List[Dict], default_duration: float = 0.1) -> "VisemeTimeline":
+        """Build from engine viseme events (`viseme`, `start`, optional `end`/`duration`/`blend`).
+
+        Events without an end last until the next event starts, which is how
+        Azure reports them.
+        """
+        events = sorted(events, key=lambda e: e.get('start', 0))
+        start = np.array([e.get('start', 0) for e in events], dtype=np.float32)
+        end = np.empty_like(start)
+        for i, event in enumerate(events):
+            if 'end' in event:
+                end[i] = event['end']
+            elif i + 1 < len(events):
+                end[i] = start[i + 1]
+            else:
+                end[i] = start[i] + event.get('duration', default_duration)
+        ids = [viseme_id(e.get('viseme', 'sil')) for e in events]
+        blend = [e.get('blend', 0.1) for e in events]
+        return cls.from_arrays(start, end, ids, blend)
+
+    @classmethod
+    def concat(cls, timelines: List["VisemeTimeline"]) -> "VisemeTimeline":
+        return cls(np.concatenate([t.entries for t in timelines]) if timelines else None)
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    @property
+    def start(self) -> np.ndarray:
+        return self.entries['start']
+
+    @property
+    def end(self) -> np.ndarray:
+        return self.entries['end']
+
+    @property
+    def ids(self) -> np.ndarray:
+        return self.entries['id']
+
+    @property
+    def blend(self) -> np.ndarray:
+        return self.entries['blend']
+
+    @property
+    def duration(self) -> float:
+        return float(self.entries['end'].max()) if len(self.entries) else 0.0
+
+    def active(self, times: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Viseme ID and blend weight active at each time.
+
+        Blend ramps in and out over each entry's `blend` seconds; where
+        entries overlap, nested ones included, the strongest entry covering
+        the time wins, and gaps are silence.
+        """
+        times = np.asarray(times, dtype=np.float32)
+        ids = np.full(len(times), SILENCE_ID, dtype=np.uint8)
+        weights = np.ones(len(times), dtype=np.float32)
+        if not len(self.entries):
+            return ids, weights
+
+        if self._lookup is None:
+            start, end = self.start.copy(), self.end.copy()
+            # Short entries ramp over half their span so they still peak at 1
+            ramp = np.maximum(np.minimum(self.blend, (end - start) / 2), 1e-6)
+            # reach[i]: the latest end among entries 0..i
+            self._lookup = (start, end, self.ids.copy(), ramp, np.maximum.accumulate(end))
+        start, end, entry_ids, ramp, reach = self._lookup
+
+        # Walk back from the latest-starting entry while some earlier entry
+        # still reaches the time; for back-to-back entries that is one or two steps
+        candidate = np.searchsorted(start, times, side='right') - 1
+        best = np.full(len(times), -1.0, dtype=np.float32)
+        pending = np.flatnonzero(candidate >= 0)
+        while len(pending):
+            t, c = times[pending], candidate[pending]
+            weight = np.minimum(np.minimum(t - start[c], end[c] - t) / ramp[c], 1.0)
+            covered = (t >= start[c]) & (t <= end[c]) & (weight > best[pending])
+            best[pending[covered]] = weight[covered]
+            ids[pending[covered]] = entry_ids[c[covered]]
+            c -= 1
+            candidate[pending] = c
+            pending = pending[(c >= 0) & (reach[np.maximum(c, 0)] >= t)]
+        return ids, np.where(best >= 0, best, 1.0).astype(np.float32)
+
+    def shape_curves(self, times: np.ndarray, columns: int = 4) -> np.ndarray:
+        """Blended (n, columns) mouth-shape parameters, easing from silence"""
+        ids, weights = self.active(times)
+        silence = MOUTH_SHAPES[SILENCE_ID, :columns]
+        return silence + (MOUTH_SHAPES[ids, :columns] - silence) * weights[:, None]
+
+    def to_bytes(self) -> bytes:
+        """Compact binary form: magic, entry count, then packed little-endian rows"""
+        return TIMELINE_MAGIC + struct.pack("<I", len(self.entries)) + self.entries.tobytes()
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "VisemeTimeline":
+        if data[:4] != TIMELINE_MAGIC:
+            raise ValueError("Not a viseme timeline")
+        (count,) = struct.unpack_from("<I", data, 4)
+        return cls(np.frombuffer(data, dtype=TIMELINE_DTYPE, count=count, offset=8).copy())
+
+    def to_list(self) -> List[Dict]:
+        """JSON-friendly rows for clients"""
+        return [
+            {'viseme': VISEME_LABELS[i], 'id': int(i), 'start': float(s), 'end': float(e), 'blend': float(b)}
+            for s, e, i, b in self.entries.tolist()
+        ]
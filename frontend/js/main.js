@@ -0,0 +1,140 @@
+// Video call page: the avatar speaks typed messages, live over WebRTC once a call is started
+
+const sessionId = 'web-' + Math.random().toString(36).substring(2, 10);
+// Open the page with ?broadcast=<id> to watch a broadcast instead of a private call
+const broadcastId = new URLSearchParams(location.search).get('broadcast');
+let ws = null;
+let mediaRecorder = null;
+let recordedChunks = [];
+
+function connectWebSocket() {
+    const scheme = location.protocol === 'https:' ? 'wss' : 'ws';
+    ws = new WebSocket(`${scheme}://${location.host}/ws/${sessionId}`);
+    ws.onopen = () => setStatus('Connected');
+    ws.onclose = () => {
+        setStatus('Disconnected');
+        setTimeout(connectWebSocket, 2000);
+    };
+    ws.onmessage = async (event) => {
+        const message = JSON.parse(event.data);
+        if (await handleLiveAvatarMessage(message)) return;
+        handleMessage(message);
+    };
+}
+
+function handleMessage(message) {
+    switch (message.type) {
+        case 'live_started':
+            setAvatarStatus(`Speaking (first frame ${message.first_frame_ms} ms)`);
+            break;
+        case 'live_finished':
+            setAvatarStatus('Listening');
+            break;
+        case 'video_data':
+            // No call running: the reply comes back as a file
+            playVideoFile(message.video, message.format);
+            break;
+        case 'avatar_selected':
+            setAvatarStatus(message.message);
+            break;
+        case 'error':
+            addChatMessage('Error', message.message);
+            break;
+    }
+}
+
+async function startCall() {
+    if (broadcastId) {
+        await joinBroadcast(ws, broadcastId, remoteVideo());
+    } else {
+        await startLiveAvatar(ws, remoteVideo());
+    }
+    document.getElementById('startBtn').disabled = true;
+    document.getElementById('stopBtn').disabled = false;
+    setAvatarStatus('Live');
+}
+
+function stopCall() {
+    stopLiveAvatar(ws);
+    remoteVideo().srcObject = null;
+    document.getElementById('startBtn').disabled = false;
+    document.getElementById('stopBtn').disabled = true;
+    setAvatarStatus('');
+}
+
+function sendMessage() {
+    const input = document.getElementById('messageInput');
+    const text = input.value.trim();
+    if (!text || !ws || ws.readyState !== WebSocket.OPEN) return;
+    ws.send(JSON.stringify({ type: 'llm_response', text, session_id: sessionId }));
+    addChatMessage('You', text);
+    input.value = '';
+}
+
+function selectAvatar() {
+    const avatarId = document.getElementById('avatarSelect').value;
+    ws.send(JSON.stringify({ type: 'select_avatar', avatar_id: avatarId, session_id: sessionId }));
+}
+
+function toggleRecording() {
+    const button = document.getElementById('recordBtn');
+    if (mediaRecorder && mediaRecorder.state === 'recording') {
+        mediaRecorder.stop();
+        button.textContent = 'Start Recording';
+        return;
+    }
+    const stream = remoteVideo().srcObject;
+    if (!stream) {
+        addChatMessage('System', 'Start a call to record the avatar');
+        return;
+    }
+    recordedChunks = [];
+    mediaRecorder = new MediaRecorder(stream);
+    mediaRecorder.ondataavailable = (event) => recordedChunks.push(event.data);
+    mediaRecorder.start();
+    button.textContent = 'Stop Recording';
+}
+
+function downloadVideo() {
+    if (!recordedChunks.length) return;
+    const link = document.createElement('a');
+    link.href = URL.createObjectURL(new Blob(recordedChunks, { type: 'video/webm' }));
+    link.download = `${sessionId}.webm`;
+    link.click();
+}
+
+function playVideoFile(base64, format) {
+    const bytes = Uint8Array.from(atob(base64), (c) => c.charCodeAt(0));
+    const video = remoteVideo();
+    video.srcObject = null;
+    video.src = URL.createObjectURL(new Blob([bytes], { type: `video/${format}` }));
+    video.play();
+}
+
+function remoteVideo() {
+    return document.getElementById('remoteVideo');
+}
+
+function setStatus(text) {
+    document.getElementById('statusText').textContent = text;
+}
+
+function setAvatarStatus(text) {
+    document.getElementById('avatarStatus').textContent = text;
+}
+
+function addChatMessage(sender, text) {
+    const messages = document.getElementById('chatMessages');
+    const line = document.createElement('div');
+    line.textContent = `${sender}: ${text}`;
+    messages.appendChild(line);
+    messages.scrollTop = messages.scrollHeight;
+}
+
+window.onload = () => {
+    document.getElementById('sessionId').textContent = sessionId;
+    document.getElementById('messageInput').addEventListener('keypress', (e) => {
+        if (e.key === 'Enter') sendMessage();
+    });
+    connectWebSocket();
+};
@@ -0,0 +1,54 @@
+// Live avatar over WebRTC, signaled on the app WebSocket
+
+let avatarPeer = null;
+
+function createAvatarPeer(socket, videoElement, extra) {
+    const pc = new RTCPeerConnection({ iceServers: [{ urls: 'stun:stun.l.google.com:19302' }] });
+    pc.addTransceiver('video', { direction: 'recvonly' });
+    pc.addTransceiver('audio', { direction: 'recvonly' });
+
+    const stream = new MediaStream();
+    videoElement.srcObject = stream;
+    pc.ontrack = (event) => stream.addTrack(event.track);
+    pc.onicecandidate = (event) => {
+        if (event.candidate) {
+            socket.send(JSON.stringify({ type: 'rtc_ice', candidate: event.candidate.toJSON(), ...extra }));
+        }
+    };
+    return pc;
+}
+
+// Offer to receive the avatar's audio and video; replies then arrive live
+// on `videoElement` instead of as video_data messages
+async function startLiveAvatar(socket, videoElement) {
+    stopLiveAvatar(socket);
+    const pc = avatarPeer = createAvatarPeer(socket, videoElement, {});
+    await pc.setLocalDescription(await pc.createOffer());
+    socket.send(JSON.stringify({ type: 'rtc_offer', sdp: pc.localDescription.sdp }));
+    return pc;
+}
+
+// Watch a broadcast (one avatar, many viewers); video starts at the next keyframe
+async function joinBroadcast(socket, broadcastId, videoElement) {
+    stopLiveAvatar(socket);
+    const pc = avatarPeer = createAvatarPeer(socket, videoElement, { broadcast_id: broadcastId });
+    await pc.setLocalDescription(await pc.createOffer());
+    socket.send(JSON.stringify({ type: 'broadcast_join', broadcast_id: broadcastId, sdp: pc.localDescription.sdp }));
+    return pc;
+}
+
+// Call from the WebSocket onmessage handler; returns true if it was ours
+async function handleLiveAvatarMessage(message) {
+    if (!['rtc_answer', 'broadcast_joined'].includes(message.type) || !avatarPeer || !message.sdp) return false;
+    await avatarPeer.setRemoteDescription({ type: message.sdp_type, sdp: message.sdp });
+    return true;
+}
+
+function stopLiveAvatar(socket) {
+    if (!avatarPeer) return;
+    avatarPeer.close();
+    avatarPeer = null;
+    if (socket && socket.readyState === WebSocket.OPEN) {
+        socket.send(JSON.stringify({ type: 'rtc_close' }));
+    }
+}
@@ -0,0 +1,50 @@
+import asyncio
+
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from backend.models.avatar_model import AvatarSession, SessionTurn
+from backend.services.session_store import SessionStore
+
+
+async def _counts(database_url):
+    engine = create_async_engine(database_url)
+    try:
+        async with engine.connect() as conn:
+            return tuple([
+                (await conn.execute(select(func.count()).select_from(table))).scalar()
+                for table in (AvatarSession.__table__, SessionTurn.__table__)
+            ])
+    finally:
+        await engine.dispose()
+
+
+def test_stop_flushes_the_batch_being_collected(tmp_path):
+    async def scenario():
+        store = SessionStore(f"sqlite:///{tmp_path / 'sessions.db'}", flush_interval=5.0)
+        await store.start()
+        store.session_started("s1", avatar_id="casual/model_v1")
+        # Let the writer take the first event and start waiting out the flush interval
+        await asyncio.sleep(0.05)
+        store.record_turn("s1", text_length=5)
+        store.session_ended("s1")
+        await store.stop()
+        return store.stats(), await _counts(store.database_url)
+
+    stats, counts = asyncio.run(scenario())
+    assert counts == (1, 1)
+    assert stats["written"] == 3
+    assert stats["dropped"] == 0
+
+
+def test_events_after_stop_are_ignored(tmp_path):
+    async def scenario():
+        store = SessionStore(f"sqlite:///{tmp_path / 'sessions.db'}")
+        await store.start()
+        await store.stop()
+        store.session_started("late")
+        return store.stats()
+
+    stats = asyncio.run(scenario())
+    assert stats["queued"] == 0
+    assert stats["written"] == 0